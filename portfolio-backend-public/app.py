@@ -1,8 +1,10 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import Flask, request, jsonify, Blueprint, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import json
+import asyncio
+import contextlib
 from models import (
     ChatRequest,
     ContactForm,
@@ -12,6 +14,7 @@ from models import (
     OTPRequest,
     EndorsementCreate,
     EndorsementDelete,
+    EndorsementPageQuery,
 )
 from mongo import (
     log_conversation,
@@ -20,17 +23,51 @@ from mongo import (
     generate_otp,
     store_otp,
     verify_otp,
-    cleanup_expired_otps,
     create_endorsement,
     get_all_endorsements,
     get_endorsements_by_skill,
+    get_endorsements_page,
+    count_endorsements_by_skill,
     delete_endorsement,
     get_endorsement_by_id,
     get_metrics_data,
+    get_recent_messages,
+    get_messages_range,
+    get_summary_state,
+    store_summary,
     log_api_call,
+    record_email_delivery,
+    chat_writes,
+    RUNNING_TESTS,
+)
+from llm import (
+    router,
+    hedged_calls,
+    get_context_prompt,
+    get_prompt_version,
+    get_context_budget,
+    get_rate_limiter,
+    prompt_registry,
+)
+from metrics_collector import MetricsCollector
+from content_cache import ContentCache
+from event_loop import EventLoopRunner
+from mailer import Mailer, SMTPPool
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from conversation_history import ConversationHistory
+from conversation_summary import ConversationSummaries
+from write_queue import WriteQueue
+from context_budget import fit_to_budget, count_prompt_tokens
+from rate_limiter import RateLimitExceeded
+from skill_registry import get_skill_name_by_id, skill_exists
+from chat_stream import (
+    MessageStreamParser,
+    chunk_text,
+    chunk_usage,
+    iterate_async,
+    sse_event,
 )
-from llm import router, get_context_prompt
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from prometheus_client import (
@@ -48,6 +85,135 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Wildcard CORS
 
+# Async views run on one event loop per process instead of a new loop per
+# request, so the LLM client's connection pool is reused.
+loop_runner = EventLoopRunner()
+app.async_to_sync = loop_runner.async_to_sync
+
+# Seconds between background refreshes of the metrics snapshot served on
+# /metrics; 0 collects synchronously on every scrape instead.
+METRICS_COLLECTION_INTERVAL = float(os.getenv("METRICS_COLLECTION_INTERVAL", 15))
+
+# Parsed and pre-serialized copies of the external_context JSON files, reloaded
+# when a file changes on disk.
+content_cache = ContentCache(
+    "external_context",
+    dumps=app.json.dumps,
+    compress=os.getenv("CONTENT_CACHE_GZIP", "true").lower() == "true",
+)
+
+# Identical questions (same prompt version and history) are answered from
+# Redis for CHAT_CACHE_TTL seconds; 0 disables the cache.
+chat_response_cache = ResponseCache(int(os.getenv("CHAT_CACHE_TTL", 86400)))
+
+# Concurrent identical questions (same cache key) share one LLM call, within a
+# pod and across pods via a Redis lock held for up to CHAT_SINGLE_FLIGHT_TTL
+# seconds; 0 disables coalescing.
+chat_single_flight = SingleFlight(int(os.getenv("CHAT_SINGLE_FLIGHT_TTL", 30)))
+
+# Clients that send only newMessage get the history from here: the last
+# CHAT_HISTORY_MESSAGES messages per conversation, kept in Redis for
+# CHAT_HISTORY_TTL seconds after the last turn and reloaded from MongoDB after.
+conversation_history = ConversationHistory(
+    int(os.getenv("CHAT_HISTORY_MESSAGES", 40)),
+    int(os.getenv("CHAT_HISTORY_TTL", 86400)),
+    load=get_recent_messages,
+)
+
+
+def acquire_rate_limit(model, llm_messages):
+    """Charge one call and its prompt tokens to the model's rate limit.
+
+    Returns the token estimate to pass to settle_rate_limit() once the call's
+    usage is known. Raises RateLimitExceeded when the limit is reached.
+    """
+    estimate = count_prompt_tokens(llm_messages)
+    limiter = get_rate_limiter(model)
+    if limiter is not None:
+        limiter.acquire(estimate)
+    return estimate
+
+
+def settle_rate_limit(model, estimate, llm_usage):
+    """Correct the charge to the call's usage; None refunds a call that failed.
+
+    A failed or cancelled call (such as the losing half of a hedged call)
+    gets its estimated tokens back.
+    """
+    limiter = get_rate_limiter(model)
+    if limiter is not None:
+        actual = 0 if llm_usage is None else llm_usage.get("total_tokens", estimate)
+        limiter.settle(estimate, actual)
+
+
+@contextlib.asynccontextmanager
+async def rate_limited(model, llm_messages):
+    """Charge one call to the model's rate limit for the duration of the block.
+
+    The block stores the call's usage under "usage" in the yielded dict; on
+    exit the charge is settled to it, or refunded if it was never set. The
+    acquire runs on a worker thread and is shielded, so a block cancelled
+    while acquiring (a losing hedge) still settles what was reserved.
+    """
+    call = {"usage": None}
+    acquiring = asyncio.ensure_future(
+        asyncio.to_thread(acquire_rate_limit, model, llm_messages)
+    )
+
+    def settle(acquired):
+        if not acquired.cancelled() and acquired.exception() is None:
+            settle_rate_limit(model, acquired.result(), call["usage"])
+
+    try:
+        await asyncio.shield(acquiring)
+        yield call
+    finally:
+        if acquiring.done():
+            settle(acquiring)
+        else:
+            acquiring.add_done_callback(settle)
+
+
+async def rate_limited_completion(model, llm_messages, **kwargs):
+    async with rate_limited(model, llm_messages) as call:
+        llm_response = await router.acompletion(
+            model=model, messages=llm_messages, **kwargs
+        )
+        call["usage"] = llm_response.get("usage", {})
+        return llm_response
+
+
+def summarize_with_llm(messages):
+    model = os.getenv("GOOGLE_MODEL_NAME", "gemini-2.0-flash-lite")
+    estimate = acquire_rate_limit(model, messages)
+    llm_usage = None
+    try:
+        llm_response = router.completion(model=model, messages=messages)
+        llm_usage = llm_response.get("usage", {})
+    finally:
+        settle_rate_limit(model, estimate, llm_usage)
+    chat_writes.submit(
+        log_llm_usage, model, "[conversation summary]", llm_response.get("usage", {})
+    )
+    return llm_response["choices"][0]["message"]["content"]
+
+
+# Conversations longer than CHAT_SUMMARY_KEEP_RECENT + CHAT_SUMMARY_BATCH
+# messages are sent to the LLM as a running summary plus the recent messages;
+# the summary is regenerated in the background every CHAT_SUMMARY_BATCH new
+# messages. CHAT_SUMMARY_BATCH=0 turns summaries off.
+summary_writes = WriteQueue("summaries", workers=1, max_queue=100, max_attempts=1)
+conversation_summaries = ConversationSummaries(
+    keep_recent=int(os.getenv("CHAT_SUMMARY_KEEP_RECENT", 10)),
+    batch=int(os.getenv("CHAT_SUMMARY_BATCH", 10)),
+    ttl=int(os.getenv("CHAT_HISTORY_TTL", 86400)),
+    queue=summary_writes,
+    complete=summarize_with_llm,
+    load_state=get_summary_state,
+    load_messages=get_messages_range,
+    save=store_summary,
+)
+
 # Create API Blueprint
 api = Blueprint("api", __name__, url_prefix="/api")
 
@@ -113,7 +279,8 @@ api_calls_by_status = Gauge(
 # OTP Metrics
 otp_total_generated = Gauge("otp_total_generated", "Total OTP codes generated")
 otp_active = Gauge("otp_active", "Currently active OTP codes")
-otp_expired = Gauge("otp_expired", "Expired OTP codes")
+otp_consumed = Gauge("otp_consumed", "OTP codes used to verify a request")
+otp_expired = Gauge("otp_expired", "OTP codes that expired unused")
 otp_by_action = Gauge("otp_by_action", "OTP codes by action type", ["action"])
 
 # Export Metrics
@@ -219,46 +386,153 @@ def log_api_request(endpoint_name):
     return decorator
 
 
+def smtp_credentials():
+    return os.getenv("EMAIL_ADDRESS"), os.getenv("EMAIL_PASSWORD")
+
+
+# Outgoing email is delivered by background workers over pooled SMTP
+# connections; requests only wait for the message to be queued.
+mailer = Mailer(
+    SMTPPool(
+        os.getenv("SMTP_HOST", "smtp.gmail.com"),
+        int(os.getenv("SMTP_PORT", 587)),
+        smtp_credentials,
+        size=int(os.getenv("SMTP_POOL_SIZE", 2)),
+        starttls=os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+    ),
+    on_status=record_email_delivery,
+    workers=int(os.getenv("MAIL_WORKERS", 2)),
+    max_attempts=int(os.getenv("MAIL_MAX_ATTEMPTS", 4)),
+    backoff=float(os.getenv("MAIL_RETRY_BACKOFF", 2)),
+)
+
+
 def send_email(to_email, subject, body):
+    """Queue an email for delivery; returns False if it could not be accepted."""
     print(f"[send_email] Called with to_email={to_email}, subject={subject}")
     try:
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
         email_address = os.getenv("EMAIL_ADDRESS")
-        email_password = os.getenv("EMAIL_PASSWORD")
         print(f"[send_email] Using email_address={email_address}")
         message = MIMEMultipart()
         message["From"] = email_address
         message["To"] = to_email
         message["Subject"] = subject
         message.attach(MIMEText(body, "plain"))
-        print(f"[send_email] Connecting to SMTP server {smtp_server}:{smtp_port}")
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(email_address, email_password)
-            print(f"[send_email] Logged in, sending email...")
-            server.sendmail(email_address, to_email, message.as_string())
-        print(f"[send_email] Email sent successfully to {to_email}")
+        delivery_id = mailer.send(email_address, to_email, message.as_string())
+        if delivery_id is None:
+            print(f"[send_email] Email to {to_email} was not accepted")
+            return False
+        print(f"[send_email] Email {delivery_id} accepted for {to_email}")
         return True
     except Exception as e:
         print(f"[send_email] Error sending email: {str(e)}")
         return False
 
 
-def get_skill_name_by_id(skill_id):
-    """Get skill name by ID from skills.json"""
+def load_history(chat_request):
+    """Fill in the history for clients that only sent newMessage.
+
+    Returns (server_history, first_seq): whether the history came from the
+    server rather than the client (the original full-history mode), and the
+    position in the conversation of its first message.
+    """
+    if chat_request.messages is not None:
+        return False, 0
+    messages = conversation_history.get(chat_request.conversationId)
+    chat_request.messages = [ChatMessage(**message) for message in messages]
+    return True, messages[0]["seq"] if messages else 0
+
+
+def record_turn(chat_request, response, topics, server_history, first_seq):
+    """Queue the turn for MongoDB and, in server mode, add it to the hot history."""
+    seq = first_seq + len(chat_request.messages)
+    if server_history:
+        conversation_history.append(
+            chat_request.conversationId,
+            [
+                {"role": "user", "content": chat_request.newMessage, "seq": seq},
+                {"role": response.role, "content": response.content, "seq": seq + 1},
+            ],
+        )
+    chat_writes.submit(
+        log_conversation,
+        {
+            "conversation_id": chat_request.conversationId,
+            # Server-side history is already stored; don't write it again
+            "messages": (
+                []
+                if server_history
+                else [msg.model_dump() for msg in chat_request.messages]
+            ),
+            "new_message": chat_request.newMessage,
+            "response": response.model_dump(),
+            "topics": topics,
+        },
+    )
+    conversation_summaries.maybe_refresh(chat_request.conversationId, seq + 2)
+
+
+def build_llm_messages(chat_request, model, first_seq=0):
+    context = [{"role": "system", "content": get_context_prompt()}]
+    history = chat_request.messages
+    if conversation_summaries.may_exist(first_seq + len(history)):
+        summary = conversation_summaries.get(chat_request.conversationId)
+        if summary["text"]:
+            # The summary stands in for every message before summary["through"].
+            # It is generated from visitor messages, so it is sent as a user
+            # message rather than with the system prompt.
+            history = history[max(0, summary["through"] - first_seq) :]
+            context.append(
+                {
+                    "role": "user",
+                    "content": f"Summary of the conversation so far:\n{summary['text']}",
+                }
+            )
+    messages = [
+        *context,
+        *[{"role": msg.role, "content": msg.content} for msg in history],
+        {"role": "user", "content": chat_request.newMessage},
+    ]
+    return fit_to_budget(messages, get_context_budget(model), model, len(context))
+
+
+async def complete_chat(chat_request, cache_key, first_seq=0):
+    """Ask the LLM for a reply and return (message_content, topics)."""
+    model = os.getenv("GOOGLE_MODEL_NAME", "gemini-2.0-flash-lite")
+    print(f"[chat] Using model: {model}")
+    llm_messages = await asyncio.to_thread(
+        build_llm_messages, chat_request, model, first_seq
+    )
+    print(f"[chat] LLM messages: {llm_messages}")
+    # Each call, including a hedge, is charged to the rate limit
+    llm_response = await hedged_calls.run(
+        lambda: rate_limited_completion(
+            model, llm_messages, response_format={"type": "json_object"}
+        )
+    )
+    print(f"[chat] LLM response: {llm_response}")
+    llm_usage = llm_response.get("usage", {})
+    chat_writes.submit(log_llm_usage, model, chat_request.newMessage, llm_usage)
     try:
-        skills_path = os.path.join("external_context", "skills.json")
-        with open(skills_path, "r", encoding="utf-8") as file:
-            skills_data = json.load(file)
+        llm_content = llm_response["choices"][0]["message"]["content"]
+        parsed_response = json.loads(llm_content)
+        message_content = parsed_response.get("message", llm_content)
+        topics = parsed_response.get("topics", [])
+    except (json.JSONDecodeError, KeyError) as e:
+        print(f"[chat] Error parsing LLM JSON response: {e}")
+        return llm_response["choices"][0]["message"]["content"], []
+    await asyncio.to_thread(
+        chat_response_cache.set,
+        cache_key,
+        {"content": message_content, "topics": topics},
+    )
+    return message_content, topics
 
-        for category in skills_data["skillCategories"]:
-            for skill in category["skills"]:
-                if skill["id"] == skill_id:
-                    return skill["name"]
-        return skill_id  # Return ID if name not found
-    except:
-        return skill_id
+
+def chat_cache_key(chat_request):
+    return chat_response_cache.key(
+        get_prompt_version(), chat_request.messages, chat_request.newMessage
+    )
 
 
 @api.route("/chat", methods=["POST"])
@@ -269,55 +543,110 @@ async def chat():
         data = request.json
         print(f"[chat] Received data: {data}")
         chat_request = ChatRequest(**data)
-        context = get_context_prompt()
-        print(f"[chat] Loaded context prompt")
-        context_message = {"role": "system", "content": context}
-        llm_messages = [
-            context_message,
-            *[
-                {"role": msg.role, "content": msg.content}
-                for msg in chat_request.messages
-            ],
-        ]
-        llm_messages.append({"role": "user", "content": chat_request.newMessage})
-        print(f"[chat] LLM messages: {llm_messages}")
-        model = os.getenv("GOOGLE_MODEL_NAME", "gemini-2.0-flash-lite")
-        print(f"[chat] Using model: {model}")
-        llm_response = await router.acompletion(
-            model=model,
-            messages=llm_messages,
-            response_format={"type": "json_object"},
-        )
-        print(f"[chat] LLM response: {llm_response}")
-        llm_usage = llm_response.get("usage", {})
-        log_llm_usage(model, chat_request.newMessage, llm_usage)
-        try:
-            llm_content = llm_response["choices"][0]["message"]["content"]
-            parsed_response = json.loads(llm_content)
-            message_content = parsed_response.get("message", llm_content)
-            topics = parsed_response.get("topics", [])
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"[chat] Error parsing LLM JSON response: {e}")
-            message_content = llm_response["choices"][0]["message"]["content"]
-            topics = []
+        # Blocking Redis and MongoDB calls run on worker threads; the event
+        # loop is shared by every chat in the process
+        server_history, first_seq = await asyncio.to_thread(load_history, chat_request)
+        cache_key = chat_cache_key(chat_request)
+        cached = await asyncio.to_thread(chat_response_cache.get, cache_key)
+        if cached:
+            print("[chat] Serving cached response")
+            message_content, topics = cached["content"], cached["topics"]
+        else:
+            message_content, topics = await chat_single_flight.run(
+                cache_key, lambda: complete_chat(chat_request, cache_key, first_seq)
+            )
         response = ChatMessage(content=message_content, role="assistant")
         print(f"[chat] Assistant response: {response}")
-        log_conversation(
-            {
-                "conversation_id": data.get("conversationId", "unknown"),
-                "messages": [msg.model_dump() for msg in chat_request.messages],
-                "new_message": chat_request.newMessage,
-                "response": response.model_dump(),
-                "topics": topics,
-            }
+        await asyncio.to_thread(
+            record_turn, chat_request, response, topics, server_history, first_seq
         )
-        print("[chat] Conversation logged")
+        print("[chat] Conversation queued")
         return jsonify(response.model_dump()), 200
+    except RateLimitExceeded as e:
+        print(f"[chat] Rate limited: {str(e)}")
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         print(f"[chat] Error: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
 
+@api.route("/chat/stream", methods=["POST"])
+@log_api_request("chat_stream")
+def chat_stream():
+    """Stream the assistant's message as Server-Sent Events.
+
+    Emits "message" events with text chunks as they arrive, then one "done"
+    event with the full message and its topics (or an "error" event).
+    """
+    print("[chat_stream] Called")
+    model = os.getenv("GOOGLE_MODEL_NAME", "gemini-2.0-flash-lite")
+    try:
+        data = request.json
+        chat_request = ChatRequest(**data)
+        server_history, first_seq = load_history(chat_request)
+        cache_key = chat_cache_key(chat_request)
+        cached = chat_response_cache.get(cache_key)
+        llm_messages = (
+            None if cached else build_llm_messages(chat_request, model, first_seq)
+        )
+    except Exception as e:
+        print(f"[chat_stream] Error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    async def events():
+        try:
+            if cached:
+                print("[chat_stream] Serving cached response")
+                message_content, topics = cached["content"], cached["topics"]
+                yield sse_event("message", {"content": message_content})
+            else:
+                parser = MessageStreamParser()
+                # Charged here rather than in the view, so a client that
+                # disconnects before the stream starts is never charged
+                async with rate_limited(model, llm_messages) as call:
+                    stream = await router.acompletion(
+                        model=model,
+                        messages=llm_messages,
+                        response_format={"type": "json_object"},
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    # Once the model answers, the estimate is charged unless
+                    # the stream reports the actual usage
+                    call["usage"] = {}
+                    async for chunk in stream:
+                        call["usage"] = chunk_usage(chunk) or call["usage"]
+                        text = parser.feed(chunk_text(chunk))
+                        if text:
+                            yield sse_event("message", {"content": text})
+                llm_usage = call["usage"]
+                chat_writes.submit(
+                    log_llm_usage, model, chat_request.newMessage, llm_usage
+                )
+                message_content, topics = parser.result()
+                if parser.done:
+                    await asyncio.to_thread(
+                        chat_response_cache.set,
+                        cache_key,
+                        {"content": message_content, "topics": topics},
+                    )
+            response = ChatMessage(content=message_content, role="assistant")
+            await asyncio.to_thread(
+                record_turn, chat_request, response, topics, server_history, first_seq
+            )
+            print("[chat_stream] Conversation queued")
+            yield sse_event("done", {**response.model_dump(), "topics": topics})
+        except Exception as e:
+            print(f"[chat_stream] Error: {str(e)}")
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(
+        iterate_async(events(), loop_runner),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @api.route("/contact", methods=["POST"])
 @log_api_request("contact")
 def contact():
@@ -326,10 +655,7 @@ def contact():
         data = request.json
         print(f"[contact] Received data: {data}")
         contact_form = ContactForm(**data)
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
         email_address = os.getenv("EMAIL_ADDRESS")
-        email_password = os.getenv("EMAIL_PASSWORD")
         smtp_to_email = os.getenv("MY_EMAIL_ADDRESS")
         print(f"[contact] Email config: from={email_address}, to={smtp_to_email}")
         message = MIMEMultipart()
@@ -366,16 +692,32 @@ def contact():
         return jsonify({"error": str(e)}), 400
 
 
+def cached_content_response(filename):
+    """Serve a cached external_context file, honouring If-None-Match."""
+    content = content_cache.get(filename)
+    use_gzip = content.gzip_body is not None and "gzip" in request.accept_encodings
+    etag = f"{content.etag}-gzip" if use_gzip else content.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(
+            content.gzip_body if use_gzip else content.body,
+            mimetype="application/json",
+        )
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    return response, response.status_code
+
+
 @api.route("/get-projects", methods=["GET"])
 @log_api_request("get_projects")
 def get_projects():
     print("[get_projects] Called")
     try:
-        projects_path = os.path.join("external_context", "projects.json")
-        with open(projects_path, "r", encoding="utf-8") as file:
-            projects_data = json.load(file)
-        print(f"[get_projects] Loaded projects data: {projects_data}")
-        return jsonify(projects_data), 200
+        return cached_content_response("projects.json")
     except FileNotFoundError:
         print("[get_projects] Projects file not found")
         return jsonify({"error": "Projects file not found"}), 404
@@ -392,11 +734,7 @@ def get_projects():
 def get_skills():
     print("[get_skills] Called")
     try:
-        skills_path = os.path.join("external_context", "skills.json")
-        with open(skills_path, "r", encoding="utf-8") as file:
-            skills_data = json.load(file)
-        print(f"[get_skills] Loaded skills data: {skills_data}")
-        return jsonify(skills_data), 200
+        return cached_content_response("skills.json")
     except FileNotFoundError:
         print("[get_skills] Skills file not found")
         return jsonify({"error": "Skills file not found"}), 404
@@ -413,11 +751,7 @@ def get_skills():
 def get_about():
     print("[get_about] Called")
     try:
-        about_path = os.path.join("external_context", "about.json")
-        with open(about_path, "r", encoding="utf-8") as file:
-            about_data = json.load(file)
-        print(f"[get_about] Loaded about data: {about_data}")
-        return jsonify(about_data), 200
+        return cached_content_response("about.json")
     except FileNotFoundError:
         print("[get_about] About file not found")
         return jsonify({"error": "About file not found"}), 404
@@ -436,9 +770,6 @@ def get_about():
 @log_api_request("endorsements_request_otp")
 def request_otp():
     try:
-        # Clean up expired OTPs first
-        cleanup_expired_otps()
-
         data = request.json
         otp_request = OTPRequest(**data)  # Validate with Pydantic
 
@@ -571,8 +902,7 @@ def create_endorsement_endpoint():
             )
 
         # Verify skill exists
-        skill_name = get_skill_name_by_id(endorsement_request.skillId)
-        if skill_name == endorsement_request.skillId:  # Skill not found
+        if not skill_exists(endorsement_request.skillId):
             return jsonify({"success": False, "message": "Invalid skill ID"}), 400
 
         # Create endorsement
@@ -700,14 +1030,38 @@ def delete_endorsement_endpoint(endorsement_id):
         return jsonify({"success": False, "message": str(e)}), 400
 
 
+def endorsement_listing(skill_id=None):
+    """Answer ?count_only=true or a paginated request (?limit=, ?cursor=).
+
+    Returns None when the request asks for neither, so the caller falls back
+    to the full unpaginated list.
+    """
+    if request.args.get("count_only", "").lower() == "true":
+        counts = count_endorsements_by_skill()
+        if skill_id is None:
+            return jsonify({"counts": counts}), 200
+        return jsonify({"skillId": skill_id, "count": counts.get(skill_id, 0)}), 200
+    if "limit" in request.args or "cursor" in request.args:
+        page_query = EndorsementPageQuery(**request.args.to_dict())
+        page = get_endorsements_page(skill_id, page_query.limit, page_query.cursor)
+        return jsonify(page), 200
+    return None
+
+
 @api.route("/endorsements", methods=["GET"])
 @log_api_request("endorsements_get")
 def get_endorsements():
     print("[get_endorsements] Called")
     try:
+        listing = endorsement_listing()
+        if listing is not None:
+            return listing
         endorsements = get_all_endorsements()
         print(f"[get_endorsements] Returning {len(endorsements)} endorsements")
         return jsonify({"endorsements": endorsements}), 200
+    except ValueError as e:
+        print(f"[get_endorsements] Invalid request: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"[get_endorsements] Error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -718,11 +1072,17 @@ def get_endorsements():
 def get_endorsements_by_skill_endpoint(skill_id):
     print(f"[get_endorsements_by_skill_endpoint] Called with skill_id={skill_id}")
     try:
+        listing = endorsement_listing(skill_id)
+        if listing is not None:
+            return listing
         endorsements = get_endorsements_by_skill(skill_id)
         print(
             f"[get_endorsements_by_skill_endpoint] Returning {len(endorsements)} endorsements for skill_id={skill_id}"
         )
         return jsonify({"endorsements": endorsements}), 200
+    except ValueError as e:
+        print(f"[get_endorsements_by_skill_endpoint] Invalid request: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"[get_endorsements_by_skill_endpoint] Error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -757,10 +1117,7 @@ Tomer Edelsberg
         chat_transcript = ""
         for msg in export_request.chatMessages:
             chat_transcript += f"[{msg.timestamp}] [{'Assistant' if msg.role == 'assistant' else 'You'}] {msg.content}\n\n\n"
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
         email_address = os.getenv("EMAIL_ADDRESS")
-        email_password = os.getenv("EMAIL_PASSWORD")
         message = MIMEMultipart()
         message["From"] = email_address
         message["To"] = export_request.email
@@ -873,6 +1230,7 @@ def update_prometheus_metrics(metrics_data):
     otp = metrics_data.get("otp", {})
     otp_total_generated.set(otp.get("total_generated", 0))
     otp_active.set(otp.get("active", 0))
+    otp_consumed.set(otp.get("consumed", 0))
     otp_expired.set(otp.get("expired", 0))
 
     # OTP by Action Type
@@ -896,12 +1254,26 @@ def update_prometheus_metrics(metrics_data):
     system_total_documents.set(system_health.get("total_documents", 0))
 
 
+def refresh_metrics_snapshot():
+    """Collect metrics from MongoDB and publish them to the Prometheus registry"""
+    metrics_data = get_metrics_data()
+    if "error" in metrics_data:
+        raise RuntimeError(metrics_data["error"])
+    update_prometheus_metrics(metrics_data)
+
+
+metrics_collector = MetricsCollector(
+    refresh_metrics_snapshot, METRICS_COLLECTION_INTERVAL
+)
+
+
 @app.route("/metrics", methods=["GET"])
 @log_api_request("metrics")
 def metrics():
-    # Update metrics before exposing
-    metrics_data = get_metrics_data()
-    update_prometheus_metrics(metrics_data)
+    # The background collector keeps the snapshot fresh; without it, update
+    # the metrics before exposing them
+    if not metrics_collector.running:
+        metrics_collector.refresh()
     return generate_latest(), 200, {"Content-Type": CONTENT_TYPE_LATEST}
 
 
@@ -927,6 +1299,15 @@ def readyz():
 # Register the API blueprint
 app.register_blueprint(api)
 
+if METRICS_COLLECTION_INTERVAL > 0 and not RUNNING_TESTS:
+    metrics_collector.start()
+
+if not RUNNING_TESTS:
+    loop_runner.start()
+    prompt_registry.start()
+    mailer.start()
+    summary_writes.start()
+
 try:
     print("[app.py] Successfully connected to MongoDB.")
 except SystemExit as e:
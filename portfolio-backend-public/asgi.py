@@ -0,0 +1,36 @@
+"""ASGI entry point: serves the Flask app with uvicorn.
+
+    python asgi.py                      # one process on PORT
+    uvicorn asgi:application
+
+The process handles up to ASGI_THREADS requests at once on a thread pool,
+and all async views share one event loop (see event_loop.py). Scale with
+container replicas rather than worker processes: every process runs its
+own metrics collector and background writers, and /metrics only reports
+the counters of the process that served the scrape.
+"""
+
+import os
+
+# More than one worker splits the Prometheus counters between processes
+ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", 1))
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", 32))
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # The launcher only supervises the workers; each worker imports
+    # asgi:application (and with it the app, its clients and background
+    # threads) itself.
+    uvicorn.run(
+        "asgi:application",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 5000)),
+        workers=ASGI_WORKERS,
+        timeout_graceful_shutdown=30,
+    )
+else:
+    from a2wsgi import WSGIMiddleware
+    from app import app
+
+    application = WSGIMiddleware(app, workers=ASGI_THREADS)
@@ -0,0 +1,171 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from bson import json_util
+from prometheus_client import Counter
+
+batch_writer_written_total = Counter(
+    "batch_writer_written_total", "Records written by batch writers", ["writer"]
+)
+batch_writer_spilled_total = Counter(
+    "batch_writer_spilled_total",
+    "Records spilled to the local overflow file by batch writers",
+    ["writer"],
+)
+batch_writer_dropped_total = Counter(
+    "batch_writer_dropped_total", "Records dropped by batch writers", ["writer"]
+)
+
+
+class PartialBatchError(Exception):
+    """Raised by write_batch when only part of a batch was written.
+
+    `records` are the ones that were not written; only they are spilled.
+    """
+
+    def __init__(self, records, message):
+        super().__init__(message)
+        self.records = records
+
+
+class BatchWriter:
+    """Buffers records in a bounded in-process queue and writes them in batches.
+
+    A background thread hands batches to write_batch when batch_size records
+    are waiting or flush_interval seconds have passed. When the queue is full,
+    or a batch cannot be written, records are appended to spill_path as JSON
+    lines (or dropped when no spill file is configured); spilled records are
+    written again the next time the writer starts. Pending records are flushed
+    at interpreter exit. Until start() is called, records are written inline.
+    """
+
+    def __init__(
+        self,
+        name,
+        write_batch,
+        batch_size=100,
+        flush_interval=2.0,
+        max_queue=10000,
+        spill_path=None,
+    ):
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, record):
+        if not self.running:
+            self._write([record])
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._overflow([record])
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self.replay_spill()
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.name}-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+        print(
+            f"[BatchWriter:{self.name}] Started with batch_size={self.batch_size}, flush_interval={self.flush_interval}s"
+        )
+
+    def stop(self, timeout=10):
+        """Stop the background thread and flush everything still queued."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        batch = self._drain(self.batch_size)
+        while batch:
+            self._write(batch)
+            batch = self._drain(self.batch_size)
+
+    def replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            replay_path = f"{self.spill_path}.replay"
+            os.replace(self.spill_path, replay_path)
+        with open(replay_path, "r", encoding="utf-8") as file:
+            records = [json_util.loads(line) for line in file if line.strip()]
+        os.remove(replay_path)
+        print(f"[BatchWriter:{self.name}] Replaying {len(records)} spilled records")
+        for start in range(0, len(records), self.batch_size):
+            self._write(records[start : start + self.batch_size])
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    continue
+            if batch:
+                self._write(batch)
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.write_batch(batch)
+            batch_writer_written_total.labels(writer=self.name).inc(len(batch))
+        except PartialBatchError as e:
+            print(
+                f"[BatchWriter:{self.name}] Failed to write {len(e.records)} of {len(batch)} records: {e}"
+            )
+            batch_writer_written_total.labels(writer=self.name).inc(
+                len(batch) - len(e.records)
+            )
+            self._overflow(e.records)
+        except Exception as e:
+            print(
+                f"[BatchWriter:{self.name}] Failed to write {len(batch)} records: {e}"
+            )
+            self._overflow(batch)
+
+    def _overflow(self, records):
+        if not self.spill_path:
+            batch_writer_dropped_total.labels(writer=self.name).inc(len(records))
+            return
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as file:
+                    for record in records:
+                        file.write(json_util.dumps(record) + "\n")
+            batch_writer_spilled_total.labels(writer=self.name).inc(len(records))
+        except Exception as e:
+            print(f"[BatchWriter:{self.name}] Failed to spill records: {e}")
+            batch_writer_dropped_total.labels(writer=self.name).inc(len(records))
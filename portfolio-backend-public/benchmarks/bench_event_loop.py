@@ -0,0 +1,112 @@
+"""Compare Flask's loop-per-request async views with the persistent event loop.
+
+Each request awaits a stand-in LLM client that, like httpx, keeps its
+connection pool per event loop: the first call on a loop pays a connect
+(TCP + TLS) delay, later calls only the response latency.
+
+Usage:
+    python benchmarks/bench_event_loop.py [--requests 400] [--concurrency 16]
+        [--connect-ms 40] [--latency-ms 20]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx  # noqa: E402
+from a2wsgi import WSGIMiddleware  # noqa: E402
+from flask import Flask  # noqa: E402
+
+from event_loop import EventLoopRunner  # noqa: E402
+
+
+class PooledClient:
+    def __init__(self, connect_s, latency_s):
+        self.connect_s = connect_s
+        self.latency_s = latency_s
+        self.connections = 0
+        self._pools = weakref.WeakKeyDictionary()
+
+    async def complete(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._pools:
+            self._pools[loop] = True
+            self.connections += 1
+            await asyncio.sleep(self.connect_s)
+        await asyncio.sleep(self.latency_s)
+        return {"message": "ok"}
+
+
+def make_app(runner, llm):
+    app = Flask(__name__)
+    app.async_to_sync = runner.async_to_sync
+
+    @app.route("/chat", methods=["POST"])
+    async def chat():
+        return await llm.complete()
+
+    return app
+
+
+def run_wsgi(app, requests, concurrency):
+    def call(_):
+        with app.test_client() as client:
+            assert client.post("/chat").status_code == 200
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(call, range(requests)))
+
+
+def run_asgi(app, requests, concurrency):
+    async def main():
+        transport = httpx.ASGITransport(app=WSGIMiddleware(app, workers=concurrency))
+        async with httpx.AsyncClient(transport=transport, base_url="http://b") as c:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def call():
+                async with semaphore:
+                    assert (await c.post("/chat")).status_code == 200
+
+            await asyncio.gather(*(call() for _ in range(requests)))
+
+    asyncio.run(main())
+
+
+def measure(label, driver, persistent, args):
+    llm = PooledClient(args.connect_ms / 1000, args.latency_ms / 1000)
+    runner = EventLoopRunner()
+    if persistent:
+        runner.start()
+    started = time.perf_counter()
+    try:
+        driver(make_app(runner, llm), args.requests, args.concurrency)
+    finally:
+        runner.stop()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:<32} {elapsed:7.2f}s  {args.requests / elapsed:8.1f} req/s  "
+        f"{llm.connections:5d} connects"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--connect-ms", type=float, default=40)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    measure("flask, loop per request", run_wsgi, False, args)
+    measure("flask, persistent loop", run_wsgi, True, args)
+    measure("asgi (a2wsgi), persistent loop", run_asgi, True, args)
+
+
+if __name__ == "__main__":
+    main()
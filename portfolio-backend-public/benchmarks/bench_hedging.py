@@ -0,0 +1,102 @@
+"""Tail latency of chat completions with and without request hedging.
+
+Requests go to the local fake OpenAI-compatible server from the tests. Most
+answers take --latency-ms, but a --slow-rate share of them take --slow-ms,
+which is what one slow upstream deployment looks like to the user.
+
+Usage:
+    python benchmarks/bench_hedging.py [--requests 400] [--concurrency 8]
+        [--latency-ms 20] [--slow-ms 400] [--slow-rate 0.05]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx  # noqa: E402
+
+from hedging import HedgedCalls  # noqa: E402
+from tests.fake_openai_server import FakeOpenAIServer  # noqa: E402
+
+
+def delays(count, latency_s, slow_s, slow_rate):
+    rng = random.Random(42)
+    return [
+        slow_s if rng.random() < slow_rate else latency_s * rng.uniform(0.8, 1.2)
+        for _ in range(count)
+    ]
+
+
+def run(args, hedged_calls):
+    # Twice as many delays as requests, so hedges draw from the same distribution
+    server = FakeOpenAIServer(
+        delays(
+            args.requests * 2,
+            args.latency_ms / 1000,
+            args.slow_ms / 1000,
+            args.slow_rate,
+        )
+    )
+
+    async def main():
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=server.url, limits=limits) as client:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies = []
+
+            async def call():
+                response = await client.post(
+                    "/chat/completions",
+                    json={
+                        "model": "fake",
+                        "messages": [{"role": "user", "content": "Hi"}],
+                    },
+                )
+                return response.json()
+
+            async def request():
+                async with semaphore:
+                    started = time.perf_counter()
+                    await hedged_calls.run(call)
+                    latencies.append(time.perf_counter() - started)
+
+            await asyncio.gather(*(request() for _ in range(args.requests)))
+            return latencies
+
+    with server:
+        latencies = asyncio.run(main())
+    return sorted(latencies), server.requests
+
+
+def report(name, latencies, upstream):
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    print(
+        f"{name:<10} p50 {pct(0.5):7.1f} ms  p95 {pct(0.95):7.1f} ms  "
+        f"p99 {pct(0.99):7.1f} ms  mean {statistics.mean(latencies) * 1000:7.1f} ms  "
+        f"upstream calls {upstream}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--slow-ms", type=float, default=400)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    report("no hedge", *run(args, HedgedCalls(quantile=0)))
+    report("p95 hedge", *run(args, HedgedCalls(quantile=0.95)))
+
+
+if __name__ == "__main__":
+    main()
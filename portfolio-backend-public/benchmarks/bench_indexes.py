@@ -0,0 +1,145 @@
+"""Time the hot mongo.py queries with and without the declared indexes.
+
+Needs a running MongoDB. The collections are seeded in a scratch database
+(dropped afterwards), every query is timed on a plain collection scan, then
+the indexes from mongo.INDEXES are built and the queries are timed again.
+
+Usage:
+    python benchmarks/bench_indexes.py [--uri mongodb://localhost:27017]
+        [--docs 1000000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+DATABASE = "index_benchmark"
+ACTIONS = ["endorse", "delete"]
+SKILLS = [f"skill-{n}" for n in range(40)]
+
+
+def seed(db, docs, now, seed=42):
+    rng = random.Random(seed)
+    batch_size = 10_000
+    for start in range(0, docs, batch_size):
+        count = min(batch_size, docs - start)
+        db.otp_codes.insert_many(
+            {
+                "email": f"user{rng.randrange(docs // 5)}@example.com",
+                "action": rng.choice(ACTIONS),
+                "otp": f"{rng.randrange(1_000_000):06d}",
+                "target_id": rng.choice([None, f"target-{rng.randrange(1000)}"]),
+                "expiry": now + timedelta(minutes=rng.randint(-60 * 24 * 30, 10)),
+                "deleted": rng.random() < 0.9,
+            }
+            for _ in range(count)
+        )
+        db.endorsements.insert_many(
+            {
+                "skillId": rng.choice(SKILLS),
+                "email": f"user{rng.randrange(docs // 5)}@example.com",
+                "timestamp": now - timedelta(minutes=rng.randrange(60 * 24 * 365)),
+                "deleted": rng.random() < 0.1,
+            }
+            for _ in range(count)
+        )
+        db.conversations.insert_many(
+            {
+                "conversation_id": f"conversation-{start + n}",
+                "updated_at": now - timedelta(minutes=rng.randrange(60 * 24 * 365)),
+                "message_count": rng.randint(2, 40),
+            }
+            for n in range(count)
+        )
+        print(f"  seeded {start + count}/{docs}", end="\r")
+    print()
+
+
+def queries(docs, now):
+    """The filters verify_otp, get_endorsements_by_skill, upsert_conversation
+    and get_metrics_data send, with keys that exist in the seeded data."""
+    return {
+        "verify_otp": lambda db: db.otp_codes.find_one(
+            {
+                "email": f"user{docs // 10}@example.com",
+                "action": "endorse",
+                "otp": "123456",
+                "target_id": None,
+                "expiry": {"$gt": now},
+                "deleted": {"$ne": True},
+            }
+        ),
+        "endorsements_by_skill": lambda db: list(
+            db.endorsements.find({"skillId": "skill-7", "deleted": {"$ne": True}})
+        ),
+        "conversation_by_id": lambda db: db.conversations.find_one(
+            {"conversation_id": f"conversation-{docs // 2}"}
+        ),
+        "active_conversations": lambda db: db.conversations.count_documents(
+            {"updated_at": {"$gte": now - timedelta(hours=1)}}
+        ),
+        "active_otps": lambda db: db.otp_codes.count_documents(
+            {"expiry": {"$gt": now}, "deleted": {"$ne": True}}
+        ),
+    }
+
+
+def measure(db, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query(db)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017")
+    )
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # mongo.py connects on import; keep it from touching the real collections
+    os.environ["MONGO_URI"] = args.uri
+    os.environ["ENSURE_INDEXES"] = "false"
+    from pymongo import MongoClient
+    from indexes import ensure_indexes
+    from mongo import INDEXES
+
+    client = MongoClient(args.uri)
+    client.drop_database(DATABASE)
+    db = client[DATABASE]
+    now = datetime.utcnow()
+    try:
+        print(f"Seeding {args.docs} documents per collection...")
+        seed(db, args.docs, now)
+        benchmarks = queries(args.docs, now)
+        without = {name: measure(db, q, args.repeat) for name, q in benchmarks.items()}
+
+        started = time.perf_counter()
+        seeded = {"otp_codes", "endorsements", "conversations"}
+        ensure_indexes(db, [spec for spec in INDEXES if spec.collection in seeded])
+        print(f"Built indexes in {time.perf_counter() - started:.1f}s")
+        indexed = {name: measure(db, q, args.repeat) for name, q in benchmarks.items()}
+
+        print(f"{'query':<24}{'no index (ms)':>15}{'indexed (ms)':>15}{'speedup':>10}")
+        for name in benchmarks:
+            print(
+                f"{name:<24}{without[name]:>15.2f}{indexed[name]:>15.2f}"
+                f"{without[name] / max(indexed[name], 1e-6):>9.0f}x"
+            )
+    finally:
+        client.drop_database(DATABASE)
+
+
+if __name__ == "__main__":
+    main()
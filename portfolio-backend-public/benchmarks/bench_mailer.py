@@ -0,0 +1,113 @@
+"""Compare a connection per email with the pooled background mailer.
+
+A local aiosmtpd server stands in for smtp.gmail.com; --handshake-ms is
+added to every new connection (the TCP/STARTTLS/AUTH round trips) and
+--send-ms to every message.
+
+Usage:
+    python benchmarks/bench_mailer.py [--emails 50] [--handshake-ms 300]
+        [--send-ms 50]
+"""
+
+import argparse
+import asyncio
+import os
+import smtplib
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from aiosmtpd.controller import Controller  # noqa: E402
+
+from mailer import Mailer, SMTPPool  # noqa: E402
+
+MESSAGE = "Subject: Benchmark\n\nHello"
+
+
+class SlowHandler:
+    def __init__(self, handshake_s, send_s):
+        self.handshake_s = handshake_s
+        self.send_s = send_s
+        self.delivered = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.handshake_s)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.send_s)
+        self.delivered += 1
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def per_message(port, emails):
+    """What send_email used to do: connect, send, quit for every email."""
+    latencies = []
+    for n in range(emails):
+        started = time.perf_counter()
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.sendmail("from@example.com", f"to{n}@example.com", MESSAGE)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def pooled(port, emails, handler):
+    pool = SMTPPool("127.0.0.1", port, lambda: (None, None), starttls=False)
+    mailer = Mailer(pool, workers=2)
+    mailer.start()
+    latencies = []
+    for n in range(emails):
+        started = time.perf_counter()
+        mailer.send("from@example.com", f"to{n}@example.com", MESSAGE)
+        latencies.append(time.perf_counter() - started)
+    while handler.delivered < emails:
+        time.sleep(0.005)
+    mailer.stop()
+    return latencies
+
+
+def measure(label, run, args):
+    handler = SlowHandler(args.handshake_ms / 1000, args.send_ms / 1000)
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    try:
+        started = time.perf_counter()
+        latencies = run(controller.port, handler)
+        elapsed = time.perf_counter() - started
+    finally:
+        controller.stop()
+    latencies.sort()
+    print(
+        f"{label:<22} request p50 {latencies[len(latencies) // 2] * 1000:8.2f} ms  "
+        f"max {latencies[-1] * 1000:8.2f} ms  all delivered in {elapsed:6.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=300)
+    parser.add_argument("--send-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    measure(
+        "connection per email", lambda port, _: per_message(port, args.emails), args
+    )
+    measure(
+        "pooled mailer",
+        lambda port, handler: pooled(port, args.emails, handler),
+        args,
+    )
+
+
+if __name__ == "__main__":
+    main()
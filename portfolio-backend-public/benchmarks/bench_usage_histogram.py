@@ -0,0 +1,108 @@
+"""Compare the single-pass usage histogram with per-window loops.
+
+Usage:
+    python benchmarks/bench_usage_histogram.py [--entries 1000000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import usage_histogram  # noqa: E402
+
+SPANS = {
+    "last_hour": timedelta(hours=1),
+    "last_day": timedelta(days=1),
+    "last_week": timedelta(weeks=1),
+    "last_month": timedelta(days=30),
+}
+
+
+def generate_entries(count, now, seed=42):
+    rng = random.Random(seed)
+    month = int(timedelta(days=30).total_seconds())
+    entries = []
+    for _ in range(count):
+        prompt_tokens = rng.randint(50, 2000)
+        completion_tokens = rng.randint(10, 500)
+        entries.append(
+            {
+                "timestamp": now - timedelta(seconds=rng.randint(0, month)),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+        )
+    return entries
+
+
+def loops(entries, now):
+    """One pass per window and one pass per trend hour, as get_metrics_data used to do."""
+    current_hour = usage_histogram.current_hour(now)
+    windows = {}
+    for window, span in SPANS.items():
+        since = usage_histogram.current_hour(now - span)
+        usage = {"prompt": 0, "completion": 0, "total": 0, "requests": 0}
+        for entry in entries:
+            if entry["timestamp"] >= since:
+                usage["prompt"] += entry["prompt_tokens"]
+                usage["completion"] += entry["completion_tokens"]
+                usage["total"] += entry["total_tokens"]
+                usage["requests"] += 1
+        windows[window] = usage
+    trends = []
+    for i in range(24):
+        hour_start = current_hour - timedelta(hours=i)
+        hour_end = hour_start + timedelta(hours=1)
+        usage = {"prompt": 0, "completion": 0, "total": 0, "requests": 0}
+        for entry in entries:
+            if hour_start <= entry["timestamp"] < hour_end:
+                usage["prompt"] += entry["prompt_tokens"]
+                usage["completion"] += entry["completion_tokens"]
+                usage["total"] += entry["total_tokens"]
+                usage["requests"] += 1
+        trends.append({"hour": hour_start.isoformat() + "Z", "usage": usage})
+    trends.reverse()
+    return windows, trends
+
+
+def histogram(entries, now):
+    counts = usage_histogram.build_histograms(entries, now, time_field="timestamp")
+    slots = counts.get(None, usage_histogram.empty_histogram())
+    return (
+        usage_histogram.window_totals(slots),
+        usage_histogram.hourly_trends(slots, now),
+    )
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    print(f"Generating {args.entries} log entries...")
+    entries = generate_entries(args.entries, now)
+
+    expected, loop_seconds = timed(loops, entries, now)
+    result, histogram_seconds = timed(histogram, entries, now)
+
+    assert result == expected, "histogram output differs from the loops"
+    print(f"loops:     {loop_seconds:8.3f}s")
+    print(f"histogram: {histogram_seconds:8.3f}s")
+    print(f"speedup:   {loop_seconds / histogram_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
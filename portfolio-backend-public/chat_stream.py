@@ -0,0 +1,124 @@
+import asyncio
+import json
+import re
+
+
+class MessageStreamParser:
+    """Pulls the text of one string field out of streamed JSON-mode output.
+
+    The LLM answers with {"message": "...", "topics": [...]}. feed() takes
+    each raw chunk as it arrives and returns the newly completed part of the
+    "message" value, so it can be forwarded before the JSON object is
+    complete. result() parses the whole output once the stream has ended.
+    """
+
+    def __init__(self, field="message"):
+        self.field = field
+        self.buffer = ""
+        self.done = False
+        self._pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._pos = None
+
+    def feed(self, text):
+        self.buffer += text
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._pattern.search(self.buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buffer = self.buffer
+        index = complete = self._pos
+        while index < len(buffer):
+            char = buffer[index]
+            if char == '"':
+                self.done = True
+                break
+            if char != "\\":
+                index += 1
+            elif buffer[index + 1 : index + 2] == "u":
+                # \uXXXX, or a \uXXXX\uXXXX surrogate pair
+                if index + 6 > len(buffer):
+                    break
+                width = 12 if is_high_surrogate(buffer[index + 2 : index + 6]) else 6
+                if index + width > len(buffer):
+                    break
+                index += width
+            elif index + 1 < len(buffer):
+                index += 2
+            else:
+                break
+            complete = index
+
+        segment = buffer[self._pos : complete]
+        self._pos = complete
+        return decode_json_string(segment) if segment else ""
+
+    def result(self):
+        """Return (message, topics) for the complete output."""
+        try:
+            parsed = json.loads(self.buffer)
+            return parsed.get(self.field, self.buffer), parsed.get("topics", [])
+        except (json.JSONDecodeError, AttributeError) as e:
+            print(f"[MessageStreamParser] Error parsing LLM JSON response: {e}")
+            return self.buffer, []
+
+
+def is_high_surrogate(hex_digits):
+    try:
+        return 0xD800 <= int(hex_digits, 16) <= 0xDBFF
+    except ValueError:
+        return False
+
+
+def decode_json_string(segment):
+    try:
+        return json.loads(f'"{segment}"', strict=False)
+    except json.JSONDecodeError:
+        return segment
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def chunk_text(chunk):
+    choices = getattr(chunk, "choices", None) or []
+    if not choices:
+        return ""
+    delta = getattr(choices[0], "delta", None)
+    return getattr(delta, "content", None) or ""
+
+
+def chunk_usage(chunk):
+    usage = getattr(chunk, "usage", None)
+    if not usage:
+        return None
+    return usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+
+
+def iterate_async(async_iterable, runner=None):
+    """Drive an async iterator from a sync generator, for streamed responses.
+
+    Steps run on the runner's persistent loop when it is running, otherwise
+    on a private loop for this one response.
+    """
+    iterator = async_iterable.__aiter__()
+    if runner is not None and runner.running:
+        run, loop = runner.run, None
+    else:
+        loop = asyncio.new_event_loop()
+        run = loop.run_until_complete
+    try:
+        while True:
+            try:
+                yield run(iterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        if hasattr(iterator, "aclose"):
+            run(iterator.aclose())
+        if loop is not None:
+            loop.close()
@@ -0,0 +1,63 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+CachedContent = namedtuple("CachedContent", ["data", "body", "gzip_body", "etag"])
+
+
+class ContentCache:
+    """Keeps the JSON files under `directory` parsed and pre-serialized.
+
+    Each file is read once and kept as its parsed data, the serialized
+    response body, an optional gzipped copy and a strong ETag derived from
+    the body. A file is reloaded when its mtime or size changes, so edited
+    content is picked up without a restart.
+    """
+
+    def __init__(self, directory, dumps=json.dumps, compress=True):
+        self.directory = directory
+        self.dumps = dumps
+        self.compress = compress
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Return the CachedContent for `name`.
+
+        Raises FileNotFoundError or json.JSONDecodeError like reading the
+        file directly would.
+        """
+        path = os.path.join(self.directory, name)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._entries.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with self._lock:
+            cached = self._entries.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            entry = self._load(path)
+            self._entries[name] = (version, entry)
+            print(f"[ContentCache] Loaded {path} ({len(entry.body)} bytes)")
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _load(self, path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        body = (self.dumps(data) + "\n").encode("utf-8")
+        gzip_body = None
+        if self.compress and len(body) >= GZIP_MIN_SIZE:
+            gzip_body = gzip.compress(body, mtime=0)
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        return CachedContent(data, body, gzip_body, etag)
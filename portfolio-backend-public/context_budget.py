@@ -0,0 +1,82 @@
+import functools
+import tiktoken
+from prometheus_client import Counter
+
+llm_context_kept_tokens_total = Counter(
+    "llm_context_kept_tokens_total",
+    "Prompt tokens sent to the model after budget trimming",
+    ["model"],
+)
+llm_context_trimmed_tokens_total = Counter(
+    "llm_context_trimmed_tokens_total",
+    "Prompt tokens of history messages dropped to fit the context budget",
+    ["model"],
+)
+llm_context_trimmed_messages_total = Counter(
+    "llm_context_trimmed_messages_total",
+    "History messages dropped to fit the context budget",
+    ["model"],
+)
+
+# Tokens the chat format adds around every message (role and separators)
+MESSAGE_OVERHEAD = 4
+
+
+@functools.lru_cache(maxsize=1)
+def encoding():
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"[context_budget] tiktoken unavailable, estimating tokens: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def count_text_tokens(text):
+    """Tokens in `text` (cl100k_base); ~4 characters per token without tiktoken.
+
+    Cached, since the system prompt and earlier turns are counted again on
+    every request of a conversation.
+    """
+    tokenizer = encoding()
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text))
+
+
+def count_message_tokens(message):
+    return count_text_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def count_prompt_tokens(messages):
+    return sum(count_message_tokens(message) for message in messages)
+
+
+def fit_to_budget(messages, budget, model="unknown", pinned=1):
+    """Drop the oldest history messages until the prompt fits in `budget` tokens.
+
+    `messages` is [*pinned messages, *history, new user message], where the
+    first `pinned` messages are the system prompt and any context sent
+    alongside it. The pinned messages and the new message are always kept,
+    even when they alone exceed the budget; history is kept newest first for
+    as long as it fits. With no budget (None or 0) the messages are returned
+    unchanged.
+    """
+    counts = [count_message_tokens(message) for message in messages]
+    if not budget or sum(counts) <= budget:
+        llm_context_kept_tokens_total.labels(model=model).inc(sum(counts))
+        return messages
+    head, history, new_message = messages[:pinned], messages[pinned:-1], messages[-1]
+    used = sum(counts[:pinned]) + counts[-1]
+    keep_from = len(history)
+    while keep_from > 0 and used + counts[pinned + keep_from - 1] <= budget:
+        used += counts[pinned + keep_from - 1]
+        keep_from -= 1
+    trimmed = history[:keep_from]
+    llm_context_kept_tokens_total.labels(model=model).inc(used)
+    llm_context_trimmed_tokens_total.labels(model=model).inc(sum(counts) - used)
+    llm_context_trimmed_messages_total.labels(model=model).inc(len(trimmed))
+    print(
+        f"[fit_to_budget] Dropped {len(trimmed)} of {len(history)} history messages to fit {budget} tokens"
+    )
+    return [*head, *history[keep_from:], new_message]
@@ -0,0 +1,71 @@
+import json
+from prometheus_client import Counter
+from response_cache import RedisBacked, redis_client
+
+conversation_history_hits_total = Counter(
+    "conversation_history_hits_total",
+    "Conversation histories served from the hot-turn cache",
+)
+conversation_history_misses_total = Counter(
+    "conversation_history_misses_total",
+    "Conversation histories loaded from MongoDB",
+)
+
+
+class ConversationHistory(RedisBacked):
+    """The last `max_messages` messages of each conversation, in a Redis list.
+
+    Messages are {"role", "content", "seq"} dicts. get() falls back to
+    load(conversation_id, max_messages) (MongoDB) when the list is missing.
+    append() runs as soon as a reply is ready, before the MongoDB write.
+    """
+
+    def __init__(
+        self,
+        max_messages,
+        ttl,
+        load,
+        prefix="conversation",
+        client_factory=redis_client,
+    ):
+        super().__init__(client_factory)
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.load = load
+        self.prefix = prefix
+
+    def key(self, conversation_id):
+        return f"{self.prefix}:{conversation_id}:messages"
+
+    def get(self, conversation_id):
+        try:
+            cached = self.client.lrange(self.key(conversation_id), 0, -1)
+            if cached:
+                conversation_history_hits_total.inc()
+                return [json.loads(message) for message in cached]
+        except Exception as e:
+            print(f"[ConversationHistory] Failed to read {conversation_id}: {e}")
+        conversation_history_misses_total.inc()
+        messages = [
+            {
+                "role": message["role"],
+                "content": message["content"],
+                "seq": message["seq"],
+            }
+            for message in self.load(conversation_id, self.max_messages)
+        ]
+        self.append(conversation_id, messages)
+        return messages
+
+    def append(self, conversation_id, messages):
+        if not messages:
+            return
+        key = self.key(conversation_id)
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.rpush(key, *[json.dumps(message) for message in messages])
+            pipeline.ltrim(key, -self.max_messages, -1)
+            pipeline.expire(key, self.ttl)
+            pipeline.execute()
+        except Exception as e:
+            print(f"[ConversationHistory] Failed to append to {conversation_id}: {e}")
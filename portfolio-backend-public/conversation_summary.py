@@ -0,0 +1,131 @@
+import json
+import threading
+from prometheus_client import Counter
+from response_cache import RedisBacked, redis_client
+
+conversation_summaries_total = Counter(
+    "conversation_summaries_total", "Running conversation summaries generated"
+)
+conversation_summary_failures_total = Counter(
+    "conversation_summary_failures_total",
+    "Running conversation summaries that could not be generated",
+)
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a chat between a visitor and the assistant on Tomer's portfolio website.
+Fold the new messages below into the existing summary. Keep every fact, question and preference the assistant may need later, drop greetings and repetition, and write at most 200 words of plain text."""
+
+
+def summary_prompt(previous_summary, messages):
+    transcript = "\n".join(
+        f"{message['role']}: {message['content']}" for message in messages
+    )
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {
+            "role": "user",
+            "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}",
+        },
+    ]
+
+
+class ConversationSummaries(RedisBacked):
+    """Running summaries of long conversations, refreshed in the background.
+
+    A summary covers the messages before seq `through`. maybe_refresh()
+    queues a refresh on `queue` once keep_recent + batch messages are not
+    covered, so the newest keep_recent messages are always sent verbatim.
+    """
+
+    def __init__(
+        self,
+        keep_recent,
+        batch,
+        ttl,
+        queue,
+        complete,
+        load_state,
+        load_messages,
+        save,
+        prefix="conversation",
+        client_factory=redis_client,
+    ):
+        super().__init__(client_factory)
+        self.keep_recent = keep_recent
+        self.batch = batch
+        self.ttl = ttl
+        self.queue = queue
+        self.complete = complete
+        self.load_state = load_state
+        self.load_messages = load_messages
+        self.save = save
+        self.prefix = prefix
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.batch > 0
+
+    def key(self, conversation_id):
+        return f"{self.prefix}:{conversation_id}:summary"
+
+    def may_exist(self, message_count):
+        """A conversation this short has never been summarized."""
+        return self.enabled and message_count >= self.keep_recent + self.batch
+
+    def get(self, conversation_id):
+        """Return {"text", "through"}; text is None when there is no summary yet."""
+        try:
+            cached = self.client.get(self.key(conversation_id))
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as e:
+            print(f"[ConversationSummaries] Failed to read {conversation_id}: {e}")
+        state = self.load_state(conversation_id)
+        summary = {"text": state["summary"], "through": state["summary_through"]}
+        self._cache(conversation_id, summary)
+        return summary
+
+    def maybe_refresh(self, conversation_id, message_count):
+        if not self.may_exist(message_count):
+            return
+        summary = self.get(conversation_id)
+        if message_count - summary["through"] < self.keep_recent + self.batch:
+            return
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+        if not self.queue.submit(self.refresh, conversation_id):
+            with self._lock:
+                self._pending.discard(conversation_id)
+
+    def refresh(self, conversation_id):
+        try:
+            state = self.load_state(conversation_id)
+            previous = state["summary_through"]
+            # Based on what MongoDB has, which may trail the live conversation
+            # by a queued turn; the next turn will queue another refresh.
+            through = state["message_count"] - self.keep_recent
+            if through - previous < self.batch:
+                return
+            messages = self.load_messages(conversation_id, previous, through)
+            text = self.complete(summary_prompt(state["summary"], messages))
+            if self.save(conversation_id, text, through, previous):
+                self._cache(conversation_id, {"text": text, "through": through})
+                conversation_summaries_total.inc()
+                print(
+                    f"[ConversationSummaries] Summarized {conversation_id} through message {through}"
+                )
+        except Exception as e:
+            conversation_summary_failures_total.inc()
+            print(f"[ConversationSummaries] Failed to summarize {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(conversation_id)
+
+    def _cache(self, conversation_id, summary):
+        try:
+            self.client.set(self.key(conversation_id), json.dumps(summary), ex=self.ttl)
+        except Exception as e:
+            print(f"[ConversationSummaries] Failed to write {conversation_id}: {e}")
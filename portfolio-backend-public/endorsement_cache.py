@@ -0,0 +1,87 @@
+import json
+from prometheus_client import Counter
+from response_cache import RedisBacked, redis_client
+
+endorsement_cache_hits_total = Counter(
+    "endorsement_cache_hits_total",
+    "Endorsement lists served from the endorsement cache",
+    ["list"],
+)
+endorsement_cache_misses_total = Counter(
+    "endorsement_cache_misses_total",
+    "Endorsement lists loaded from MongoDB",
+    ["list"],
+)
+
+ALL = "all"
+
+
+class EndorsementCache(RedisBacked):
+    """Serialized endorsement lists, one for all skills and one per skill.
+
+    Each list's key includes a version that invalidate() bumps, so a list
+    loaded before a write can't be cached under the key read after it.
+    Version keys expire after twice `ttl` without reads or writes, by which
+    time every list cached under them has expired too.
+    """
+
+    def __init__(self, ttl, prefix="endorsements", client_factory=redis_client):
+        super().__init__(client_factory)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def version_key(self, skill_id=None):
+        return f"{self.prefix}:version:{ALL if skill_id is None else skill_id}"
+
+    def list_key(self, skill_id, version):
+        return f"{self.prefix}:list:{ALL if skill_id is None else skill_id}:{version}"
+
+    def get(self, skill_id=None):
+        """Return (endorsements, key); endorsements is None on a miss.
+
+        Pass the key back to set() so the list is stored under the version
+        that was current before it was loaded.
+        """
+        if not self.enabled:
+            return None, None
+        label = ALL if skill_id is None else "skill"
+        key = None
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.get(self.version_key(skill_id))
+            pipeline.expire(self.version_key(skill_id), 2 * self.ttl)
+            version, _ = pipeline.execute()
+            key = self.list_key(skill_id, version or 0)
+            cached = self.client.get(key)
+            if cached is not None:
+                endorsement_cache_hits_total.labels(list=label).inc()
+                return json.loads(cached), key
+        except Exception as e:
+            print(f"[EndorsementCache] Failed to read {skill_id or ALL}: {e}")
+        endorsement_cache_misses_total.labels(list=label).inc()
+        return None, key
+
+    def set(self, key, endorsements):
+        if not self.enabled or key is None:
+            return
+        try:
+            self.client.set(key, json.dumps(endorsements, default=str), ex=self.ttl)
+        except Exception as e:
+            print(f"[EndorsementCache] Failed to write {key}: {e}")
+
+    def invalidate(self, skill_id):
+        """Drop the cached all-skills list and the list for `skill_id`."""
+        if not self.enabled:
+            return
+        try:
+            pipeline = self.client.pipeline()
+            for version_key in (self.version_key(), self.version_key(skill_id)):
+                pipeline.incr(version_key)
+                pipeline.expire(version_key, 2 * self.ttl)
+            pipeline.execute()
+        except Exception as e:
+            print(f"[EndorsementCache] Failed to invalidate {skill_id}: {e}")
@@ -0,0 +1,78 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+from asgiref.sync import async_to_sync
+
+
+class EventLoopRunner:
+    """Runs coroutines from worker threads on one long-lived event loop.
+
+    Flask normally runs every async view in a fresh event loop, so clients
+    that pool connections per loop (httpx under litellm) reconnect on every
+    request. Once started, the runner owns a loop on a background thread;
+    async views and streamed responses are scheduled onto it with the
+    caller's context (so flask.request still works) and the calling thread
+    waits for the result. Until then it falls back to Flask's behaviour.
+
+    Every async view in the process shares the loop, so coroutines must not
+    block it: synchronous pymongo and Redis calls go through
+    asyncio.to_thread.
+    """
+
+    def __init__(self, name="event-loop"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name=self.name, daemon=True
+        )
+        self._thread.start()
+        print(f"[EventLoopRunner] Started persistent event loop '{self.name}'")
+
+    def stop(self):
+        if self.running:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        self._thread = None
+
+    def run(self, coro):
+        """Run `coro` on the persistent loop and block until it finishes."""
+        context = contextvars.copy_context()
+        result = concurrent.futures.Future()
+
+        def copy_result(task):
+            if task.cancelled():
+                result.cancel()
+            elif task.exception() is not None:
+                result.set_exception(task.exception())
+            else:
+                result.set_result(task.result())
+
+        def schedule():
+            task = self.loop.create_task(coro, context=context)
+            task.add_done_callback(copy_result)
+
+        self.loop.call_soon_threadsafe(schedule)
+        return result.result()
+
+    def async_to_sync(self, func):
+        """Drop-in replacement for Flask.async_to_sync."""
+        if not self.running:
+            return async_to_sync(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+
+        return wrapper
@@ -0,0 +1,95 @@
+import asyncio
+import collections
+import threading
+import time
+from prometheus_client import Counter
+
+llm_hedged_requests_total = Counter(
+    "llm_hedged_requests_total",
+    "LLM calls that were slower than the hedge delay and got a second call",
+)
+llm_hedge_wins_total = Counter(
+    "llm_hedge_wins_total",
+    "Hedged LLM calls by which call answered first",
+    ["winner"],
+)
+
+
+class HedgedCalls:
+    """Send a second copy of a slow call and use whichever answers first.
+
+    Latencies of successful calls, and of first calls cancelled because the
+    hedge won, are kept in a sliding window of `window` samples. Once
+    `min_samples` have been seen, a call that has not answered after the
+    window's `quantile` latency (p95 by default) is sent again and the first
+    successful answer wins; the other call is cancelled. A call that fails
+    before the hedge delay raises as usual, and a hedged request only fails
+    if both calls do. A quantile of 0 disables hedging.
+    """
+
+    def __init__(self, quantile=0.95, window=200, min_samples=20):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.quantile > 0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """Seconds to wait before hedging, or None until enough calls were seen."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not self.enabled or len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(self.quantile * len(latencies)))]
+
+    async def run(self, call):
+        """Return `await call()`, calling it a second time if the first is slow."""
+        delay = self.delay()
+        started = time.perf_counter()
+        if delay is None:
+            result = await call()
+            self.observe(time.perf_counter() - started)
+            return result
+        first = asyncio.ensure_future(call())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                self.observe(time.perf_counter() - started)
+                return first.result()
+            llm_hedged_requests_total.inc()
+            print(f"[HedgedCalls] No answer after {delay:.3f}s, sending a hedge")
+            hedge_started = time.perf_counter()
+            hedge = asyncio.ensure_future(call())
+            pending = {first, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    winner = "first" if task is first else "hedge"
+                    llm_hedge_wins_total.labels(winner=winner).inc()
+                    now = time.perf_counter()
+                    if task is not first:
+                        self.observe(now - hedge_started)
+                    # A first call that is still running gets cancelled; what
+                    # it took until now is a lower bound of its latency, and
+                    # leaving it out would pull the hedge delay down over time.
+                    if task is first or not first.done():
+                        self.observe(now - started)
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
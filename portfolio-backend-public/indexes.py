@@ -0,0 +1,134 @@
+from collections import namedtuple
+from pymongo.errors import OperationFailure
+
+IndexSpec = namedtuple("IndexSpec", ["collection", "keys", "options"])
+
+# Server error codes for an existing index that differs only in its options
+INDEX_OPTIONS_CONFLICTS = (85, 86)
+
+
+def index(collection, keys, **options):
+    """Declare an index; `keys` is a field name or a list of (field, direction)."""
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    options.setdefault("name", "_".join(f"{field}_{way}" for field, way in keys))
+    return IndexSpec(collection, list(keys), options)
+
+
+def key_pattern(keys):
+    """Comparable form of an index key, from a spec or from list_indexes()."""
+    return tuple(
+        (field, int(way) if isinstance(way, (int, float)) else way)
+        for field, way in keys
+    )
+
+
+def ensure_indexes(db, specs):
+    """Create every declared index that is missing.
+
+    create_index is a no-op for an index that already exists with the same
+    options, so this is safe to run on every start. An existing plain index
+    that is now declared with expireAfterSeconds or unique is converted in
+    place. An index that cannot be built (other conflicting options,
+    duplicate keys under a unique index) is reported and skipped. Returns
+    the names of the indexes that failed.
+    """
+    failed = []
+    for spec in specs:
+        try:
+            try:
+                db[spec.collection].create_index(spec.keys, **spec.options)
+            except OperationFailure as e:
+                if e.code not in INDEX_OPTIONS_CONFLICTS:
+                    raise
+                if "expireAfterSeconds" in spec.options:
+                    set_expiry(db, spec)
+                elif spec.options.get("unique"):
+                    set_unique(db, spec)
+                else:
+                    raise
+        except OperationFailure as e:
+            print(
+                f"[ensure_indexes] Could not create {spec.collection}.{spec.options['name']}: {e}"
+            )
+            failed.append(f"{spec.collection}.{spec.options['name']}")
+    print(f"[ensure_indexes] Ensured {len(specs) - len(failed)}/{len(specs)} indexes")
+    return failed
+
+
+def set_expiry(db, spec):
+    """Add or change expireAfterSeconds on an existing index with collMod."""
+    print(
+        f"[ensure_indexes] Setting expireAfterSeconds on {spec.collection}.{spec.options['name']}"
+    )
+    db.command(
+        "collMod",
+        spec.collection,
+        index={
+            "keyPattern": dict(spec.keys),
+            "expireAfterSeconds": spec.options["expireAfterSeconds"],
+        },
+    )
+
+
+def set_unique(db, spec):
+    """Make an existing index unique with collMod (MongoDB 6.0+).
+
+    prepareUnique first makes the index reject new duplicates; the second
+    step fails if duplicates already exist, which leaves the index as it was
+    and is reported like any other index that could not be built.
+    """
+    print(f"[ensure_indexes] Making {spec.collection}.{spec.options['name']} unique")
+    for option in ("prepareUnique", "unique"):
+        db.command(
+            "collMod",
+            spec.collection,
+            index={"keyPattern": dict(spec.keys), option: True},
+        )
+
+
+def index_report(db, specs):
+    """Compare the declared indexes with what each collection actually has.
+
+    For every collection with declared indexes, lists the declared indexes
+    that are missing, the indexes that exist without being declared, and
+    the indexes that $indexStats shows as never used. $indexStats counts
+    from the last mongod restart, so check `since` before dropping anything.
+    """
+    report = {}
+    for collection in sorted({spec.collection for spec in specs}):
+        declared = {
+            key_pattern(spec.keys): spec.options["name"]
+            for spec in specs
+            if spec.collection == collection
+        }
+        existing = {
+            key_pattern(info["key"].items()): info["name"]
+            for info in db[collection].list_indexes()
+        }
+        usage = {}
+        try:
+            for stats in db[collection].aggregate([{"$indexStats": {}}]):
+                usage[stats["name"]] = {
+                    "ops": stats["accesses"]["ops"],
+                    "since": stats["accesses"]["since"],
+                }
+        except OperationFailure as e:
+            print(f"[index_report] $indexStats failed for {collection}: {e}")
+        report[collection] = {
+            "missing": [
+                name for pattern, name in declared.items() if pattern not in existing
+            ],
+            "undeclared": [
+                name
+                for pattern, name in existing.items()
+                if pattern not in declared and name != "_id_"
+            ],
+            "unused": [
+                name
+                for name, stats in usage.items()
+                if stats["ops"] == 0 and name != "_id_"
+            ],
+            "usage": usage,
+        }
+    return report
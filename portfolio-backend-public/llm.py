@@ -1,6 +1,14 @@
+import hashlib
+import json
 import os
+import threading
+import time
+import tiktoken
 from dotenv import load_dotenv
 from litellm import Router
+from prometheus_client import Counter, Gauge
+from hedging import HedgedCalls
+from rate_limiter import RateLimiter
 
 # Load environment variables
 load_dotenv()
@@ -21,46 +29,123 @@ model_list = [
         "litellm_params": {
             "model": f"gemini/{os.getenv('GOOGLE_MODEL_NAME', 'gemini-2.0-flash-lite')}",
             "api_key": os.getenv("GOOGLE_API_KEY"),
-            "tpm": 100000,
-            "rpm": 1000,
         },
         "model_info": {
             "base_model": os.getenv("GOOGLE_MODEL_NAME", "gemini-2.0-flash-lite"),
+            # Prompt tokens (system prompt + history + new message) per request;
+            # older history is dropped to stay under it. 0 means no limit.
+            "context_budget": int(os.getenv("LLM_CONTEXT_BUDGET", 16000)),
+            # Requests and tokens per minute across all pods, enforced by
+            # rate_limiter.RateLimiter instead of per-call router checks.
+            # 0 means no limit.
+            "rpm": int(os.getenv("LLM_RPM", 1000)),
+            "tpm": int(os.getenv("LLM_TPM", 100000)),
         },
     },
 ]
 
+# Extra deployments of the chat model, as a JSON list of litellm_params, e.g.
+# '[{"model": "openai/gemini-2.0-flash-lite", "api_base": "http://proxy:4000/v1"}]'.
+# The router spreads requests over all deployments of a model by latency.
+for litellm_params in json.loads(os.getenv("LLM_EXTRA_DEPLOYMENTS", "[]")):
+    model_list.append({**model_list[0], "litellm_params": litellm_params})
+
+# Models tried in order when every deployment of the chat model fails, in the
+# same format as LLM_EXTRA_DEPLOYMENTS. The router calls them inside a call to
+# the chat model, which is what the rate limit is charged to, so they get no
+# rpm/tpm of their own.
+fallback_models = []
+for n, litellm_params in enumerate(json.loads(os.getenv("LLM_FALLBACKS", "[]"))):
+    fallback_models.append(f"{model_list[0]['model_name']}-fallback-{n}")
+    model_list.append(
+        {
+            **model_list[0],
+            "model_name": fallback_models[-1],
+            "litellm_params": litellm_params,
+            "model_info": {
+                key: value
+                for key, value in model_list[0]["model_info"].items()
+                if key not in ("rpm", "tpm")
+            },
+        }
+    )
+
+
+def get_context_budget(model):
+    """Prompt token budget configured for `model` in model_list, or None."""
+    for deployment in model_list:
+        if deployment["model_name"] == model:
+            return deployment.get("model_info", {}).get("context_budget")
+    return None
+
+
+def build_rate_limiters(model_list, block):
+    """One RateLimiter per model, with the limits of its deployments added up."""
+    limits = {}
+    for deployment in model_list:
+        info = deployment.get("model_info", {})
+        rpm, tpm = limits.get(deployment["model_name"], (0, 0))
+        limits[deployment["model_name"]] = (
+            rpm + info.get("rpm", 0),
+            tpm + info.get("tpm", 0),
+        )
+    return {
+        model: RateLimiter(model, rpm, tpm, block)
+        for model, (rpm, tpm) in limits.items()
+        if rpm or tpm
+    }
+
+
+# Rate-limit capacity is reserved from Redis in blocks of LLM_RATE_LIMIT_BLOCK
+# of each per-minute limit (0.05 = 5%)
+rate_limiters = build_rate_limiters(
+    model_list, float(os.getenv("LLM_RATE_LIMIT_BLOCK", 0.05))
+)
+
+
+def get_rate_limiter(model):
+    """RateLimiter for `model`, or None when it has no limits."""
+    return rate_limiters.get(model)
+
+
 router = Router(
     model_list=model_list,
     redis_host=redis_host,
     redis_port=redis_port,
     redis_password=redis_password,
-    routing_strategy="usage-based-routing-v2",  # Usage-based routing
-    enable_pre_call_checks=True,  # Rate limit checks
+    # Pick the deployment with the lowest recent latency
+    routing_strategy=os.getenv("LLM_ROUTING_STRATEGY", "latency-based-routing"),
+    enable_pre_call_checks=True,  # Context window checks
+    fallbacks=(
+        [{model_list[0]["model_name"]: fallback_models}] if fallback_models else []
+    ),
 )
 
+# Chat completions slower than the LLM_HEDGE_QUANTILE latency of recent calls
+# (0.95 = p95) are sent a second time and the first answer wins; 0 disables
+# hedging. The router routes the second call by latency like any other.
+hedged_calls = HedgedCalls(
+    quantile=float(os.getenv("LLM_HEDGE_QUANTILE", 0)),
+    min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20)),
+)
 
-def load_context():
-    print("[load_context] Called")
-    context_path = os.path.join(
-        os.path.dirname(__file__), "external_context", "context.md"
-    )
-    print(f"[load_context] context_path={context_path}")
-    if not os.path.exists(context_path):
-        print(f"[load_context] Context file not found at {context_path}")
-        raise FileNotFoundError(f"Context file not found at {context_path}")
-    with open(context_path, "r", encoding="utf-8") as file:
-        context = file.read()
-    print("[load_context] Context loaded successfully.")
-    return context
 
+# Seconds between checks of context.md for changes; 0 disables hot reload
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", 30))
+CONTEXT_PATH = os.path.join(os.path.dirname(__file__), "external_context", "context.md")
 
-def get_context_prompt():
-    print("[get_context_prompt] Called")
-    try:
-        context = load_context()
-        print("[get_context_prompt] Context loaded")
-        prompt = f"""
+system_prompt_tokens = Gauge(
+    "llm_system_prompt_tokens", "Tokens in the compiled system prompt (cl100k_base)"
+)
+system_prompt_compile_seconds = Gauge(
+    "llm_system_prompt_compile_seconds",
+    "Time taken by the last system prompt compilation",
+)
+system_prompt_compiles_total = Counter(
+    "llm_system_prompt_compiles_total", "System prompt compilations"
+)
+
+SYSTEM_PROMPT_TEMPLATE = """
 You are an advanced and friendly AI assistant specifically designed to answer questions about Tomer.
 You reside inside the chat window of Tomer's portfolio website.
 Your primary job is to provide accurate, helpful, and engaging answers based strictly on the context provided below.
@@ -106,8 +191,114 @@ The "topics" field should contain an array of 3-5 relevant topics/keywords that
 *** From this point on, the conversation begins. ***
 
 """
-        print("[get_context_prompt] Prompt generated")
+
+
+def load_context():
+    print("[load_context] Called")
+    context_path = CONTEXT_PATH
+    print(f"[load_context] context_path={context_path}")
+    if not os.path.exists(context_path):
+        print(f"[load_context] Context file not found at {context_path}")
+        raise FileNotFoundError(f"Context file not found at {context_path}")
+    with open(context_path, "r", encoding="utf-8") as file:
+        context = file.read()
+    print("[load_context] Context loaded successfully.")
+    return context
+
+
+def count_tokens(text):
+    try:
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except Exception as e:
+        print(f"[count_tokens] Exception: {e}")
+        return None
+
+
+class PromptRegistry:
+    """Holds the compiled system prompt.
+
+    The prompt is built from context.md once and then served from memory; a
+    watcher thread recompiles it when the file's mtime changes, so chat
+    requests never touch the filesystem.
+    """
+
+    def __init__(self, path, template, reload_interval):
+        self.path = path
+        self.template = template
+        self.reload_interval = reload_interval
+        self.prompt = None
+        self.tokens = None
+        self.version = None
+        self.digest = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def compile(self):
+        started = time.perf_counter()
+        with self._lock:
+            version = os.stat(self.path).st_mtime_ns
+            prompt = self.template.format(context=load_context())
+            self.prompt, self.tokens, self.version, self.digest = (
+                prompt,
+                count_tokens(prompt),
+                version,
+                hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            )
+        elapsed = time.perf_counter() - started
+        system_prompt_compile_seconds.set(elapsed)
+        system_prompt_compiles_total.inc()
+        if self.tokens is not None:
+            system_prompt_tokens.set(self.tokens)
+        print(
+            f"[PromptRegistry] Compiled system prompt: {len(prompt)} chars, {self.tokens} tokens in {elapsed:.4f}s"
+        )
+        return prompt
+
+    def get(self):
+        prompt = self.prompt
+        if prompt is None:
+            prompt = self.compile()
         return prompt
+
+    def reload_if_changed(self):
+        try:
+            if os.stat(self.path).st_mtime_ns != self.version:
+                self.compile()
+        except Exception as e:
+            print(f"[PromptRegistry] Failed to reload system prompt: {e}")
+
+    def start(self):
+        if self.reload_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._watch, name="prompt-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            self.reload_if_changed()
+
+
+prompt_registry = PromptRegistry(
+    CONTEXT_PATH, SYSTEM_PROMPT_TEMPLATE, PROMPT_RELOAD_INTERVAL
+)
+try:
+    prompt_registry.compile()
+except Exception as e:
+    print(f"[llm.py] Failed to compile system prompt at startup: {e}")
+
+
+def get_context_prompt():
+    try:
+        return prompt_registry.get()
     except Exception as e:
         print(f"[get_context_prompt] Exception: {e}")
         raise
+
+
+def get_prompt_version():
+    """Digest of the current system prompt; changes whenever it is recompiled."""
+    prompt_registry.get()
+    return prompt_registry.digest
@@ -0,0 +1,280 @@
+import atexit
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from prometheus_client import Counter, Gauge
+
+emails_sent_total = Counter("emails_sent_total", "Emails delivered to the SMTP server")
+emails_failed_total = Counter(
+    "emails_failed_total", "Emails given up on after all delivery attempts"
+)
+email_queue_depth = Gauge("email_queue_depth", "Emails waiting to be delivered")
+
+
+class SMTPPool:
+    """Keeps up to `size` authenticated SMTP connections open for reuse.
+
+    Credentials are read through the `credentials` callable each time a
+    connection is opened. Idle connections are checked with NOOP before they
+    are reused and replaced if the server has dropped them.
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        credentials,
+        size=2,
+        starttls=True,
+        timeout=30,
+        idle_check=60,
+    ):
+        self.host = host
+        self.port = port
+        self.credentials = credentials
+        self.size = size
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        print(f"[SMTPPool] Connecting to SMTP server {self.host}:{self.port}")
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            username, password = self.credentials()
+            if username:
+                server.login(username, password)
+        except Exception:
+            close_quietly(server)
+            raise
+        return server
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return self._connect()
+                server, released_at = self._idle.pop()
+            if time.monotonic() - released_at < self.idle_check:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            close_quietly(server)
+
+    @contextmanager
+    def connection(self, reuse=True):
+        """Yield an authenticated connection; with reuse=False it is closed afterwards."""
+        server = self._checkout() if reuse else self._connect()
+        try:
+            yield server
+        except Exception:
+            close_quietly(server)
+            raise
+        if not reuse:
+            close_quietly(server)
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((server, time.monotonic()))
+                return
+        close_quietly(server)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            close_quietly(server)
+
+
+def close_quietly(server):
+    try:
+        server.quit()
+    except Exception:
+        try:
+            server.close()
+        except Exception:
+            pass
+
+
+def is_permanent(error):
+    """5xx replies (bad recipient, rejected message) won't succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class Mailer:
+    """Delivers emails from a background queue over an SMTPPool.
+
+    send() enqueues the message and returns at once; worker threads deliver
+    it, retrying transient failures with exponential backoff. Every status
+    change (queued, retrying, sent, failed) is passed to on_status from a
+    worker thread, so send() never waits on it. Until start() is called,
+    send() delivers inline on a fresh connection.
+    """
+
+    def __init__(
+        self,
+        pool,
+        on_status=None,
+        workers=2,
+        max_attempts=4,
+        backoff=2.0,
+        max_queue=1000,
+    ):
+        self.pool = pool
+        self.on_status = on_status
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._retries = {}
+        self._retries_lock = threading.Lock()
+        self._stopping = False
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def send(self, from_address, to_address, message):
+        """Queue a message; returns the delivery id, or None if it was not accepted."""
+        delivery = {
+            "id": uuid.uuid4().hex,
+            "from": from_address,
+            "to": to_address,
+            "message": message,
+            "attempts": 0,
+        }
+        if not self.running:
+            return delivery["id"] if self._deliver(delivery, reuse=False) else None
+        try:
+            self._queue.put_nowait(delivery)
+        except queue.Full:
+            print(f"[Mailer] Queue full, rejecting email to {to_address}")
+            return None
+        email_queue_depth.inc()
+        return delivery["id"]
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"mailer-{index}", daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        atexit.register(self.stop)
+        print(f"[Mailer] Started {self.workers} delivery workers")
+
+    def stop(self, timeout=30):
+        """Deliver what is already queued, then stop the workers.
+
+        Deliveries waiting for a retry are not retried; they are marked failed.
+        """
+        with self._retries_lock:
+            self._stopping = True
+            retries, self._retries = self._retries, {}
+        for retry, delivery in retries.items():
+            retry.cancel()
+            emails_failed_total.inc()
+            self._status(delivery, "failed", error="Mailer stopped before retry")
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._threads = []
+        self.pool.close()
+
+    def _run(self):
+        while True:
+            delivery = self._queue.get()
+            if delivery is None:
+                return
+            email_queue_depth.dec()
+            if delivery["attempts"] == 0:
+                self._status(delivery, "queued")
+            self._deliver(delivery)
+
+    def _deliver(self, delivery, reuse=True):
+        delivery["attempts"] += 1
+        try:
+            with self.pool.connection(reuse=reuse) as server:
+                server.sendmail(delivery["from"], delivery["to"], delivery["message"])
+        except Exception as e:
+            print(
+                f"[Mailer] Attempt {delivery['attempts']} to {delivery['to']} failed: {e}"
+            )
+            if (
+                reuse
+                and delivery["attempts"] < self.max_attempts
+                and not is_permanent(e)
+            ):
+                delay = self.backoff * 2 ** (delivery["attempts"] - 1)
+                self._status(delivery, "retrying", error=str(e))
+                self._schedule_retry(delivery, delay)
+            else:
+                emails_failed_total.inc()
+                self._status(delivery, "failed", error=str(e))
+            return False
+        emails_sent_total.inc()
+        self._status(delivery, "sent")
+        print(f"[Mailer] Email sent successfully to {delivery['to']}")
+        return True
+
+    def _schedule_retry(self, delivery, delay):
+        with self._retries_lock:
+            if not self._stopping:
+                retry = threading.Timer(delay, self._requeue)
+                retry.args = (retry,)
+                retry.daemon = True
+                self._retries[retry] = delivery
+                retry.start()
+                return
+        emails_failed_total.inc()
+        self._status(delivery, "failed", error="Mailer stopped before retry")
+
+    def _requeue(self, retry):
+        with self._retries_lock:
+            delivery = self._retries.pop(retry, None)
+        if delivery is None:
+            return  # Cancelled by stop()
+        try:
+            self._queue.put_nowait(delivery)
+            email_queue_depth.inc()
+        except queue.Full:
+            emails_failed_total.inc()
+            self._status(delivery, "failed", error="Queue full on retry")
+
+    def _status(self, delivery, status, error=None):
+        if self.on_status is None:
+            return
+        try:
+            self.on_status(
+                delivery["id"],
+                {
+                    "to": delivery["to"],
+                    "status": status,
+                    "attempts": delivery["attempts"],
+                    "error": error,
+                    "updated_at": datetime.utcnow(),
+                },
+            )
+        except Exception as e:
+            print(f"[Mailer] Failed to record delivery status: {e}")
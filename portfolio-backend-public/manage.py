@@ -0,0 +1,98 @@
+"""Maintenance commands for the portfolio backend.
+
+Usage:
+    python manage.py rebuild-rollups
+    python manage.py migrate-llm-usage
+    python manage.py migrate-conversations [--layout turns]
+    python manage.py ensure-indexes
+    python manage.py index-report
+"""
+
+import argparse
+import json
+
+
+def rebuild_rollups(args):
+    from mongo import rebuild_metrics_rollups
+
+    rebuild_metrics_rollups()
+
+
+def migrate_llm_usage(args):
+    from mongo import migrate_llm_usage_to_buckets
+
+    migrate_llm_usage_to_buckets()
+
+
+def migrate_conversations(args):
+    from mongo import migrate_conversations
+
+    migrate_conversations(args.layout)
+
+
+def ensure_indexes(args):
+    from mongo import INDEXES, db
+    from indexes import ensure_indexes
+
+    if ensure_indexes(db, INDEXES):
+        raise SystemExit(1)
+
+
+def index_report(args):
+    from mongo import INDEXES, db
+    from indexes import index_report
+
+    print(json.dumps(index_report(db, INDEXES), indent=2, default=str))
+
+
+COMMANDS = {
+    "rebuild-rollups": (
+        rebuild_rollups,
+        "Recompute the metrics rollup documents from the raw collections",
+    ),
+    "migrate-llm-usage": (
+        migrate_llm_usage,
+        "Split the embedded llm_usage logs arrays into hourly usage buckets",
+    ),
+    "migrate-conversations": (
+        migrate_conversations,
+        "Add message counts and optionally move messages to per-turn documents",
+    ),
+    "ensure-indexes": (
+        ensure_indexes,
+        "Create the indexes declared in mongo.INDEXES that are missing",
+    ),
+    "index-report": (
+        index_report,
+        "List missing, undeclared and unused indexes (from $indexStats)",
+    ),
+}
+
+ARGUMENTS = {
+    "migrate-conversations": [
+        (
+            ("--layout",),
+            {
+                "choices": ["embedded", "turns"],
+                "default": "embedded",
+                "help": "Target conversation storage layout",
+            },
+        )
+    ],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Portfolio backend maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (handler, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flags, options in ARGUMENTS.get(name, []):
+            subparser.add_argument(*flags, **options)
+        subparser.set_defaults(handler=handler)
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import threading
+import time
+from prometheus_client import Gauge, Histogram
+
+metrics_snapshot_age_seconds = Gauge(
+    "metrics_snapshot_age_seconds",
+    "Seconds since the metrics snapshot was last refreshed successfully",
+)
+metrics_collection_duration_seconds = Histogram(
+    "metrics_collection_duration_seconds",
+    "Time spent collecting the metrics snapshot from MongoDB",
+)
+
+
+class MetricsCollector:
+    """Refreshes the Prometheus metrics snapshot on a background thread.
+
+    Scrapes are served from whatever the last successful refresh published,
+    so a slow database makes the snapshot older instead of the scrape slower.
+    """
+
+    def __init__(self, refresh_snapshot, interval):
+        self.refresh_snapshot = refresh_snapshot
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self.last_success = None
+        self._stop = threading.Event()
+        self._thread = None
+        metrics_snapshot_age_seconds.set_function(self.snapshot_age)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot_age(self):
+        return time.monotonic() - (self.last_success or self.started_at)
+
+    def refresh(self):
+        started = time.perf_counter()
+        try:
+            self.refresh_snapshot()
+            self.last_success = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"[MetricsCollector] Failed to refresh metrics snapshot: {e}")
+            return False
+        finally:
+            metrics_collection_duration_seconds.observe(time.perf_counter() - started)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-collector", daemon=True
+        )
+        self._thread.start()
+        print(f"[MetricsCollector] Started with interval={self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
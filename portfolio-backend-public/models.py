@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -15,7 +15,8 @@ class ChatResponse(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    # Omit to have the server supply the history stored for conversationId
+    messages: Optional[List[ChatMessage]] = None
     newMessage: str
     conversationId: str
 
@@ -62,3 +63,8 @@ class Endorsement(BaseModel):
     email: str
     message: str
     timestamp: datetime
+
+
+class EndorsementPageQuery(BaseModel):
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None
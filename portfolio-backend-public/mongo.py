@@ -1,13 +1,24 @@
-from pymongo import MongoClient, UpdateOne
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
-import json
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import secrets
+import uuid
+import base64
+import json
 import string
 from bson import ObjectId
 import sys
 from unittest.mock import MagicMock
+from collections import Counter
+import rollups
+import usage_histogram
+from batch_writer import BatchWriter, PartialBatchError
+from write_queue import WriteQueue
+from skill_registry import get_skill_names
+from indexes import index, ensure_indexes
+from endorsement_cache import EndorsementCache
 
 
 # Load environment variables explicitly
@@ -16,6 +27,60 @@ load_dotenv()
 # MongoDB Configuration
 MONGO_URI = os.getenv("MONGO_URI")
 MODEL = os.getenv("GOOGLE_MODEL_NAME")
+# Raw LLM calls kept per hourly usage bucket (the counters cover every call)
+LLM_USAGE_SAMPLE_SIZE = int(os.getenv("LLM_USAGE_SAMPLE_SIZE", 20))
+# Seconds to coalesce LLM usage events before writing them; 0 writes each one
+LLM_USAGE_FLUSH_INTERVAL = float(os.getenv("LLM_USAGE_FLUSH_INTERVAL", 0))
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", 500))
+LLM_USAGE_QUEUE_SIZE = int(os.getenv("LLM_USAGE_QUEUE_SIZE", 10000))
+LLM_USAGE_SPILL_PATH = os.getenv("LLM_USAGE_SPILL_PATH")
+# Batch ids remembered per usage bucket to make replays of spilled batches safe
+LLM_USAGE_BATCH_HISTORY = int(os.getenv("LLM_USAGE_BATCH_HISTORY", 1000))
+# API call telemetry is buffered and written in batches (see batch_writer.py)
+API_CALL_BATCH_SIZE = int(os.getenv("API_CALL_BATCH_SIZE", 100))
+API_CALL_FLUSH_INTERVAL = float(os.getenv("API_CALL_FLUSH_INTERVAL", 2))
+API_CALL_QUEUE_SIZE = int(os.getenv("API_CALL_QUEUE_SIZE", 10000))
+# Records that overflow the queue go here; leave unset to drop them instead
+API_CALL_SPILL_PATH = os.getenv("API_CALL_SPILL_PATH")
+EMAIL_DELIVERY_RETENTION_DAYS = int(os.getenv("EMAIL_DELIVERY_RETENTION_DAYS", 30))
+CHAT_WRITE_WORKERS = int(os.getenv("CHAT_WRITE_WORKERS", 2))
+# "embedded" keeps each conversation's messages in one array; "turns" stores
+# one document per turn in conversation_turns (run migrate-conversations first)
+CONVERSATION_STORAGE = os.getenv("CONVERSATION_STORAGE", "embedded")
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", 1000))
+# Serialized endorsement lists are cached in Redis for this long; 0 disables it
+ENDORSEMENT_CACHE_TTL = int(os.getenv("ENDORSEMENT_CACHE_TTL", 3600))
+# Create missing indexes on startup; otherwise run `python manage.py ensure-indexes`
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "true").lower() == "true"
+
+# Every query in this module should be served by one of these indexes
+INDEXES = [
+    # verify_otp: equality on email/action/target_id/otp, range on expiry;
+    # store_otp's supersede update uses the email/action/target_id prefix
+    index(
+        "otp_codes",
+        [("email", 1), ("action", 1), ("target_id", 1), ("otp", 1), ("expiry", 1)],
+    ),
+    # The TTL monitor deletes codes once they expire (also serves the active count)
+    index("otp_codes", "expiry", expireAfterSeconds=0),
+    # Keyset pages of all endorsements and of one skill (newest first); the
+    # skill index also serves the unpaginated per-skill listing
+    index("endorsements", [("timestamp", -1), ("_id", -1)]),
+    index("endorsements", [("skillId", 1), ("timestamp", -1), ("_id", -1)]),
+    # Unique so concurrent first turns of a conversation upsert one document
+    index("conversations", "conversation_id", unique=True),
+    # Active conversation counts in get_metrics_data
+    index("conversations", "updated_at"),
+    index("conversation_turns", [("conversation_id", 1), ("seq", 1)], unique=True),
+    index("llm_usage_buckets", "hour"),
+    index("metrics_rollups", [("granularity", 1), ("bucket", 1)]),
+    index("metrics_rollups", "expires_at", expireAfterSeconds=0),
+    index(
+        "email_deliveries",
+        "created_at",
+        expireAfterSeconds=EMAIL_DELIVERY_RETENTION_DAYS * 86400,
+    ),
+]
 
 print(f"MongoDB URI: {MONGO_URI}")  # Debugging Line
 print(f"Model: {MODEL}")  # Debugging Line
@@ -33,11 +98,17 @@ if not RUNNING_TESTS:
         db = client.mydatabase  # The main database
         # Collections
         conversations_collection = db.conversations  # For chat messages
+        conversation_turns_collection = db.conversation_turns  # Per-turn messages
         exports_collection = db.exports  # For exported chats
-        llm_usage_collection = db.llm_usage  # For LLM usage logging
+        llm_usage_collection = db.llm_usage  # Pre-bucket per-model usage documents
+        llm_usage_buckets_collection = db.llm_usage_buckets  # Hourly LLM usage
         endorsements_collection = db.endorsements  # For endorsements
         otp_collection = db.otp_codes  # For OTP verification
         api_calls_collection = db.api_calls  # For API call tracking
+        metrics_rollups_collection = db.metrics_rollups  # For pre-aggregated metrics
+        email_deliveries_collection = db.email_deliveries  # For email delivery status
+        if ENSURE_INDEXES:
+            ensure_indexes(db, INDEXES)
     except Exception as e:
         print(f"[mongo.py] Failed to connect to MongoDB: {e}")
         raise SystemExit(f"Failed to connect to MongoDB: {e}")
@@ -45,30 +116,47 @@ else:
     client = None
     db = None
     conversations_collection = MagicMock()
+    conversation_turns_collection = MagicMock()
     exports_collection = MagicMock()
     llm_usage_collection = MagicMock()
+    llm_usage_buckets_collection = MagicMock()
     endorsements_collection = MagicMock()
     otp_collection = MagicMock()
     api_calls_collection = MagicMock()
+    metrics_rollups_collection = MagicMock()
+    email_deliveries_collection = MagicMock()
     print("[mongo.py] Using MagicMock for all MongoDB collections in test mode.")
 
 
-def get_skill_name_by_id(skill_id):
-    print(f"[get_skill_name_by_id] Called with skill_id={skill_id}")
+def record_rollup(counters, when=None, totals_only=False):
+    """Apply counter increments to the metrics rollup documents."""
+    try:
+        updates = rollups.build_updates(counters, when, totals_only=totals_only)
+        if updates:
+            metrics_rollups_collection.bulk_write(
+                [UpdateOne(query, update, upsert=True) for query, update in updates],
+                ordered=False,
+            )
+    except Exception as e:
+        print(f"[record_rollup] Exception: {e}")
+
+
+def record_rollups(entries):
+    """Apply several (counters, when) increments with a single bulk write."""
     try:
-        skills_path = os.path.join("external_context", "skills.json")
-        with open(skills_path, "r", encoding="utf-8") as file:
-            skills_data = json.load(file)
-        for category in skills_data["skillCategories"]:
-            for skill in category["skills"]:
-                if skill["id"] == skill_id:
-                    print(f"[get_skill_name_by_id] Found skill name: {skill['name']}")
-                    return skill["name"]
-        print(f"[get_skill_name_by_id] Skill name not found, returning skill_id")
-        return skill_id  # Return ID if name not found
+        pending = {}
+        for counters, when in entries:
+            rollups.merge_updates(rollups.build_updates(counters, when), pending)
+        if pending:
+            metrics_rollups_collection.bulk_write(
+                [
+                    UpdateOne({"_id": bucket}, update, upsert=True)
+                    for bucket, update in pending.items()
+                ],
+                ordered=False,
+            )
     except Exception as e:
-        print(f"[get_skill_name_by_id] Exception: {e}")
-        return skill_id
+        print(f"[record_rollups] Exception: {e}")
 
 
 def generate_otp():
@@ -84,14 +172,9 @@ def store_otp(email, action, otp, target_id=None):
     )
     expiry_time = datetime.utcnow() + timedelta(minutes=10)
     try:
-        otp_collection.update_many(
-            {
-                "email": email.lower(),
-                "action": action,
-                "target_id": target_id,
-                "deleted": {"$ne": True},
-            },
-            {"$set": {"deleted": True, "deleted_at": datetime.utcnow()}},
+        # A new code replaces any earlier one for the same request
+        superseded = otp_collection.delete_many(
+            {"email": email.lower(), "action": action, "target_id": target_id}
         )
         otp_data = {
             "email": email.lower(),
@@ -100,9 +183,16 @@ def store_otp(email, action, otp, target_id=None):
             "expiry": expiry_time,
             "target_id": target_id,
             "created_at": datetime.utcnow(),
-            "deleted": False,
         }
         otp_collection.insert_one(otp_data)
+        record_rollup(
+            {
+                rollups.counter_key("otp", "generated"): 1,
+                rollups.counter_key("otp", "action", action): 1,
+                rollups.counter_key("otp", "superseded"): superseded.deleted_count,
+            },
+            when=otp_data["created_at"],
+        )
         print(f"[store_otp] OTP stored for {email} with action {action}")
     except Exception as e:
         print(f"[store_otp] Exception: {e}")
@@ -120,19 +210,16 @@ def verify_otp(email, action, otp, target_id=None):
             "otp": otp,
             "target_id": target_id,
             "expiry": {"$gt": current_time},
+            # Codes used before they were hard-deleted are still soft-deleted
             "deleted": {"$ne": True},
         }
         print(f"[verify_otp] Query: {query}")
-        otp_doc = otp_collection.find_one(query)
+        # Deleting the code as it is matched makes it single-use
+        otp_doc = otp_collection.find_one_and_delete(query)
         print(f"[verify_otp] otp_doc found: {otp_doc}")
         if otp_doc:
-            update_result = otp_collection.update_one(
-                {"_id": otp_doc["_id"]},
-                {"$set": {"deleted": True, "deleted_at": datetime.utcnow()}},
-            )
-            print(
-                f"[verify_otp] OTP verified and marked as deleted for {email}, update_result: {update_result.raw_result}"
-            )
+            record_rollup({rollups.counter_key("otp", "consumed"): 1})
+            print(f"[verify_otp] OTP verified and deleted for {email}")
             return True
         print(
             f"[verify_otp] OTP verification failed for {email}, no matching document found."
@@ -144,19 +231,7 @@ def verify_otp(email, action, otp, target_id=None):
     return False
 
 
-def cleanup_expired_otps():
-    print("[cleanup_expired_otps] Called")
-    current_time = datetime.utcnow()
-    try:
-        result = otp_collection.update_many(
-            {"expiry": {"$lt": current_time}, "deleted": {"$ne": True}},
-            {"$set": {"deleted": True, "deleted_at": datetime.utcnow()}},
-        )
-        print(
-            f"[cleanup_expired_otps] Marked {result.modified_count} expired OTPs as deleted"
-        )
-    except Exception as e:
-        print(f"[cleanup_expired_otps] Exception: {e}")
+endorsement_cache = EndorsementCache(ENDORSEMENT_CACHE_TTL)
 
 
 def create_endorsement(endorsement_data):
@@ -168,6 +243,19 @@ def create_endorsement(endorsement_data):
         result = endorsements_collection.insert_one(endorsement_data)
         endorsement_data["id"] = str(result.inserted_id)
         endorsement_data["_id"] = result.inserted_id
+        record_rollup(
+            {
+                rollups.counter_key("endorsements", "active"): 1,
+                rollups.counter_key(
+                    "endorsements", "skill", endorsement_data["skillId"]
+                ): 1,
+                rollups.counter_key(
+                    "endorsements", "endorser", endorsement_data["email"]
+                ): 1,
+            },
+            when=endorsement_data["timestamp"],
+        )
+        endorsement_cache.invalidate(endorsement_data["skillId"])
         print(f"[create_endorsement] Endorsement created with ID: {result.inserted_id}")
         return endorsement_data
     except Exception as e:
@@ -177,6 +265,9 @@ def create_endorsement(endorsement_data):
 
 def get_all_endorsements():
     print("[get_all_endorsements] Called")
+    cached, cache_key = endorsement_cache.get()
+    if cached is not None:
+        return cached
     try:
         endorsements = list(endorsements_collection.find({"deleted": {"$ne": True}}))
         for endorsement in endorsements:
@@ -186,6 +277,7 @@ def get_all_endorsements():
             if isinstance(endorsement["timestamp"], datetime):
                 endorsement["timestamp"] = endorsement["timestamp"].isoformat() + "Z"
             print(f"[get_all_endorsements] Returning {len(endorsements)} endorsements")
+        endorsement_cache.set(cache_key, endorsements)
         return endorsements
     except Exception as e:
         print(f"[get_all_endorsements] Exception: {e}")
@@ -194,6 +286,9 @@ def get_all_endorsements():
 
 def get_endorsements_by_skill(skill_id):
     print(f"[get_endorsements_by_skill] Called with skill_id={skill_id}")
+    cached, cache_key = endorsement_cache.get(skill_id)
+    if cached is not None:
+        return cached
     try:
         endorsements = list(
             endorsements_collection.find(
@@ -209,20 +304,103 @@ def get_endorsements_by_skill(skill_id):
             print(
                 f"[get_endorsements_by_skill] Returning {len(endorsements)} endorsements for skill_id={skill_id}"
             )
+        endorsement_cache.set(cache_key, endorsements)
         return endorsements
     except Exception as e:
         print(f"[get_endorsements_by_skill] Exception: {e}")
         return []
 
 
+# Fields returned by the paginated listing; the endorser email stays private
+PUBLIC_ENDORSEMENT_FIELDS = {"skillId": 1, "name": 1, "message": 1, "timestamp": 1}
+
+
+def encode_cursor(endorsement):
+    """Opaque cursor pointing just after `endorsement` in (timestamp, _id) order."""
+    position = {
+        "t": endorsement["timestamp"].isoformat(),
+        "id": str(endorsement["_id"]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def get_endorsements_page(skill_id=None, limit=20, cursor=None):
+    """Return one page of endorsements, newest first, and the cursor for the next.
+
+    Pages are read with a range on (timestamp, _id) instead of skip(), so
+    every page costs the same regardless of how deep it is. Raises
+    ValueError for a malformed cursor.
+    """
+    print(
+        f"[get_endorsements_page] Called with skill_id={skill_id}, limit={limit}, cursor={cursor}"
+    )
+    query = {"deleted": {"$ne": True}}
+    if skill_id is not None:
+        query["skillId"] = skill_id
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": last_id}},
+        ]
+    documents = list(
+        endorsements_collection.find(query, PUBLIC_ENDORSEMENT_FIELDS)
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    page = documents[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(documents) > limit else None
+    endorsements = []
+    for document in page:
+        endorsement = {"id": str(document.pop("_id"))}
+        endorsement.update(document)
+        endorsement["timestamp"] = endorsement["timestamp"].isoformat() + "Z"
+        endorsements.append(endorsement)
+    print(f"[get_endorsements_page] Returning {len(endorsements)} endorsements")
+    return {"endorsements": endorsements, "nextCursor": next_cursor}
+
+
+def count_endorsements_by_skill():
+    """Active endorsements per skill, read from the all-time rollup counters."""
+    print("[count_endorsements_by_skill] Called")
+    total = metrics_rollups_collection.find_one({"_id": rollups.TOTAL_ID})
+    counters = rollups.summarize([total] if total else [], datetime.utcnow())
+    counts = rollups.labels(counters["total"], "endorsements", "skill")
+    return {skill_id: count for skill_id, count in counts.items() if count > 0}
+
+
 def delete_endorsement(endorsement_id):
     print(f"[delete_endorsement] Called with endorsement_id={endorsement_id}")
     try:
-        result = endorsements_collection.update_one(
+        endorsement = endorsements_collection.find_one_and_update(
             {"_id": ObjectId(endorsement_id), "deleted": {"$ne": True}},
             {"$set": {"deleted": True, "deleted_at": datetime.utcnow()}},
         )
-        if result.modified_count > 0:
+        if endorsement:
+            endorsement_cache.invalidate(endorsement.get("skillId"))
+            # Take the endorsement out of the buckets it was counted in
+            # when it was created, and count the deletion now.
+            record_rollup(
+                {
+                    rollups.counter_key("endorsements", "active"): -1,
+                    rollups.counter_key(
+                        "endorsements", "skill", endorsement.get("skillId")
+                    ): -1,
+                    rollups.counter_key(
+                        "endorsements", "endorser", endorsement.get("email")
+                    ): -1,
+                },
+                when=endorsement.get("timestamp"),
+            )
+            record_rollup({rollups.counter_key("endorsements", "deleted"): 1})
             print(
                 f"[delete_endorsement] Endorsement {endorsement_id} marked as deleted successfully"
             )
@@ -258,54 +436,358 @@ def get_endorsement_by_id(endorsement_id):
         return None
 
 
+def llm_usage_bucket_id(model_name, hour):
+    return f"{model_name}:{hour.isoformat()}"
+
+
+def write_llm_usage(entries):
+    """Write a batch of LLM usage events, summed per hourly bucket.
+
+    All-time totals per model live in the llm/llm_models rollup counters.
+    Each event is tagged with the id of the batch it was first written in,
+    and a bucket or the rollup document skips a batch id it already
+    applied, so a batch that was spilled after a partial or unacknowledged
+    write can be replayed without counting anything twice.
+    """
+    print(f"[write_llm_usage] Writing {len(entries)} usage events")
+    batch_id = uuid.uuid4().hex
+    buckets = {}
+    counters = {}
+    for entry in entries:
+        entry.setdefault("batch_id", batch_id)
+        model_name = entry["model_name"]
+        tokens = {
+            "prompt_tokens": entry["prompt_tokens"],
+            "completion_tokens": entry["completion_tokens"],
+            "total_tokens": entry["total_tokens"],
+        }
+        hour = rollups.bucket_start(entry["timestamp"], "hour")
+        bucket = buckets.setdefault(
+            (llm_usage_bucket_id(model_name, hour), entry["batch_id"]),
+            {
+                "model_name": model_name,
+                "hour": hour,
+                "inc": dict.fromkeys([*tokens, "requests"], 0),
+                "samples": [],
+            },
+        )
+        for field, value in tokens.items():
+            bucket["inc"][field] += value
+        bucket["inc"]["requests"] += 1
+        bucket["samples"].append(
+            {
+                key: value
+                for key, value in entry.items()
+                if key not in ("model_name", "batch_id")
+            }
+        )
+
+        batch_counters = counters.setdefault(entry["batch_id"], {})
+        for key, value in (
+            (rollups.counter_key("llm", "prompt_tokens"), tokens["prompt_tokens"]),
+            (
+                rollups.counter_key("llm", "completion_tokens"),
+                tokens["completion_tokens"],
+            ),
+            (rollups.counter_key("llm", "total_tokens"), tokens["total_tokens"]),
+            (
+                rollups.counter_key("llm_models", model_name, "total_tokens"),
+                tokens["total_tokens"],
+            ),
+        ):
+            batch_counters[key] = batch_counters.get(key, 0) + value
+
+    bulk_write_once(
+        llm_usage_buckets_collection,
+        [
+            UpdateOne(
+                {"_id": bucket_id, "batches": {"$ne": batch}},
+                {
+                    "$setOnInsert": {
+                        "model_name": bucket["model_name"],
+                        "hour": bucket["hour"],
+                    },
+                    "$inc": bucket["inc"],
+                    "$push": {
+                        "samples": {
+                            "$each": bucket["samples"][-LLM_USAGE_SAMPLE_SIZE:],
+                            "$slice": -LLM_USAGE_SAMPLE_SIZE,
+                        },
+                        "batches": {
+                            "$each": [batch],
+                            "$slice": -LLM_USAGE_BATCH_HISTORY,
+                        },
+                    },
+                },
+                upsert=True,
+            )
+            for (bucket_id, batch), bucket in buckets.items()
+        ],
+    )
+    operations = []
+    for batch, batch_counters in counters.items():
+        for query, update in rollups.build_updates(batch_counters, totals_only=True):
+            update["$push"] = {
+                "llm_batches": {"$each": [batch], "$slice": -LLM_USAGE_BATCH_HISTORY}
+            }
+            operations.append(
+                UpdateOne({**query, "llm_batches": {"$ne": batch}}, update, upsert=True)
+            )
+    bulk_write_once(metrics_rollups_collection, operations)
+
+
+def bulk_write_once(collection, operations):
+    """bulk_write upserts guarded by a batch id, ignoring the ones already applied.
+
+    An upsert whose guard no longer matches tries to insert an existing _id,
+    so a duplicate key error means that operation was applied before.
+    """
+    if not operations:
+        return
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+
+
+# With LLM_USAGE_FLUSH_INTERVAL > 0, usage events are summed in memory for that
+# many seconds and flushed together; otherwise each event is written as it comes.
+llm_usage_writer = BatchWriter(
+    "llm_usage",
+    write_llm_usage,
+    batch_size=LLM_USAGE_BATCH_SIZE,
+    flush_interval=LLM_USAGE_FLUSH_INTERVAL,
+    max_queue=LLM_USAGE_QUEUE_SIZE,
+    spill_path=LLM_USAGE_SPILL_PATH,
+)
+if not RUNNING_TESTS and LLM_USAGE_FLUSH_INTERVAL > 0:
+    llm_usage_writer.start()
+
+
 def log_llm_usage(model_name, message, usage):
     print(
         f"[log_llm_usage] Called with model_name={model_name}, message={message}, usage={usage}"
     )
     try:
         usage_entry = {
+            "model_name": model_name,
             "message": message,
             "prompt_tokens": usage.get("prompt_tokens", 0),
             "completion_tokens": usage.get("completion_tokens", 0),
             "total_tokens": usage.get("total_tokens", 0),
             "timestamp": datetime.utcnow(),
         }
-        llm_usage_collection.update_one(
-            {"model_name": model_name},
+        if llm_usage_writer.running:
+            llm_usage_writer.submit(usage_entry)
+            print(f"[log_llm_usage] LLM usage queued for {model_name}")
+            return
+        write_llm_usage([usage_entry])
+        print(
+            f"[log_llm_usage] LLM Usage logged. Model: {model_name}, Prompt Tokens: {usage_entry['prompt_tokens']}, Completion Tokens: {usage_entry['completion_tokens']}, Total Tokens: {usage_entry['total_tokens']}"
+        )
+    except Exception as e:
+        print(f"[log_llm_usage] Exception: {e}")
+        raise
+
+
+def as_document(message):
+    return message.model_dump() if hasattr(message, "model_dump") else message
+
+
+def upsert_conversation(conversation_id, history, messages, topics, now):
+    """Append a turn to the embedded messages array in one round trip.
+
+    A conversation seen for the first time is created with the client's
+    history followed by the turn. Returns the document as it was before the
+    update (topics only), or None if it was just created.
+    """
+    return conversations_collection.find_one_and_update(
+        {"conversation_id": conversation_id},
+        [
             {
-                "$setOnInsert": {
-                    "model_name": model_name,
-                    "total_prompt_tokens": 0,
-                    "total_completion_tokens": 0,
-                    "total_tokens": 0,
-                    "logs": [],
+                "$set": {
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "messages": {
+                        "$concatArrays": [
+                            {"$ifNull": ["$messages", {"$literal": history}]},
+                            {"$literal": messages},
+                        ]
+                    },
+                    "topics": {"$literal": topics},
+                    "updated_at": now,
                 }
             },
-            upsert=True,
+            {"$set": {"message_count": {"$size": "$messages"}}},
+        ],
+        projection={"topics": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+
+
+def upsert_conversation_turn(conversation_id, history, messages, topics, now):
+    """Store a turn as its own (conversation_id, seq) document.
+
+    The conversation document only keeps counters and topics; seq is the
+    number of messages before the turn, taken atomically from message_count,
+    so concurrent turns get distinct seqs. The write is not idempotent:
+    running it again counts the turn again and stores it under a new seq,
+    which is why chat_writes makes a single attempt.
+    """
+    before = conversations_collection.find_one_and_update(
+        {"conversation_id": conversation_id},
+        [
+            {
+                "$set": {
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "message_count": {
+                        "$add": [
+                            {"$ifNull": ["$message_count", len(history)]},
+                            len(messages),
+                        ]
+                    },
+                    "turn_count": {"$add": [{"$ifNull": ["$turn_count", 0]}, 1]},
+                    "topics": {"$literal": topics},
+                    "updated_at": now,
+                }
+            }
+        ],
+        projection={"topics": 1, "message_count": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    seq = before.get("message_count", 0) if before else 0
+    conversation_turns_collection.update_one(
+        {"conversation_id": conversation_id, "seq": seq},
+        {
+            "$setOnInsert": {
+                "messages": messages if before else history + messages,
+                "topics": topics,
+                "created_at": now,
+            }
+        },
+        upsert=True,
+    )
+    return before
+
+
+def numbered(messages, first_seq):
+    """Tag messages with their position in the conversation."""
+    return [{**message, "seq": first_seq + i} for i, message in enumerate(messages)]
+
+
+def turn_messages(conversation_id, query=None, order=1):
+    """Yield the numbered messages of each stored turn, in seq order."""
+    turns = conversation_turns_collection.find(
+        {"conversation_id": conversation_id, **(query or {})},
+        {"seq": 1, "messages": 1},
+    ).sort("seq", order)
+    for turn in turns:
+        yield numbered(turn.get("messages", []), turn["seq"])
+
+
+def get_recent_messages(conversation_id, limit):
+    """Return the last `limit` stored messages of a conversation, oldest first.
+
+    Each message carries its position in the conversation as "seq".
+    """
+    print(
+        f"[get_recent_messages] Called with conversation_id={conversation_id}, limit={limit}"
+    )
+    if CONVERSATION_STORAGE != "turns":
+        conversation = conversations_collection.find_one(
+            {"conversation_id": conversation_id},
+            {
+                "_id": 0,
+                "messages": {"$slice": [{"$ifNull": ["$messages", []]}, -limit]},
+                "total": {"$size": {"$ifNull": ["$messages", []]}},
+            },
         )
-        result = llm_usage_collection.update_one(
-            {"model_name": model_name},
+        if not conversation:
+            return []
+        messages = conversation["messages"]
+        return numbered(messages, conversation["total"] - len(messages))
+    messages = []
+    for turn in turn_messages(conversation_id, order=-1):
+        messages[:0] = turn
+        if len(messages) >= limit:
+            break
+    return messages[-limit:]
+
+
+def get_messages_range(conversation_id, start, end):
+    """Return stored messages with start <= seq < end, oldest first."""
+    print(
+        f"[get_messages_range] Called with conversation_id={conversation_id}, start={start}, end={end}"
+    )
+    if end <= start:
+        return []
+    if CONVERSATION_STORAGE != "turns":
+        conversation = conversations_collection.find_one(
+            {"conversation_id": conversation_id},
             {
-                "$push": {"logs": usage_entry},
-                "$inc": {
-                    "total_prompt_tokens": usage_entry["prompt_tokens"],
-                    "total_completion_tokens": usage_entry["completion_tokens"],
-                    "total_tokens": usage_entry["total_tokens"],
+                "_id": 0,
+                "messages": {
+                    "$slice": [{"$ifNull": ["$messages", []]}, start, end - start]
                 },
             },
         )
-        print(
-            f"[log_llm_usage] LLM Usage logged. Model: {model_name}, Prompt Tokens: {usage_entry['prompt_tokens']}, Completion Tokens: {usage_entry['completion_tokens']}, Total Tokens: {usage_entry['total_tokens']}, Matched: {result.matched_count}, Modified: {result.modified_count}"
-        )
-    except Exception as e:
-        print(f"[log_llm_usage] Exception: {e}")
+        return numbered((conversation or {}).get("messages", []), start)
+    return [
+        message
+        for turn in turn_messages(conversation_id, {"seq": {"$lt": end}})
+        for message in turn
+        if message["seq"] >= start
+    ]
+
+
+def get_summary_state(conversation_id):
+    """Return the conversation's running summary and how many messages it has."""
+    conversation = conversations_collection.find_one(
+        {"conversation_id": conversation_id},
+        {"_id": 0, "summary": 1, "summary_through": 1, "message_count": 1},
+    )
+    conversation = conversation or {}
+    return {
+        "summary": conversation.get("summary"),
+        "summary_through": conversation.get("summary_through", 0),
+        "message_count": conversation.get("message_count", 0),
+    }
+
+
+def store_summary(conversation_id, summary, through, previous_through):
+    """Save a summary of the messages before seq `through`.
+
+    Only applied if the stored summary still ends at previous_through, so
+    two workers refreshing the same conversation can't overwrite a newer
+    summary with an older one. Returns whether it was saved.
+    """
+    print(
+        f"[store_summary] Called with conversation_id={conversation_id}, through={through}"
+    )
+    result = conversations_collection.update_one(
+        {
+            "conversation_id": conversation_id,
+            "summary_through": previous_through or {"$in": [0, None]},
+        },
+        {
+            "$set": {
+                "summary": summary,
+                "summary_through": through,
+                "summary_updated_at": datetime.utcnow(),
+            }
+        },
+    )
+    return result.modified_count == 1
 
 
 def log_conversation(conversation_data):
     print(f"[log_conversation] Called with conversation_data={conversation_data}")
     try:
         conversation_id = conversation_data.get("conversation_id")
-        existing_messages = conversation_data.get("messages", [])
+        history = [as_document(msg) for msg in conversation_data.get("messages", [])]
         new_message = conversation_data.get("new_message")
         response = conversation_data.get("response")
         topics = conversation_data.get("topics", [])
@@ -313,34 +795,42 @@ def log_conversation(conversation_data):
         if new_message:
             messages_to_add.append({"content": new_message, "role": "user"})
         if response:
-            messages_to_add.append(
-                response.model_dump() if hasattr(response, "model_dump") else response
-            )
-        existing_conversation = conversations_collection.find_one(
-            {"conversation_id": conversation_id}
+            messages_to_add.append(as_document(response))
+        upsert = (
+            upsert_conversation_turn
+            if CONVERSATION_STORAGE == "turns"
+            else upsert_conversation
+        )
+        existing_conversation = upsert(
+            conversation_id, history, messages_to_add, topics, datetime.utcnow()
         )
         if existing_conversation:
-            result = conversations_collection.update_one(
-                {"conversation_id": conversation_id},
+            topic_changes = Counter(topics)
+            topic_changes.subtract(existing_conversation.get("topics", []))
+            record_rollup(
                 {
-                    "$push": {"messages": {"$each": messages_to_add}},
-                    "$set": {"topics": topics, "updated_at": datetime.utcnow()},
-                },
+                    rollups.counter_key("conversations", "messages"): len(
+                        messages_to_add
+                    ),
+                    **{
+                        rollups.counter_key("topics", topic): change
+                        for topic, change in topic_changes.items()
+                        if topic
+                    },
+                }
             )
             print(f"[log_conversation] Updated existing conversation {conversation_id}")
         else:
-            all_messages = [
-                msg.model_dump() if hasattr(msg, "model_dump") else msg
-                for msg in existing_messages
-            ]
-            all_messages.extend(messages_to_add)
-            result = conversations_collection.insert_one(
+            record_rollup(
                 {
-                    "conversation_id": conversation_id,
-                    "messages": all_messages,
-                    "topics": topics,
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow(),
+                    rollups.counter_key("conversations", "total"): 1,
+                    rollups.counter_key("conversations", "messages"): len(history)
+                    + len(messages_to_add),
+                    **{
+                        rollups.counter_key("topics", topic): count
+                        for topic, count in Counter(topics).items()
+                        if topic
+                    },
                 }
             )
             print(f"[log_conversation] Created new conversation {conversation_id}")
@@ -349,17 +839,97 @@ def log_conversation(conversation_data):
         )
     except Exception as e:
         print(f"[log_conversation] Exception: {e}")
+        raise
 
 
 def log_export(export_data):
     print(f"[log_export] Called with export_data={export_data}")
     try:
         exports_collection.insert_one(export_data)
+        record_rollup({rollups.counter_key("exports", "total"): 1})
         print(f"[log_export] Export logged successfully")
     except Exception as e:
         print(f"[log_export] Exception: {e}")
 
 
+def record_email_delivery(delivery_id, status):
+    """Upsert the delivery status record of one outgoing email."""
+    print(f"[record_email_delivery] {delivery_id}: {status['status']}")
+    try:
+        email_deliveries_collection.update_one(
+            {"_id": delivery_id},
+            {"$set": status, "$setOnInsert": {"created_at": datetime.utcnow()}},
+            upsert=True,
+        )
+    except Exception as e:
+        print(f"[record_email_delivery] Exception: {e}")
+
+
+def api_call_counters(endpoint, status_code):
+    return {
+        rollups.counter_key("api_calls", "total"): 1,
+        rollups.counter_key("api_calls", "endpoint", endpoint): 1,
+        rollups.counter_key("api_calls", "status", status_code): 1,
+    }
+
+
+def write_api_calls(api_calls):
+    """Insert a batch of API call records and their rollup increments.
+
+    Records that fail to insert are raised as a PartialBatchError so only
+    they are spilled. A duplicate key means the record was inserted by an
+    earlier attempt whose batch was spilled before its rollups were
+    recorded, so it counts as written.
+    """
+    print(f"[write_api_calls] Writing {len(api_calls)} API calls")
+    failed = set()
+    try:
+        api_calls_collection.insert_many(api_calls, ordered=False)
+    except BulkWriteError as e:
+        failed = {
+            error["index"]
+            for error in e.details.get("writeErrors", [])
+            if error.get("code") != 11000
+        }
+    record_rollups(
+        (api_call_counters(call["endpoint"], call["status_code"]), call["timestamp"])
+        for index, call in enumerate(api_calls)
+        if index not in failed
+    )
+    if failed:
+        raise PartialBatchError(
+            [call for index, call in enumerate(api_calls) if index in failed],
+            f"{len(failed)} API calls failed to insert",
+        )
+
+
+api_call_writer = BatchWriter(
+    "api_calls",
+    write_api_calls,
+    batch_size=API_CALL_BATCH_SIZE,
+    flush_interval=API_CALL_FLUSH_INTERVAL,
+    max_queue=API_CALL_QUEUE_SIZE,
+    spill_path=API_CALL_SPILL_PATH,
+)
+if not RUNNING_TESTS:
+    api_call_writer.start()
+
+# Chat persistence (log_llm_usage, log_conversation) runs off the request path.
+# Each call is attempted once: those writes are $inc/$push upserts, and after a
+# connection failure the server may already have applied them. pymongo's
+# retryable writes (on by default, on replica sets and sharded clusters) retry a
+# failed write once, and the server recognises the retry if the first attempt
+# went through.
+chat_writes = WriteQueue(
+    "chat",
+    workers=CHAT_WRITE_WORKERS,
+    max_queue=CHAT_WRITE_QUEUE_SIZE,
+    max_attempts=1,
+)
+if not RUNNING_TESTS:
+    chat_writes.start()
+
+
 def log_api_call(
     endpoint, method="GET", status_code=200, user_agent=None, ip_address=None
 ):
@@ -367,16 +937,17 @@ def log_api_call(
         f"[log_api_call] Called with endpoint={endpoint}, method={method}, status_code={status_code}, user_agent={user_agent}, ip_address={ip_address}"
     )
     try:
-        api_call_data = {
-            "endpoint": endpoint,
-            "method": method,
-            "status_code": status_code,
-            "timestamp": datetime.utcnow(),
-            "user_agent": user_agent,
-            "ip_address": ip_address,
-        }
-        api_calls_collection.insert_one(api_call_data)
-        print(f"[log_api_call] API call logged successfully")
+        api_call_writer.submit(
+            {
+                "endpoint": endpoint,
+                "method": method,
+                "status_code": status_code,
+                "timestamp": datetime.utcnow(),
+                "user_agent": user_agent,
+                "ip_address": ip_address,
+            }
+        )
+        print(f"[log_api_call] API call queued successfully")
     except Exception as e:
         print(f"[log_api_call] Error logging API call: {str(e)}")
 
@@ -390,111 +961,47 @@ def get_metrics_data():
         one_week_ago = current_time - timedelta(weeks=1)
         one_month_ago = current_time - timedelta(days=30)
 
+        # Counters maintained at write time (see rollups.py)
+        rollup = rollups.summarize(
+            metrics_rollups_collection.find(rollups.window_query(current_time)),
+            current_time,
+        )
+        totals = rollup["total"]
+
         # LLM Usage Metrics
-        llm_usage_stats = list(llm_usage_collection.find())
-        total_tokens = sum(doc.get("total_tokens", 0) for doc in llm_usage_stats)
-        total_prompt_tokens = sum(
-            doc.get("total_prompt_tokens", 0) for doc in llm_usage_stats
+        total_tokens = rollups.value(totals, "llm", "total_tokens")
+        total_prompt_tokens = rollups.value(totals, "llm", "prompt_tokens")
+        total_completion_tokens = rollups.value(totals, "llm", "completion_tokens")
+
+        # Time windows are computed from the hourly usage buckets of the last
+        # month; a bucket counts towards a window if it overlaps it. Each
+        # bucket is placed once in an hour slot and the windows are read from
+        # prefix sums over the slots.
+        model_totals = rollups.nested_labels(totals, "llm_models")
+        llm_buckets = llm_usage_buckets_collection.find(
+            {"hour": {"$gte": rollups.bucket_start(one_month_ago, "hour")}},
+            {"samples": 0},
         )
-        total_completion_tokens = sum(
-            doc.get("total_completion_tokens", 0) for doc in llm_usage_stats
+        model_histograms = usage_histogram.build_histograms(
+            llm_buckets,
+            current_time,
+            key=lambda bucket: bucket.get("model_name", "unknown"),
         )
-
-        # Time-based LLM usage metrics
-        tokens_last_hour = {"prompt": 0, "completion": 0, "total": 0}
-        tokens_last_day = {"prompt": 0, "completion": 0, "total": 0}
-        tokens_last_week = {"prompt": 0, "completion": 0, "total": 0}
-        tokens_last_month = {"prompt": 0, "completion": 0, "total": 0}
-        requests_last_hour = 0
-        requests_last_day = 0
-        requests_last_week = 0
-        requests_last_month = 0
+        for model_name in model_totals:
+            model_histograms.setdefault(model_name, usage_histogram.empty_histogram())
+        llm_histogram = usage_histogram.merge(model_histograms.values())
+        llm_windows = usage_histogram.window_totals(llm_histogram)
 
         # Token usage by model and time
-        model_usage_by_time = {}
-
-        for doc in llm_usage_stats:
-            model_name = doc.get("model_name", "unknown")
-            model_usage_by_time[model_name] = {
-                "last_hour": {"prompt": 0, "completion": 0, "total": 0, "requests": 0},
-                "last_day": {"prompt": 0, "completion": 0, "total": 0, "requests": 0},
-                "last_week": {"prompt": 0, "completion": 0, "total": 0, "requests": 0},
-                "last_month": {"prompt": 0, "completion": 0, "total": 0, "requests": 0},
-            }
-
-            for log in doc.get("logs", []):
-                if "timestamp" in log:
-                    log_time = log["timestamp"]
-                    prompt_tokens = log.get("prompt_tokens", 0)
-                    completion_tokens = log.get("completion_tokens", 0)
-                    total_tokens = log.get("total_tokens", 0)
-
-                    if log_time >= one_hour_ago:
-                        tokens_last_hour["prompt"] += prompt_tokens
-                        tokens_last_hour["completion"] += completion_tokens
-                        tokens_last_hour["total"] += total_tokens
-                        requests_last_hour += 1
-                        model_usage_by_time[model_name]["last_hour"][
-                            "prompt"
-                        ] += prompt_tokens
-                        model_usage_by_time[model_name]["last_hour"][
-                            "completion"
-                        ] += completion_tokens
-                        model_usage_by_time[model_name]["last_hour"][
-                            "total"
-                        ] += total_tokens
-                        model_usage_by_time[model_name]["last_hour"]["requests"] += 1
-
-                    if log_time >= one_day_ago:
-                        tokens_last_day["prompt"] += prompt_tokens
-                        tokens_last_day["completion"] += completion_tokens
-                        tokens_last_day["total"] += total_tokens
-                        requests_last_day += 1
-                        model_usage_by_time[model_name]["last_day"][
-                            "prompt"
-                        ] += prompt_tokens
-                        model_usage_by_time[model_name]["last_day"][
-                            "completion"
-                        ] += completion_tokens
-                        model_usage_by_time[model_name]["last_day"][
-                            "total"
-                        ] += total_tokens
-                        model_usage_by_time[model_name]["last_day"]["requests"] += 1
-
-                    if log_time >= one_week_ago:
-                        tokens_last_week["prompt"] += prompt_tokens
-                        tokens_last_week["completion"] += completion_tokens
-                        tokens_last_week["total"] += total_tokens
-                        requests_last_week += 1
-                        model_usage_by_time[model_name]["last_week"][
-                            "prompt"
-                        ] += prompt_tokens
-                        model_usage_by_time[model_name]["last_week"][
-                            "completion"
-                        ] += completion_tokens
-                        model_usage_by_time[model_name]["last_week"][
-                            "total"
-                        ] += total_tokens
-                        model_usage_by_time[model_name]["last_week"]["requests"] += 1
-
-                    if log_time >= one_month_ago:
-                        tokens_last_month["prompt"] += prompt_tokens
-                        tokens_last_month["completion"] += completion_tokens
-                        tokens_last_month["total"] += total_tokens
-                        requests_last_month += 1
-                        model_usage_by_time[model_name]["last_month"][
-                            "prompt"
-                        ] += prompt_tokens
-                        model_usage_by_time[model_name]["last_month"][
-                            "completion"
-                        ] += completion_tokens
-                        model_usage_by_time[model_name]["last_month"][
-                            "total"
-                        ] += total_tokens
-                        model_usage_by_time[model_name]["last_month"]["requests"] += 1
+        model_usage_by_time = {
+            model_name: usage_histogram.window_totals(histogram)
+            for model_name, histogram in model_histograms.items()
+        }
 
         # Conversation Metrics
-        total_conversations = conversations_collection.count_documents({})
+        total_conversations = rollups.value(totals, "conversations", "total")
+        # Distinct conversations active in a window cannot be summed from
+        # counters; these are range counts over the updated_at field.
         conversations_last_hour = conversations_collection.count_documents(
             {"updated_at": {"$gte": one_hour_ago}}
         )
@@ -509,176 +1016,97 @@ def get_metrics_data():
         )
 
         # Message count in conversations
-        total_messages = 0
-        conversation_docs = conversations_collection.find({}, {"messages": 1})
-        for doc in conversation_docs:
-            total_messages += len(doc.get("messages", []))
+        total_messages = rollups.value(totals, "conversations", "messages")
 
         # Export Metrics
-        total_exports = exports_collection.count_documents({})
-        exports_last_day = (
-            exports_collection.count_documents({"timestamp": {"$gte": one_day_ago}})
-            if exports_collection.find_one({})
-            and "timestamp" in exports_collection.find_one({})
-            else 0
-        )
+        total_exports = rollups.value(totals, "exports", "total")
+        exports_last_day = rollups.value(rollup["last_day"], "exports", "total")
 
         # OTP Metrics
-        total_otps_generated = otp_collection.count_documents({})
+        total_otps_generated = rollups.value(totals, "otp", "generated")
+        consumed_otps = rollups.value(totals, "otp", "consumed")
+        superseded_otps = rollups.value(totals, "otp", "superseded")
+        # otp_codes only holds codes the TTL monitor hasn't removed yet, so
+        # this count stays small; every other code was used, replaced or expired
         active_otps = otp_collection.count_documents(
             {"expiry": {"$gt": current_time}, "deleted": {"$ne": True}}
         )
-        expired_otps = otp_collection.count_documents({"expiry": {"$lt": current_time}})
-        otps_last_hour = otp_collection.count_documents(
-            {"created_at": {"$gte": one_hour_ago}}
-        )
-        otps_last_day = otp_collection.count_documents(
-            {"created_at": {"$gte": one_day_ago}}
+        expired_otps = max(
+            0, total_otps_generated - consumed_otps - superseded_otps - active_otps
         )
+        otps_last_hour = rollups.value(rollup["last_hour"], "otp", "generated")
+        otps_last_day = rollups.value(rollup["last_day"], "otp", "generated")
 
         # OTP by action type
-        otp_endorse_count = otp_collection.count_documents({"action": "endorse"})
-        otp_delete_count = otp_collection.count_documents({"action": "delete"})
+        otp_by_action = {"endorse": 0, "delete": 0}
+        otp_by_action.update(rollups.labels(totals, "otp", "action"))
 
         # Endorsement Metrics
-        total_endorsements = endorsements_collection.count_documents(
-            {"deleted": {"$ne": True}}
+        total_endorsements = rollups.value(totals, "endorsements", "active")
+        deleted_endorsements = rollups.value(totals, "endorsements", "deleted")
+        endorsements_last_day = rollups.value(
+            rollup["last_day"], "endorsements", "active"
         )
-        deleted_endorsements = endorsements_collection.count_documents(
-            {"deleted": True}
-        )
-        endorsements_last_day = endorsements_collection.count_documents(
-            {"timestamp": {"$gte": one_day_ago}, "deleted": {"$ne": True}}
-        )
-        endorsements_last_week = endorsements_collection.count_documents(
-            {"timestamp": {"$gte": one_week_ago}, "deleted": {"$ne": True}}
+        endorsements_last_week = rollups.value(
+            rollup["last_week"], "endorsements", "active"
         )
 
         # Endorsements per skill
         endorsements_by_skill = {}
-        skill_pipeline = [
-            {"$match": {"deleted": {"$ne": True}}},
-            {"$group": {"_id": "$skillId", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-        ]
-        skill_results = list(endorsements_collection.aggregate(skill_pipeline))
-        for result in skill_results:
-            skill_name = get_skill_name_by_id(result["_id"])
-            endorsements_by_skill[skill_name] = result["count"]
+        skill_counts = rollups.top(rollups.labels(totals, "endorsements", "skill"))
+        skill_names = get_skill_names(skill_counts)
+        for skill_id, count in skill_counts.items():
+            endorsements_by_skill[skill_names[skill_id]] = count
 
         # Top endorsers (by email)
-        top_endorsers = {}
-        endorser_pipeline = [
-            {"$match": {"deleted": {"$ne": True}}},
-            {"$group": {"_id": "$email", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10},
-        ]
-        endorser_results = list(endorsements_collection.aggregate(endorser_pipeline))
-        for result in endorser_results:
-            top_endorsers[result["_id"]] = result["count"]
+        top_endorsers = rollups.top(
+            rollups.labels(totals, "endorsements", "endorser"), limit=10
+        )
 
         # Topic analysis from conversations
-        topic_frequency = {}
-        topic_pipeline = [
-            {"$match": {"topics": {"$exists": True, "$ne": []}}},
-            {"$unwind": "$topics"},
-            {"$group": {"_id": "$topics", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 20},
-        ]
-        topic_results = list(conversations_collection.aggregate(topic_pipeline))
-        for result in topic_results:
-            topic_frequency[result["_id"]] = result["count"]
-
-        # API endpoint usage - ACCURATE DATA ONLY
-        api_endpoints_total = {}
-        api_endpoints_last_hour = {}
-        api_endpoints_last_day = {}
-
-        # Get API call statistics
-        api_pipeline_total = [
-            {"$group": {"_id": "$endpoint", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-        ]
-        api_total_results = list(api_calls_collection.aggregate(api_pipeline_total))
-        for result in api_total_results:
-            api_endpoints_total[result["_id"]] = result["count"]
-
-        # Last hour API calls
-        api_pipeline_hour = [
-            {"$match": {"timestamp": {"$gte": one_hour_ago}}},
-            {"$group": {"_id": "$endpoint", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-        ]
-        api_hour_results = list(api_calls_collection.aggregate(api_pipeline_hour))
-        for result in api_hour_results:
-            api_endpoints_last_hour[result["_id"]] = result["count"]
-
-        # Last day API calls
-        api_pipeline_day = [
-            {"$match": {"timestamp": {"$gte": one_day_ago}}},
-            {"$group": {"_id": "$endpoint", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-        ]
-        api_day_results = list(api_calls_collection.aggregate(api_pipeline_day))
-        for result in api_day_results:
-            api_endpoints_last_day[result["_id"]] = result["count"]
+        topic_frequency = rollups.top(rollups.labels(totals, "topics"), limit=20)
+
+        # API endpoint usage
+        api_endpoints_total = rollups.top(
+            rollups.labels(totals, "api_calls", "endpoint")
+        )
+        api_endpoints_last_hour = rollups.top(
+            rollups.labels(rollup["last_hour"], "api_calls", "endpoint")
+        )
+        api_endpoints_last_day = rollups.top(
+            rollups.labels(rollup["last_day"], "api_calls", "endpoint")
+        )
 
         # API status code distribution
-        status_code_pipeline = [
-            {"$group": {"_id": "$status_code", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-        ]
-        status_code_results = list(api_calls_collection.aggregate(status_code_pipeline))
-        status_code_distribution = {}
-        for result in status_code_results:
-            status_code_distribution[result["_id"]] = result["count"]
+        status_code_distribution = {
+            int(status_code) if status_code.isdigit() else status_code: count
+            for status_code, count in rollups.top(
+                rollups.labels(totals, "api_calls", "status")
+            ).items()
+        }
 
         # Contact form submissions (accurate count from exports)
-        contact_submissions = exports_collection.count_documents({})
-        contact_submissions_last_day = (
-            exports_collection.count_documents({"timestamp": {"$gte": one_day_ago}})
-            if exports_collection.find_one({})
-            else 0
-        )
-
-        # Hourly token usage trends (last 24 hours)
-        hourly_usage = []
-        for i in range(24):
-            hour_start = current_time - timedelta(hours=i + 1)
-            hour_end = current_time - timedelta(hours=i)
-
-            hour_tokens = {"prompt": 0, "completion": 0, "total": 0, "requests": 0}
-
-            for doc in llm_usage_stats:
-                for log in doc.get("logs", []):
-                    if "timestamp" in log:
-                        log_time = log["timestamp"]
-                        if hour_start <= log_time < hour_end:
-                            hour_tokens["prompt"] += log.get("prompt_tokens", 0)
-                            hour_tokens["completion"] += log.get("completion_tokens", 0)
-                            hour_tokens["total"] += log.get("total_tokens", 0)
-                            hour_tokens["requests"] += 1
-
-            hourly_usage.append(
-                {"hour": hour_start.isoformat() + "Z", "usage": hour_tokens}
-            )
+        contact_submissions = total_exports
+        contact_submissions_last_day = exports_last_day
 
-        # Reverse to get chronological order (oldest to newest)
-        hourly_usage.reverse()
+        # Hourly token usage trends (last 24 hours, aligned to clock hours)
+        hourly_usage = usage_histogram.hourly_trends(llm_histogram, current_time)
 
         # System health metrics
         health_metrics = {
             "database_connection": True,  # If we got this far, DB is connected
             "collections_count": len(db.list_collection_names()),
-            "total_documents": (
-                total_conversations
-                + total_exports
-                + total_otps_generated
-                + total_endorsements
-                + deleted_endorsements
-                + len(llm_usage_stats)
+            # Read from collection metadata, so it costs no scan and doesn't
+            # drift with the rollup counters
+            "total_documents": sum(
+                collection.estimated_document_count()
+                for collection in (
+                    conversations_collection,
+                    exports_collection,
+                    otp_collection,
+                    endorsements_collection,
+                    llm_usage_buckets_collection,
+                )
             ),
         }
 
@@ -690,20 +1118,20 @@ def get_metrics_data():
                 "total_prompt_tokens": total_prompt_tokens,
                 "total_completion_tokens": total_completion_tokens,
                 "tokens_by_time": {
-                    "last_hour": tokens_last_hour,
-                    "last_day": tokens_last_day,
-                    "last_week": tokens_last_week,
-                    "last_month": tokens_last_month,
+                    window: {
+                        field: usage[field]
+                        for field in ("prompt", "completion", "total")
+                    }
+                    for window, usage in llm_windows.items()
                 },
                 "requests_by_time": {
-                    "last_hour": requests_last_hour,
-                    "last_day": requests_last_day,
-                    "last_week": requests_last_week,
-                    "last_month": requests_last_month,
+                    window: usage["requests"] for window, usage in llm_windows.items()
                 },
                 "models": {
-                    doc["model_name"]: doc.get("total_tokens", 0)
-                    for doc in llm_usage_stats
+                    model: usage.get("total_tokens", 0)
+                    for model, usage in rollups.nested_labels(
+                        totals, "llm_models"
+                    ).items()
                 },
                 "model_usage_by_time": model_usage_by_time,
                 "hourly_trends": hourly_usage,
@@ -723,10 +1151,11 @@ def get_metrics_data():
             "otp": {
                 "total_generated": total_otps_generated,
                 "active": active_otps,
+                "consumed": consumed_otps,
                 "expired": expired_otps,
                 "last_hour": otps_last_hour,
                 "last_day": otps_last_day,
-                "by_action": {"endorse": otp_endorse_count, "delete": otp_delete_count},
+                "by_action": otp_by_action,
             },
             "endorsements": {
                 "total_active": total_endorsements,
@@ -768,3 +1197,322 @@ def get_metrics_data():
     except Exception as e:
         print(f"[get_metrics_data] Error: {str(e)}")
         return {"error": str(e), "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+
+ENDORSEMENT_ROLLUP_FIELDS = {
+    "skillId": 1,
+    "email": 1,
+    "timestamp": 1,
+    "deleted": 1,
+    "deleted_at": 1,
+}
+
+
+def endorsement_rollup_counters(endorsement):
+    """Return the (counters, when) an existing endorsement contributes."""
+    if endorsement.get("deleted"):
+        return (
+            {rollups.counter_key("endorsements", "deleted"): 1},
+            endorsement.get("deleted_at"),
+        )
+    return (
+        {
+            rollups.counter_key("endorsements", "active"): 1,
+            rollups.counter_key("endorsements", "skill", endorsement.get("skillId")): 1,
+            rollups.counter_key(
+                "endorsements", "endorser", endorsement.get("email")
+            ): 1,
+        },
+        endorsement.get("timestamp"),
+    )
+
+
+def backfill_endorsement_rollups():
+    """Count existing endorsements into the all-time rollup document once.
+
+    count_endorsements_by_skill reads the all-time counters, so a deployment
+    that never ran rebuild-rollups would report no endorsements. If the
+    total document has no endorsement counters yet they are computed from
+    the collection; the update only applies while the counters are still
+    missing, so concurrently starting pods backfill at most once. The time
+    buckets are left to rebuild-rollups.
+    """
+    print("[backfill_endorsement_rollups] Called")
+    if metrics_rollups_collection.find_one(
+        {"_id": rollups.TOTAL_ID, "counters.endorsements": {"$exists": True}},
+        {"_id": 1},
+    ):
+        return 0
+    counters = {}
+    for endorsement in endorsements_collection.find({}, ENDORSEMENT_ROLLUP_FIELDS):
+        for key, amount in endorsement_rollup_counters(endorsement)[0].items():
+            counters[key] = counters.get(key, 0) + amount
+    if not counters:
+        return 0
+    [(query, update)] = rollups.build_updates(counters, totals_only=True)
+    try:
+        metrics_rollups_collection.update_one(
+            {**query, "counters.endorsements": {"$exists": False}}, update, upsert=True
+        )
+    except DuplicateKeyError:
+        print("[backfill_endorsement_rollups] Already backfilled")
+        return 0
+    print(f"[backfill_endorsement_rollups] Backfilled {len(counters)} counters")
+    return len(counters)
+
+
+# Deployments that never ran rebuild-rollups get their endorsement totals on
+# the first start
+if not RUNNING_TESTS:
+    try:
+        backfill_endorsement_rollups()
+    except Exception as e:
+        print(f"[mongo.py] Failed to backfill endorsement rollups: {e}")
+
+
+def rebuild_metrics_rollups():
+    """Recompute the metrics rollup documents from the raw collections.
+
+    Used once to backfill the rollups for data written before they existed.
+    Run it while the backend is scaled down, otherwise increments written
+    during the rebuild are lost. OTP codes are deleted once used or expired,
+    so only the codes still in otp_codes are counted. LLM usage is summed
+    from the hourly buckets, so run migrate-llm-usage first.
+    """
+    print("[rebuild_metrics_rollups] Called")
+    pending = {}
+
+    def add(counters, when=None, totals_only=False):
+        rollups.merge_updates(
+            rollups.build_updates(counters, when, totals_only=totals_only), pending
+        )
+
+    for call in api_calls_collection.find(
+        {}, {"endpoint": 1, "status_code": 1, "timestamp": 1}
+    ):
+        add(
+            api_call_counters(call.get("endpoint"), call.get("status_code")),
+            when=call.get("timestamp"),
+        )
+
+    for doc in llm_usage_buckets_collection.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": "$model_name",
+                    "prompt_tokens": {"$sum": "$prompt_tokens"},
+                    "completion_tokens": {"$sum": "$completion_tokens"},
+                    "total_tokens": {"$sum": "$total_tokens"},
+                }
+            }
+        ]
+    ):
+        add(
+            {
+                rollups.counter_key("llm", "prompt_tokens"): doc["prompt_tokens"],
+                rollups.counter_key("llm", "completion_tokens"): doc[
+                    "completion_tokens"
+                ],
+                rollups.counter_key("llm", "total_tokens"): doc["total_tokens"],
+                rollups.counter_key("llm_models", doc["_id"], "total_tokens"): doc[
+                    "total_tokens"
+                ],
+            },
+            totals_only=True,
+        )
+
+    for doc in conversations_collection.aggregate(
+        [
+            {
+                "$project": {
+                    "created_at": 1,
+                    "topics": 1,
+                    "message_count": {
+                        "$ifNull": [
+                            "$message_count",
+                            {"$size": {"$ifNull": ["$messages", []]}},
+                        ]
+                    },
+                }
+            }
+        ]
+    ):
+        add(
+            {
+                rollups.counter_key("conversations", "total"): 1,
+                rollups.counter_key("conversations", "messages"): doc["message_count"],
+                **{
+                    rollups.counter_key("topics", topic): count
+                    for topic, count in Counter(doc.get("topics") or []).items()
+                    if topic
+                },
+            },
+            when=doc.get("created_at"),
+        )
+
+    add(
+        {
+            rollups.counter_key("exports", "total"): exports_collection.count_documents(
+                {}
+            )
+        },
+        totals_only=True,
+    )
+
+    for otp in otp_collection.find({}, {"action": 1, "created_at": 1}):
+        add(
+            {
+                rollups.counter_key("otp", "generated"): 1,
+                rollups.counter_key("otp", "action", otp.get("action")): 1,
+            },
+            when=otp.get("created_at"),
+        )
+
+    for endorsement in endorsements_collection.find({}, ENDORSEMENT_ROLLUP_FIELDS):
+        counters, when = endorsement_rollup_counters(endorsement)
+        add(counters, when=when)
+
+    metrics_rollups_collection.delete_many({})
+    if pending:
+        metrics_rollups_collection.bulk_write(
+            [
+                UpdateOne({"_id": bucket}, update, upsert=True)
+                for bucket, update in pending.items()
+            ],
+            ordered=False,
+        )
+    print(f"[rebuild_metrics_rollups] Wrote {len(pending)} rollup documents")
+    return len(pending)
+
+
+def migrate_llm_usage_to_buckets():
+    """Move the embedded llm_usage logs arrays into hourly usage buckets.
+
+    Each model document is processed on its own: its logs are summed into
+    llm_usage_buckets and then removed from the model document. Every bucket
+    records the model documents merged into it (migrated_from), and the
+    update only matches buckets that don't list this document yet, so
+    re-running after an interruption never counts the same logs twice.
+    """
+    print("[migrate_llm_usage_to_buckets] Called")
+    migrated = 0
+    for doc in llm_usage_collection.find({"logs": {"$exists": True}}):
+        model_name = doc.get("model_name", "unknown")
+        buckets = {}
+        for log in sorted(
+            (log for log in doc.get("logs", []) if "timestamp" in log),
+            key=lambda log: log["timestamp"],
+        ):
+            hour = rollups.bucket_start(log["timestamp"], "hour")
+            bucket = buckets.setdefault(
+                hour,
+                {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                    "requests": 0,
+                    "samples": [],
+                },
+            )
+            bucket["prompt_tokens"] += log.get("prompt_tokens", 0)
+            bucket["completion_tokens"] += log.get("completion_tokens", 0)
+            bucket["total_tokens"] += log.get("total_tokens", 0)
+            bucket["requests"] += 1
+            bucket["samples"].append(log)
+
+        operations = [
+            UpdateOne(
+                {
+                    "_id": llm_usage_bucket_id(model_name, hour),
+                    "migrated_from": {"$ne": doc["_id"]},
+                },
+                {
+                    "$setOnInsert": {"model_name": model_name, "hour": hour},
+                    "$addToSet": {"migrated_from": doc["_id"]},
+                    "$inc": {
+                        "prompt_tokens": bucket["prompt_tokens"],
+                        "completion_tokens": bucket["completion_tokens"],
+                        "total_tokens": bucket["total_tokens"],
+                        "requests": bucket["requests"],
+                    },
+                    "$push": {
+                        "samples": {
+                            "$each": bucket["samples"][-LLM_USAGE_SAMPLE_SIZE:],
+                            "$slice": -LLM_USAGE_SAMPLE_SIZE,
+                        }
+                    },
+                },
+                upsert=True,
+            )
+            for hour, bucket in buckets.items()
+        ]
+        # A bucket that already lists this document is skipped
+        bulk_write_once(llm_usage_buckets_collection, operations)
+        llm_usage_collection.update_one({"_id": doc["_id"]}, {"$unset": {"logs": ""}})
+        migrated += len(doc.get("logs", []))
+        print(
+            f"[migrate_llm_usage_to_buckets] {model_name}: {len(doc.get('logs', []))} logs into {len(operations)} buckets"
+        )
+    print(f"[migrate_llm_usage_to_buckets] Migrated {migrated} logs")
+    return migrated
+
+
+def split_turns(messages):
+    """Group a messages array into (seq, messages) turns, each starting at a user message."""
+    turns = []
+    for seq, message in enumerate(messages):
+        if not turns or message.get("role") == "user":
+            turns.append((seq, []))
+        turns[-1][1].append(message)
+    return turns
+
+
+def migrate_conversations(layout="embedded"):
+    """Bring conversation documents up to date with CONVERSATION_STORAGE.
+
+    Every conversation gets a message_count. With layout="turns", embedded
+    messages arrays are also split into conversation_turns documents and
+    removed; each conversation is handled on its own, so the migration can be
+    re-run after an interruption.
+    """
+    print(f"[migrate_conversations] Called with layout={layout}")
+    conversations_collection.update_many(
+        {"message_count": {"$exists": False}},
+        [{"$set": {"message_count": {"$size": {"$ifNull": ["$messages", []]}}}}],
+    )
+    if layout != "turns":
+        return 0
+
+    migrated = 0
+    for doc in conversations_collection.find({"messages": {"$exists": True}}):
+        turns = split_turns(doc.get("messages") or [])
+        if turns:
+            conversation_turns_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"conversation_id": doc["conversation_id"], "seq": seq},
+                        {
+                            "$setOnInsert": {
+                                "messages": messages,
+                                "created_at": doc.get("created_at"),
+                            }
+                        },
+                        upsert=True,
+                    )
+                    for seq, messages in turns
+                ],
+                ordered=False,
+            )
+        conversations_collection.update_one(
+            {"_id": doc["_id"]},
+            {
+                "$set": {
+                    "message_count": len(doc.get("messages") or []),
+                    "turn_count": len(turns),
+                },
+                "$unset": {"messages": ""},
+            },
+        )
+        migrated += 1
+    print(f"[migrate_conversations] Migrated {migrated} conversations")
+    return migrated
@@ -0,0 +1,126 @@
+import threading
+import time
+from prometheus_client import Counter
+from response_cache import RedisBacked, redis_client
+
+llm_rate_limit_reservations_total = Counter(
+    "llm_rate_limit_reservations_total",
+    "Blocks of rate-limit capacity reserved from Redis",
+    ["model", "kind"],
+)
+llm_rate_limited_requests_total = Counter(
+    "llm_rate_limited_requests_total",
+    "LLM calls rejected by the local rate limiter",
+    ["model"],
+)
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateLimiter(RedisBacked):
+    """Per-model requests/minute and tokens/minute limits, checked in process.
+
+    Each process reserves capacity from per-minute Redis counters in blocks
+    of `block` of the limit, so most acquire() calls never touch Redis.
+    Unused capacity lapses with the minute. If Redis is unreachable,
+    requests are let through. A limit of 0 or None is not enforced.
+    """
+
+    def __init__(
+        self,
+        model,
+        rpm,
+        tpm,
+        block=0.05,
+        prefix="llm-ratelimit",
+        client_factory=redis_client,
+        clock=time.time,
+    ):
+        super().__init__(client_factory)
+        self.model = model
+        self.limits = {
+            kind: limit for kind, limit in (("requests", rpm), ("tokens", tpm)) if limit
+        }
+        self.block = block
+        self.prefix = prefix
+        self.clock = clock
+        self._window = None
+        self._balance = {}
+        self._lock = threading.Lock()
+
+    def key(self, kind, window):
+        return f"{self.prefix}:{self.model}:{kind}:{window}"
+
+    def acquire(self, tokens):
+        """Take one request and `tokens` tokens, or raise RateLimitExceeded.
+
+        May reserve capacity from Redis, so call it off the event loop.
+        """
+        wanted = {"requests": 1, "tokens": tokens}
+        for retry in (True, False):
+            with self._lock:
+                window = self._roll_window()
+                shortfalls = {
+                    kind: wanted[kind] - self._balance[kind]
+                    for kind in self.limits
+                    if wanted[kind] > self._balance[kind]
+                }
+            # The lock is not held across the Redis round trip. Threads that
+            # reserve at the same time only leave extra capacity in the bucket.
+            reserved = {
+                kind: self._reserve(kind, self.limits[kind], shortfall, window)
+                for kind, shortfall in shortfalls.items()
+            }
+            with self._lock:
+                if self._roll_window() == window:
+                    for kind, amount in reserved.items():
+                        self._balance[kind] += amount
+                elif retry:
+                    # The minute ended during the round trip and what was
+                    # reserved lapsed with it; reserve for the new minute
+                    continue
+                short = [
+                    kind for kind in self.limits if self._balance[kind] < wanted[kind]
+                ]
+                if short:
+                    llm_rate_limited_requests_total.labels(model=self.model).inc()
+                    raise RateLimitExceeded(
+                        f"Rate limit for {self.model} reached ({', '.join(short)} per minute)"
+                    )
+                for kind in self.limits:
+                    self._balance[kind] -= wanted[kind]
+                return
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Charge the difference between a call's estimated and actual tokens."""
+        if "tokens" not in self.limits:
+            return
+        with self._lock:
+            self._roll_window()
+            self._balance["tokens"] += estimated_tokens - actual_tokens
+
+    def _roll_window(self):
+        window = int(self.clock() // 60)
+        if window != self._window:
+            self._window = window
+            self._balance = {kind: 0 for kind in self.limits}
+        return window
+
+    def _reserve(self, kind, limit, shortfall, window):
+        wanted = max(shortfall, int(limit * self.block), 1)
+        key = self.key(kind, window)
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.incrby(key, wanted)
+            pipeline.expire(key, 120)
+            total, _ = pipeline.execute()
+            granted = max(0, min(wanted, limit - (total - wanted)))
+            if granted < wanted:
+                self.client.decrby(key, wanted - granted)
+        except Exception as e:
+            print(f"[RateLimiter] Failed to reserve {kind} for {self.model}: {e}")
+            return wanted
+        llm_rate_limit_reservations_total.labels(model=self.model, kind=kind).inc()
+        return granted
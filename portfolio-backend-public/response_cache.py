@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import redis
+from prometheus_client import Counter
+
+chat_response_cache_hits_total = Counter(
+    "chat_response_cache_hits_total", "Chat responses served from the response cache"
+)
+chat_response_cache_misses_total = Counter(
+    "chat_response_cache_misses_total", "Chat requests not found in the response cache"
+)
+
+
+def normalize(text):
+    """Collapse whitespace and case so trivially different questions share a key."""
+    return " ".join(text.split()).casefold()
+
+
+def redis_client():
+    return redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        password=os.getenv("REDIS_PASSWORD", ""),
+        decode_responses=True,
+        socket_timeout=1,
+        socket_connect_timeout=1,
+    )
+
+
+class RedisBacked:
+    """Base for the Redis-backed helpers: connects on first use.
+
+    Redis errors are logged and handled by each helper, never raised.
+    """
+
+    def __init__(self, client_factory=redis_client):
+        self.client_factory = client_factory
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+
+class ResponseCache(RedisBacked):
+    """Exact-match cache of chat responses; a Redis failure is a miss.
+
+    Keys include the system prompt version, so editing context.md moves
+    every lookup to new keys.
+    """
+
+    def __init__(self, ttl, prefix="chat-response", client_factory=redis_client):
+        super().__init__(client_factory)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def key(self, prompt_version, messages, new_message):
+        payload = json.dumps(
+            {
+                "prompt": prompt_version,
+                "messages": [[msg.role, normalize(msg.content)] for msg in messages],
+                "new_message": normalize(new_message),
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return f"{self.prefix}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            cached = self.client.get(key)
+            if cached is not None:
+                chat_response_cache_hits_total.inc()
+                return json.loads(cached)
+        except Exception as e:
+            print(f"[ResponseCache] Failed to read {key}: {e}")
+        chat_response_cache_misses_total.inc()
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        try:
+            self.client.set(key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            print(f"[ResponseCache] Failed to write {key}: {e}")
@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta
+
+# Time-bucketed counter documents maintained at write time so that
+# get_metrics_data can read a handful of small documents instead of
+# rescanning the raw collections on every Prometheus scrape.
+#
+# Each bucket document looks like:
+#   {
+#       "_id": "hour:2025-01-01T13:00:00",
+#       "granularity": "hour",
+#       "bucket": datetime(2025, 1, 1, 13, 0),
+#       "expires_at": datetime(2025, 1, 3, 13, 0),  # TTL index
+#       "counters": {"api_calls": {"total": 12, "endpoint": {"chat": 3}}},
+#   }
+# plus a single all-time document with _id "total" that never expires.
+
+TOTAL_ID = "total"
+
+# granularity -> (bucket width, how long the bucket is kept)
+GRANULARITIES = {
+    "minute": (timedelta(minutes=1), timedelta(hours=2)),
+    "hour": (timedelta(hours=1), timedelta(days=2)),
+    "day": (timedelta(days=1), timedelta(days=400)),
+}
+
+# Windows reported by get_metrics_data and the granularity used for each
+WINDOWS = {
+    "last_hour": ("minute", timedelta(hours=1)),
+    "last_day": ("hour", timedelta(days=1)),
+    "last_week": ("day", timedelta(weeks=1)),
+    "last_month": ("day", timedelta(days=30)),
+}
+
+
+def _escape(part):
+    # Mongo field names cannot contain "." and should not start with "$"
+    return str(part).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _unescape(part):
+    return part.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def counter_key(*parts):
+    """Build a dotted counter key, escaping label values such as emails."""
+    return ".".join(_escape(part) for part in parts)
+
+
+def bucket_start(when, granularity):
+    if granularity == "minute":
+        return when.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return when.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def bucket_id(granularity, start):
+    return f"{granularity}:{start.isoformat()}"
+
+
+def build_updates(counters, when=None, now=None, totals_only=False):
+    """Return (filter, update) pairs that apply `counters` to every bucket.
+
+    Buckets whose retention already elapsed (e.g. decrementing the minute
+    bucket of an endorsement created last week) are skipped. With
+    totals_only only the all-time document is updated.
+    """
+    now = now or datetime.utcnow()
+    when = when or now
+    inc = {f"counters.{key}": amount for key, amount in counters.items() if amount}
+    if not inc:
+        return []
+
+    updates = [
+        ({"_id": TOTAL_ID}, {"$inc": inc, "$setOnInsert": {"granularity": "total"}})
+    ]
+    if totals_only:
+        return updates
+    for granularity, (width, retention) in GRANULARITIES.items():
+        start = bucket_start(when, granularity)
+        expires_at = start + width + retention
+        if expires_at <= now:
+            continue
+        updates.append(
+            (
+                {"_id": bucket_id(granularity, start)},
+                {
+                    "$inc": inc,
+                    "$setOnInsert": {
+                        "granularity": granularity,
+                        "bucket": start,
+                        "expires_at": expires_at,
+                    },
+                },
+            )
+        )
+    return updates
+
+
+def merge_updates(updates, merged=None):
+    """Fold (filter, update) pairs into {bucket_id: update}, summing increments.
+
+    Pass the returned dict back in as `merged` to keep accumulating.
+    """
+    merged = {} if merged is None else merged
+    for query, update in updates:
+        entry = merged.get(query["_id"])
+        if entry is None:
+            merged[query["_id"]] = {
+                "$inc": dict(update["$inc"]),
+                "$setOnInsert": update["$setOnInsert"],
+            }
+            continue
+        for key, amount in update["$inc"].items():
+            entry["$inc"][key] = entry["$inc"].get(key, 0) + amount
+    return merged
+
+
+def window_query(now):
+    """Single query that fetches the total document and every bucket any window needs."""
+    clauses = [{"_id": TOTAL_ID}]
+    oldest = {}
+    for granularity, span in WINDOWS.values():
+        since = bucket_start(now - span, granularity)
+        if granularity not in oldest or since < oldest[granularity]:
+            oldest[granularity] = since
+    for granularity, since in oldest.items():
+        clauses.append({"granularity": granularity, "bucket": {"$gte": since}})
+    return {"$or": clauses}
+
+
+def flatten(counters, prefix=""):
+    flat = {}
+    for key, value in counters.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _add(target, counters):
+    for key, value in flatten(counters).items():
+        target[key] = target.get(key, 0) + value
+
+
+def summarize(docs, now):
+    """Fold fetched rollup documents into {"total": {...}, "last_hour": {...}, ...}."""
+    result = {"total": {}}
+    result.update({window: {} for window in WINDOWS})
+    for doc in docs:
+        counters = doc.get("counters", {})
+        if doc.get("_id") == TOTAL_ID:
+            _add(result["total"], counters)
+            continue
+        for window, (granularity, span) in WINDOWS.items():
+            if doc.get("granularity") != granularity:
+                continue
+            if doc["bucket"] >= bucket_start(now - span, granularity):
+                _add(result[window], counters)
+    return result
+
+
+def value(counters, *parts):
+    return counters.get(counter_key(*parts), 0)
+
+
+def labels(counters, *parts):
+    """Return {label: count} for every counter directly under the given prefix."""
+    prefix = counter_key(*parts) + "."
+    found = {}
+    for key, count in counters.items():
+        if key.startswith(prefix):
+            label = key[len(prefix) :]
+            if "." not in label:
+                found[_unescape(label)] = count
+    return found
+
+
+def nested_labels(counters, *parts):
+    """Return {label: {field: count}} for counters stored as prefix.<label>.<field>."""
+    prefix = counter_key(*parts) + "."
+    found = {}
+    for key, count in counters.items():
+        if key.startswith(prefix):
+            label, _, field = key[len(prefix) :].partition(".")
+            if field:
+                found.setdefault(_unescape(label), {})[field] = count
+    return found
+
+
+def top(counts, limit=None):
+    """Drop non-positive counts and order the rest from highest to lowest."""
+    ordered = sorted(
+        ((label, count) for label, count in counts.items() if count > 0),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return dict(ordered[:limit] if limit else ordered)
@@ -0,0 +1,123 @@
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from prometheus_client import Counter
+from response_cache import RedisBacked, redis_client
+
+chat_coalesced_requests_total = Counter(
+    "chat_coalesced_requests_total",
+    "Chat requests answered by another request's in-flight LLM call",
+    ["scope"],
+)
+
+
+class SingleFlight(RedisBacked):
+    """Share one in-flight call between concurrent requests for the same key.
+
+    Within a process, later requests await the first one's result. Across
+    pods the leader takes a Redis lock for `ttl` seconds; a pod that finds
+    the lock held polls for the holder's result instead of calling. A ttl
+    of 0 disables coalescing.
+    """
+
+    def __init__(
+        self,
+        ttl,
+        poll_interval=0.1,
+        prefix="chat-inflight",
+        client_factory=redis_client,
+    ):
+        super().__init__(client_factory)
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def lock_key(self, key):
+        return f"{self.prefix}:{key}:lock"
+
+    def result_key(self, key):
+        return f"{self.prefix}:{key}:result"
+
+    async def run(self, key, call):
+        """Return the result of `await call()`, shared with concurrent callers.
+
+        Results must be JSON-serializable; tuples come back from other pods
+        as lists.
+        """
+        if not self.enabled:
+            return await call()
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+        if not leader:
+            chat_coalesced_requests_total.labels(scope="local").inc()
+            print(f"[SingleFlight] Waiting for in-flight call {key}")
+            return await asyncio.wrap_future(future)
+        try:
+            result = await self._lead(key, call)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def _lead(self, key, call):
+        try:
+            acquired = await asyncio.to_thread(
+                self.client.set, self.lock_key(key), "1", nx=True, ex=self.ttl
+            )
+        except Exception as e:
+            print(f"[SingleFlight] Failed to lock {key}: {e}")
+            return await call()
+        if not acquired:
+            shared = await self._wait_for_remote(key)
+            if shared is not None:
+                chat_coalesced_requests_total.labels(scope="remote").inc()
+                return shared
+            return await call()
+        try:
+            result = await call()
+        except BaseException:
+            await asyncio.to_thread(self._release, key)
+            raise
+        try:
+            await asyncio.to_thread(
+                self.client.set, self.result_key(key), json.dumps(result), ex=self.ttl
+            )
+        except Exception as e:
+            print(f"[SingleFlight] Failed to share result of {key}: {e}")
+            await asyncio.to_thread(self._release, key)
+        return result
+
+    async def _wait_for_remote(self, key):
+        deadline = time.monotonic() + self.ttl
+        try:
+            while time.monotonic() < deadline:
+                shared = await asyncio.to_thread(self.client.get, self.result_key(key))
+                if shared is not None:
+                    return json.loads(shared)
+                if not await asyncio.to_thread(self.client.exists, self.lock_key(key)):
+                    return None
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            print(f"[SingleFlight] Failed to wait for {key}: {e}")
+        return None
+
+    def _release(self, key):
+        try:
+            self.client.delete(self.lock_key(key))
+        except Exception as e:
+            print(f"[SingleFlight] Failed to release {key}: {e}")
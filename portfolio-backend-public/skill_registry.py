@@ -0,0 +1,83 @@
+import threading
+from content_cache import ContentCache
+
+SKILLS_FILE = "skills.json"
+
+
+class SkillRegistry:
+    """Index of the skills in skills.json, keyed by skill id.
+
+    The file is read through a ContentCache, so the index is rebuilt only
+    when skills.json changes on disk.
+    """
+
+    def __init__(self, cache, filename=SKILLS_FILE):
+        self.cache = cache
+        self.filename = filename
+        self._source = None
+        self._skills = {}
+        self._lock = threading.Lock()
+
+    def skills(self):
+        """Return {skill_id: {"id", "name", "level", "category"}}."""
+        content = self.cache.get(self.filename)
+        if content is not self._source:
+            with self._lock:
+                if content is not self._source:
+                    self._skills = build_index(content.data)
+                    self._source = content
+        return self._skills
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self._source = None
+            self._skills = {}
+
+
+def build_index(skills_data):
+    index = {}
+    for category in skills_data.get("skillCategories", []):
+        for skill in category.get("skills", []):
+            index[skill["id"]] = {
+                "id": skill["id"],
+                "name": skill.get("name", skill["id"]),
+                "level": skill.get("level"),
+                "category": category.get("title"),
+            }
+    return index
+
+
+registry = SkillRegistry(ContentCache("external_context", compress=False))
+
+
+def get_skill(skill_id):
+    """Return the indexed skill, or None if it doesn't exist or skills.json can't be read."""
+    try:
+        return registry.skills().get(skill_id)
+    except Exception as e:
+        print(f"[get_skill] Exception: {e}")
+        return None
+
+
+def skill_exists(skill_id):
+    return get_skill(skill_id) is not None
+
+
+def get_skill_name_by_id(skill_id):
+    """Return the skill's name, or skill_id itself if it is unknown."""
+    skill = get_skill(skill_id)
+    return skill["name"] if skill else skill_id
+
+
+def get_skill_names(skill_ids):
+    """Resolve many skill ids at once; unknown ids map to themselves."""
+    try:
+        skills = registry.skills()
+    except Exception as e:
+        print(f"[get_skill_names] Exception: {e}")
+        skills = {}
+    return {
+        skill_id: skills[skill_id]["name"] if skill_id in skills else skill_id
+        for skill_id in skill_ids
+    }
@@ -21,7 +21,16 @@ os.environ["PORT"] = "5000"
 
 # Mock the llm module
 sys.modules["llm"] = __import__(
-    "tests.mock_llm", fromlist=["router", "get_context_prompt"]
+    "tests.mock_llm",
+    fromlist=[
+        "router",
+        "hedged_calls",
+        "get_context_prompt",
+        "get_prompt_version",
+        "get_context_budget",
+        "get_rate_limiter",
+        "prompt_registry",
+    ],
 )
 
 
@@ -37,6 +46,8 @@ def mock_mongodb():
 @pytest.fixture(autouse=True)
 def mock_redis():
     with patch("redis.Redis") as mock:
+        # Empty cache: response cache lookups miss
+        mock.return_value.get.return_value = None
         yield mock
 
 
@@ -44,3 +55,96 @@ def mock_redis():
 def mock_get_context():
     with patch("llm.get_context_prompt", return_value="Test context"):
         yield
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis.Redis commands the backend uses.
+
+    Values are kept as given (like decode_responses=True). round_trips counts
+    commands sent on their own plus executed pipelines.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.round_trips = 0
+        self._pipelined = False
+
+    def _send(self):
+        if not self._pipelined:
+            self.round_trips += 1
+
+    def get(self, key):
+        self._send()
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        self._send()
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        if ex is not None:
+            self.ttls[key] = ex
+        return True
+
+    def exists(self, key):
+        self._send()
+        return int(key in self.values)
+
+    def delete(self, key):
+        self._send()
+        return int(self.values.pop(key, None) is not None)
+
+    def incrby(self, key, amount):
+        self._send()
+        self.values[key] = int(self.values.get(key, 0)) + amount
+        return self.values[key]
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def decrby(self, key, amount):
+        return self.incrby(key, -amount)
+
+    def expire(self, key, ttl):
+        self._send()
+        self.ttls[key] = ttl
+        return True
+
+    def rpush(self, key, *values):
+        self._send()
+        self.values.setdefault(key, []).extend(values)
+        return len(self.values[key])
+
+    def lrange(self, key, start, end):
+        self._send()
+        return list(self.values.get(key, []))[start : None if end == -1 else end + 1]
+
+    def ltrim(self, key, start, end):
+        self._send()
+        self.values[key] = self.values.get(key, [])[
+            start : None if end == -1 else end + 1
+        ]
+        return True
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    def execute(self):
+        self.redis.round_trips += 1
+        self.redis._pipelined = True
+        try:
+            return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        finally:
+            self.redis._pipelined = False
+            self.commands = []
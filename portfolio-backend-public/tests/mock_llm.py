@@ -1,4 +1,5 @@
 from unittest.mock import MagicMock
+from hedging import HedgedCalls
 
 # Create a mock router
 router = MagicMock()
@@ -7,6 +8,24 @@ router.acompletion.return_value = {
     "usage": {"total_tokens": 10},
 }
 
+# Hot-reloading of the system prompt is never started under tests
+prompt_registry = MagicMock()
+
+# Hedging off: every call goes straight to the router
+hedged_calls = HedgedCalls(quantile=0)
+
 
 def get_context_prompt():
     return "Test context"
+
+
+def get_prompt_version():
+    return "test-version"
+
+
+def get_context_budget(model):
+    return None
+
+
+def get_rate_limiter(model):
+    return None
@@ -1,9 +1,21 @@
 import pytest
-from unittest.mock import patch, MagicMock, AsyncMock, mock_open
-from app import app, send_email, get_skill_name_by_id
+from unittest.mock import patch, MagicMock, AsyncMock, PropertyMock, mock_open
+from app import (
+    app,
+    content_cache,
+    send_email,
+    get_skill_name_by_id,
+    rate_limited_completion,
+    metrics_collector as app_metrics_collector,
+)
+from metrics_collector import MetricsCollector, metrics_snapshot_age_seconds
+from skill_registry import registry as skill_registry
 import json
+import asyncio
+import threading
 from datetime import datetime
 from models import ChatRequest, ContactForm, ExportChatRequest, OTPRequest
+from rate_limiter import RateLimitExceeded
 
 
 @pytest.fixture
@@ -17,7 +29,7 @@ def client():
 def mock_smtp():
     with patch("smtplib.SMTP") as mock:
         mock_smtp_instance = MagicMock()
-        mock.return_value.__enter__.return_value = mock_smtp_instance
+        mock.return_value = mock_smtp_instance
         yield mock_smtp_instance
 
 
@@ -49,6 +61,16 @@ def mock_mongo():
         }
 
 
+@pytest.fixture(autouse=True)
+def clear_content_cache():
+    """Tests patch open() with fake file contents; don't let them leak."""
+    content_cache.clear()
+    skill_registry.clear()
+    yield
+    content_cache.clear()
+    skill_registry.clear()
+
+
 # REAL UNIT TESTS - Testing actual business logic
 class TestDataValidation:
     """Test Pydantic model validation - real business logic"""
@@ -181,7 +203,7 @@ class TestEmailFunctionality:
         """Test successful email sending"""
         with patch("smtplib.SMTP") as mock_smtp_class:
             mock_server = MagicMock()
-            mock_smtp_class.return_value.__enter__.return_value = mock_server
+            mock_smtp_class.return_value = mock_server
 
             with patch.dict(
                 "os.environ",
@@ -234,6 +256,184 @@ def test_chat_endpoint(client, mock_llm, mock_mongo):
     mock_mongo["log_api_call"].assert_called_once()
 
 
+def running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def test_chat_redis_calls_run_off_the_event_loop(client, mock_llm, mock_mongo):
+    loops = []
+    cache = MagicMock()
+    cache.get.side_effect = lambda key: loops.append(running_loop())
+    cache.set.side_effect = lambda key, value: loops.append(running_loop())
+    mock_llm.acompletion.return_value = {
+        "choices": [{"message": {"content": '{"message": "Hello", "topics": []}'}}],
+        "usage": {"total_tokens": 10},
+    }
+    with patch("app.chat_response_cache", cache):
+        response = client.post(
+            "/api/chat",
+            json={"messages": [], "newMessage": "Hi", "conversationId": "test-123"},
+        )
+
+    assert response.status_code == 200
+    assert loops == [None, None]
+
+
+def test_chat_history_calls_run_off_the_event_loop(client, mock_llm, mock_mongo):
+    loops = []
+    history = MagicMock()
+
+    def get(conversation_id):
+        loops.append(running_loop())
+        return []
+
+    history.get.side_effect = get
+    history.append.side_effect = lambda *args: loops.append(running_loop())
+    with patch("app.conversation_history", history):
+        response = client.post(
+            "/api/chat", json={"newMessage": "Hi", "conversationId": "test-123"}
+        )
+
+    assert response.status_code == 200
+    assert loops == [None, None]
+
+
+def test_chat_endpoint_with_server_side_history(client, mock_llm, mock_mongo):
+    history = MagicMock()
+    history.get.return_value = [{"role": "user", "content": "Hello", "seq": 4}]
+    with patch("app.conversation_history", history):
+        response = client.post(
+            "/api/chat",
+            json={"newMessage": "How are you?", "conversationId": "test-123"},
+        )
+
+    assert response.status_code == 200
+    history.get.assert_called_once_with("test-123")
+    sent = mock_llm.acompletion.call_args.kwargs["messages"]
+    assert [m["content"] for m in sent[1:]] == ["Hello", "How are you?"]
+    history.append.assert_called_once_with(
+        "test-123",
+        [
+            {"role": "user", "content": "How are you?", "seq": 5},
+            {"role": "assistant", "content": "Test response", "seq": 6},
+        ],
+    )
+    logged = mock_mongo["log_conversation"].call_args.args[0]
+    assert logged["messages"] == []
+
+
+def test_chat_summary_replaces_summarized_history(client, mock_llm, mock_mongo):
+    loops = []
+    summaries = MagicMock()
+    summaries.may_exist.return_value = True
+
+    def get(conversation_id):
+        loops.append(running_loop())
+        return {"text": "Asked about Kubernetes", "through": 2}
+
+    summaries.get.side_effect = get
+    with patch("app.conversation_summaries", summaries):
+        response = client.post(
+            "/api/chat",
+            json={
+                "messages": [
+                    {"role": "user", "content": "one"},
+                    {"role": "assistant", "content": "two"},
+                    {"role": "user", "content": "three"},
+                ],
+                "newMessage": "four",
+                "conversationId": "test-123",
+            },
+        )
+
+    assert response.status_code == 200
+    sent = mock_llm.acompletion.call_args.kwargs["messages"]
+    assert "Asked about Kubernetes" not in sent[0]["content"]
+    assert sent[1] == {
+        "role": "user",
+        "content": "Summary of the conversation so far:\nAsked about Kubernetes",
+    }
+    assert [m["content"] for m in sent[2:]] == ["three", "four"]
+    summaries.maybe_refresh.assert_called_once_with("test-123", 5)
+    assert loops == [None]
+
+
+def test_chat_endpoint_rate_limited(client, mock_llm, mock_mongo):
+    limiter = MagicMock()
+    limiter.acquire.side_effect = RateLimitExceeded("Rate limit reached")
+    with patch("app.get_rate_limiter", return_value=limiter):
+        response = client.post(
+            "/api/chat",
+            json={"messages": [], "newMessage": "Hi", "conversationId": "test-123"},
+        )
+
+    assert response.status_code == 429
+    mock_llm.acompletion.assert_not_called()
+    mock_mongo["log_conversation"].assert_not_called()
+
+
+def test_rate_limit_is_acquired_off_the_loop_and_refunded_on_failure(mock_llm):
+    loops = []
+    limiter = MagicMock()
+    limiter.acquire.side_effect = lambda tokens: loops.append(running_loop())
+    mock_llm.acompletion.side_effect = asyncio.CancelledError
+    with patch("app.get_rate_limiter", return_value=limiter), patch(
+        "app.count_prompt_tokens", return_value=42
+    ):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(rate_limited_completion("m", []))
+
+    assert loops == [None]
+    limiter.settle.assert_called_once_with(42, 0)
+
+
+def test_call_cancelled_while_acquiring_still_settles(mock_llm):
+    acquiring, release = threading.Event(), threading.Event()
+    limiter = MagicMock()
+    limiter.acquire.side_effect = lambda tokens: acquiring.set() or release.wait(5)
+
+    async def main():
+        task = asyncio.ensure_future(rate_limited_completion("m", []))
+        await asyncio.to_thread(acquiring.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+        for _ in range(100):
+            if limiter.settle.called:
+                break
+            await asyncio.sleep(0.01)
+
+    with patch("app.get_rate_limiter", return_value=limiter), patch(
+        "app.count_prompt_tokens", return_value=42
+    ):
+        asyncio.run(main())
+
+    mock_llm.acompletion.assert_not_called()
+    limiter.settle.assert_called_once_with(42, 0)
+
+
+def test_chat_stream_rate_limited(client, mock_mongo):
+    limiter = MagicMock()
+    limiter.acquire.side_effect = RateLimitExceeded("Rate limit reached")
+    with patch("app.get_rate_limiter", return_value=limiter), patch(
+        "app.router"
+    ) as mock_router:
+        response = client.post(
+            "/api/chat/stream",
+            json={"messages": [], "newMessage": "Hi", "conversationId": "test-123"},
+        )
+        body = response.get_data(as_text=True)
+
+    assert body.startswith("event: error")
+    assert "Rate limit reached" in body
+    mock_router.acompletion.assert_not_called()
+    limiter.settle.assert_not_called()
+
+
 def test_contact_endpoint(client, mock_smtp, mock_mongo):
     data = {
         "name": "Test User",
@@ -329,6 +529,61 @@ def test_contact_endpoint_smtp_error(client, mock_smtp, mock_mongo):
     mock_mongo["log_api_call"].assert_called_once()
 
 
+def test_chat_endpoint_serves_cached_response(client, mock_llm, mock_mongo):
+    with patch("app.chat_response_cache.get") as mock_cache_get:
+        mock_cache_get.return_value = {"content": "Cached answer", "topics": ["AWS"]}
+        response = client.post(
+            "/api/chat",
+            json={"messages": [], "newMessage": "Hi", "conversationId": "test-123"},
+        )
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["content"] == "Cached answer"
+    mock_llm.acompletion.assert_not_called()
+    mock_mongo["log_llm_usage"].assert_not_called()
+    assert mock_mongo["log_conversation"].call_args.args[0]["topics"] == ["AWS"]
+
+
+def test_chat_stream_endpoint(client, mock_mongo):
+    async def llm_stream():
+        for text in ['{"message": "Hel', 'lo", "topics"', ': ["DevOps"]}']:
+            yield MagicMock(
+                choices=[MagicMock(delta=MagicMock(content=text))], usage=None
+            )
+        yield MagicMock(choices=[], usage={"total_tokens": 10})
+
+    with patch("app.router") as mock_router:
+        mock_router.acompletion = AsyncMock(return_value=llm_stream())
+        response = client.post(
+            "/api/chat/stream",
+            json={
+                "messages": [],
+                "newMessage": "Hi",
+                "conversationId": "test-123",
+            },
+        )
+        body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = [
+        (lines[0][len("event: ") :], json.loads(lines[1][len("data: ") :]))
+        for lines in (event.split("\n") for event in body.strip().split("\n\n"))
+    ]
+    assert events[:2] == [
+        ("message", {"content": "Hel"}),
+        ("message", {"content": "lo"}),
+    ]
+    assert events[-1][0] == "done"
+    assert events[-1][1]["content"] == "Hello"
+    assert events[-1][1]["topics"] == ["DevOps"]
+    assert mock_router.acompletion.call_args.kwargs["stream"] is True
+    mock_mongo["log_llm_usage"].assert_called_once_with(
+        "gemini-2.0-flash-lite", "Hi", {"total_tokens": 10}
+    )
+    assert mock_mongo["log_conversation"].call_args.args[0]["topics"] == ["DevOps"]
+
+
 # Simple tests for GET endpoints
 def test_get_projects_endpoint(client, mock_mongo):
     with patch(
@@ -367,6 +622,21 @@ def test_get_about_endpoint(client, mock_mongo):
         mock_mongo["log_api_call"].assert_called_once()
 
 
+def test_get_about_returns_304_for_matching_etag(client, mock_mongo):
+    with patch(
+        "builtins.open", mock_open(read_data='{"name": "Test User", "bio": "Test bio"}')
+    ):
+        first = client.get("/api/get-about")
+        etag = first.headers["ETag"]
+        second = client.get("/api/get-about", headers={"If-None-Match": etag})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.data == b""
+    assert second.headers["ETag"] == etag
+    assert mock_mongo["log_api_call"].call_args.args[2] == 304
+
+
 def test_get_endorsements_endpoint(client, mock_mongo):
     with patch("app.get_all_endorsements") as mock_get_endorsements:
         mock_get_endorsements.return_value = [
@@ -382,12 +652,40 @@ def test_get_endorsements_endpoint(client, mock_mongo):
         mock_mongo["log_api_call"].assert_called_once()
 
 
+def test_get_endorsements_paginated(client, mock_mongo):
+    with patch("app.get_endorsements_page") as mock_page, patch(
+        "app.get_all_endorsements"
+    ) as mock_get_all:
+        mock_page.return_value = {"endorsements": [], "nextCursor": None}
+
+        response = client.get("/api/endorsements/skill/skill-1?limit=5&cursor=abc")
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {"endorsements": [], "nextCursor": None}
+        mock_page.assert_called_once_with("skill-1", 5, "abc")
+        mock_get_all.assert_not_called()
+
+
+def test_get_endorsements_rejects_bad_page_requests(client, mock_mongo):
+    assert client.get("/api/endorsements?limit=0").status_code == 400
+    assert client.get("/api/endorsements?cursor=not-a-cursor").status_code == 400
+
+
+def test_get_endorsements_count_only(client, mock_mongo):
+    with patch("app.count_endorsements_by_skill") as mock_counts:
+        mock_counts.return_value = {"skill-1": 3}
+
+        all_counts = client.get("/api/endorsements?count_only=true")
+        one_count = client.get("/api/endorsements/skill/skill-2?count_only=true")
+
+        assert json.loads(all_counts.data) == {"counts": {"skill-1": 3}}
+        assert json.loads(one_count.data) == {"skillId": "skill-2", "count": 0}
+
+
 def test_request_otp_endpoint(client, mock_smtp, mock_mongo):
-    with patch("app.cleanup_expired_otps") as mock_cleanup, patch(
-        "app.generate_otp"
-    ) as mock_generate_otp, patch("app.store_otp") as mock_store_otp, patch(
-        "app.send_email"
-    ) as mock_send_email:
+    with patch("app.generate_otp") as mock_generate_otp, patch(
+        "app.store_otp"
+    ) as mock_store_otp, patch("app.send_email") as mock_send_email:
 
         mock_generate_otp.return_value = "123456"
         mock_send_email.return_value = True
@@ -404,3 +702,41 @@ def test_request_otp_endpoint(client, mock_smtp, mock_mongo):
         response_data = json.loads(response.data)
         assert response_data["success"] is True
         mock_mongo["log_api_call"].assert_called_once()
+
+
+def test_metrics_endpoint_collects_without_background_collector(client, mock_mongo):
+    with patch("app.get_metrics_data") as mock_get_metrics_data:
+        mock_get_metrics_data.return_value = {"exports": {"total": 3}}
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        body = response.data.decode()
+        assert "exports_total 3.0" in body
+        assert "metrics_snapshot_age_seconds" in body
+        assert "metrics_collection_duration_seconds_count" in body
+        mock_get_metrics_data.assert_called_once()
+
+
+def test_metrics_endpoint_serves_snapshot_from_collector(client, mock_mongo):
+    with patch("app.get_metrics_data") as mock_get_metrics_data, patch.object(
+        MetricsCollector, "running", new_callable=PropertyMock, return_value=True
+    ):
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        mock_get_metrics_data.assert_not_called()
+
+
+@pytest.fixture
+def restore_snapshot_age():
+    """A new MetricsCollector points the global snapshot age gauge at itself."""
+    yield
+    metrics_snapshot_age_seconds.set_function(app_metrics_collector.snapshot_age)
+
+
+def test_metrics_collector_keeps_last_snapshot_on_failure(restore_snapshot_age):
+    collector = MetricsCollector(MagicMock(side_effect=Exception("DB down")), 15)
+
+    assert collector.refresh() is False
+    assert collector.last_success is None
@@ -0,0 +1,107 @@
+import pytest
+import time
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from pymongo.errors import BulkWriteError
+from batch_writer import BatchWriter, PartialBatchError
+import mongo
+
+
+def test_submit_writes_inline_until_started():
+    write_batch = MagicMock()
+    writer = BatchWriter("inline", write_batch)
+
+    writer.submit({"n": 1})
+
+    write_batch.assert_called_once_with([{"n": 1}])
+
+
+def test_background_writer_flushes_full_batches_and_on_stop():
+    batches = []
+    writer = BatchWriter("batched", batches.append, batch_size=3, flush_interval=60)
+    writer.start()
+    for n in range(4):
+        writer.submit({"n": n})
+
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.stop()
+
+    assert batches == [[{"n": 0}, {"n": 1}, {"n": 2}], [{"n": 3}]]
+
+
+def test_failed_batches_spill_and_replay_on_start(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    failing = MagicMock(side_effect=RuntimeError("mongo down"))
+    record = {"endpoint": "/api/chat", "timestamp": datetime(2025, 1, 1, 12, 0)}
+
+    BatchWriter("spill", failing, spill_path=spill_path).submit(record)
+
+    batches = []
+    writer = BatchWriter("spill", batches.append, spill_path=spill_path)
+    writer.start()
+    writer.stop()
+
+    assert batches == [[record]]
+
+
+def test_partially_written_batches_spill_only_the_failed_records(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+
+    def write_batch(batch):
+        raise PartialBatchError(batch[1:], "1 record failed")
+
+    BatchWriter("partial", write_batch, spill_path=spill_path)._write(
+        [{"n": 0}, {"n": 1}]
+    )
+
+    batches = []
+    writer = BatchWriter("partial", batches.append, spill_path=spill_path)
+    writer.replay_spill()
+
+    assert batches == [[{"n": 1}]]
+
+
+def test_write_api_calls_treats_duplicate_keys_as_written():
+    when = datetime.utcnow()
+    calls = [
+        {"endpoint": "/api/chat", "status_code": 200, "timestamp": when}
+        for _ in range(3)
+    ]
+    with patch("mongo.api_calls_collection") as api_calls, patch(
+        "mongo.record_rollups"
+    ) as record_rollups:
+        api_calls.insert_many.side_effect = BulkWriteError(
+            {
+                "writeErrors": [
+                    {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+                    {"index": 2, "code": 121, "errmsg": "validation failed"},
+                ]
+            }
+        )
+        with pytest.raises(PartialBatchError) as raised:
+            mongo.write_api_calls(calls)
+
+    assert raised.value.records == [calls[2]]
+    assert len(list(record_rollups.call_args.args[0])) == 2
+
+
+def test_write_api_calls_batches_rollup_increments():
+    rollup_collection = MagicMock()
+    when = datetime.utcnow().replace(second=0, microsecond=0)
+    calls = [
+        {"endpoint": "/api/chat", "status_code": 200, "timestamp": when},
+        {"endpoint": "/api/chat", "status_code": 500, "timestamp": when},
+    ]
+    with patch("mongo.api_calls_collection") as api_calls, patch(
+        "mongo.metrics_rollups_collection", rollup_collection
+    ):
+        mongo.write_api_calls(calls)
+
+    api_calls.insert_many.assert_called_once_with(calls, ordered=False)
+    operations = rollup_collection.bulk_write.call_args.args[0]
+    incs = {op._filter["_id"]: op._doc["$inc"] for op in operations}
+    assert len(operations) == 4
+    assert incs["total"]["counters.api_calls.total"] == 2
+    assert incs["total"]["counters.api_calls.status.500"] == 1
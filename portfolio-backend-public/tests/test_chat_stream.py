@@ -0,0 +1,39 @@
+import json
+from chat_stream import MessageStreamParser, sse_event
+
+
+def feed_all(parser, chunks):
+    return "".join(parser.feed(chunk) for chunk in chunks)
+
+
+def test_parser_streams_message_across_chunk_boundaries():
+    output = json.dumps(
+        {"message": 'Tomer said "hi"\nand é\U0001f600 bye', "topics": ["DevOps"]}
+    )
+    parser = MessageStreamParser()
+
+    # One character at a time splits every escape sequence
+    streamed = feed_all(parser, list(output))
+
+    assert streamed == 'Tomer said "hi"\nand é\U0001f600 bye'
+    assert parser.result() == (streamed, ["DevOps"])
+
+
+def test_parser_emits_text_before_the_object_is_complete():
+    parser = MessageStreamParser()
+
+    assert parser.feed('{"mess') == ""
+    assert parser.feed('age": "Hello, wor') == "Hello, wor"
+    assert parser.feed('ld", "topics": ["a"') == "ld"
+    assert parser.feed("]}") == ""
+
+
+def test_parser_falls_back_to_raw_output():
+    parser = MessageStreamParser()
+
+    assert feed_all(parser, ["plain ", "text"]) == ""
+    assert parser.result() == ("plain text", [])
+
+
+def test_sse_event_format():
+    assert sse_event("done", {"topics": []}) == 'event: done\ndata: {"topics": []}\n\n'
@@ -0,0 +1,34 @@
+import gzip
+import json
+import os
+from content_cache import ContentCache
+
+
+def write_json(path, data, mtime):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_get_reuses_entry_until_file_changes(tmp_path):
+    write_json(tmp_path / "about.json", {"name": "Before"}, 1_000_000)
+    cache = ContentCache(str(tmp_path))
+
+    first = cache.get("about.json")
+    assert cache.get("about.json") is first
+    assert json.loads(first.body) == {"name": "Before"}
+
+    write_json(tmp_path / "about.json", {"name": "After!"}, 1_000_100)
+    second = cache.get("about.json")
+
+    assert second.data == {"name": "After!"}
+    assert second.etag != first.etag
+
+
+def test_large_bodies_are_pre_gzipped(tmp_path):
+    write_json(tmp_path / "projects.json", {"projects": ["x" * 2000]}, 1_000_000)
+
+    content = ContentCache(str(tmp_path)).get("projects.json")
+    uncompressed = ContentCache(str(tmp_path), compress=False).get("projects.json")
+
+    assert gzip.decompress(content.gzip_body) == content.body
+    assert uncompressed.gzip_body is None
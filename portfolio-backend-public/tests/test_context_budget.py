@@ -0,0 +1,61 @@
+from unittest.mock import patch
+import pytest
+import context_budget
+from context_budget import fit_to_budget, MESSAGE_OVERHEAD
+
+
+@pytest.fixture(autouse=True)
+def word_tokens():
+    """One token per word, so budgets are easy to reason about."""
+    with patch(
+        "context_budget.count_text_tokens", side_effect=lambda text: len(text.split())
+    ):
+        yield
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join(["w"] * words)}
+
+
+def test_messages_within_budget_are_unchanged():
+    messages = [message("system", 10), message("user", 5), message("user", 5)]
+
+    assert fit_to_budget(messages, 100) == messages
+    assert fit_to_budget(messages, None) == messages
+
+
+def test_drops_oldest_history_first():
+    system, new = message("system", 10), message("user", 2)
+    history = [message("user", 5), message("assistant", 5), message("user", 5)]
+    per_message = 5 + MESSAGE_OVERHEAD
+    budget = 10 + 2 + 2 * MESSAGE_OVERHEAD + 2 * per_message
+
+    kept = fit_to_budget([system, *history, new], budget)
+
+    assert kept == [system, history[1], history[2], new]
+
+
+def test_system_prompt_and_new_message_are_always_kept():
+    system, new = message("system", 50), message("user", 50)
+
+    assert fit_to_budget([system, message("user", 1), new], 10) == [system, new]
+
+
+def test_pinned_context_is_always_kept():
+    system, summary, new = message("system", 5), message("user", 5), message("user", 5)
+
+    kept = fit_to_budget([system, summary, message("user", 1), new], 10, pinned=2)
+
+    assert kept == [system, summary, new]
+
+
+def test_reports_trimmed_tokens():
+    trimmed_before = context_budget.llm_context_trimmed_tokens_total.labels(
+        model="m"
+    )._value.get()
+    messages = [message("system", 1), message("user", 20), message("user", 1)]
+
+    fit_to_budget(messages, 2 + 2 * MESSAGE_OVERHEAD, model="m")
+
+    trimmed = context_budget.llm_context_trimmed_tokens_total.labels(model="m")
+    assert trimmed._value.get() - trimmed_before == 20 + MESSAGE_OVERHEAD
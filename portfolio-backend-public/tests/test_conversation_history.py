@@ -0,0 +1,39 @@
+from unittest.mock import MagicMock
+from conversation_history import ConversationHistory
+from tests.conftest import FakeRedis
+
+
+def test_miss_loads_from_mongo_once_then_serves_appended_turns():
+    load = MagicMock(
+        return_value=[{"role": "user", "content": "Hi", "timestamp": None, "seq": 0}]
+    )
+    history = ConversationHistory(4, 60, load, client_factory=FakeRedis)
+
+    assert history.get("c1") == [{"role": "user", "content": "Hi", "seq": 0}]
+    history.append("c1", [{"role": "assistant", "content": "Hello", "seq": 1}])
+
+    assert history.get("c1") == [
+        {"role": "user", "content": "Hi", "seq": 0},
+        {"role": "assistant", "content": "Hello", "seq": 1},
+    ]
+    load.assert_called_once_with("c1", 4)
+
+
+def test_keeps_only_the_most_recent_messages():
+    history = ConversationHistory(
+        2, 60, MagicMock(return_value=[]), client_factory=FakeRedis
+    )
+    history.append("c1", [{"role": "user", "content": str(n)} for n in range(5)])
+
+    assert [message["content"] for message in history.get("c1")] == ["3", "4"]
+    assert history.client.ttls[history.key("c1")] == 60
+
+
+def test_redis_errors_fall_back_to_mongo():
+    client = MagicMock()
+    client.lrange.side_effect = ConnectionError("redis down")
+    client.pipeline.side_effect = ConnectionError("redis down")
+    load = MagicMock(return_value=[{"role": "user", "content": "Hi", "seq": 0}])
+    history = ConversationHistory(4, 60, load, client_factory=lambda: client)
+
+    assert history.get("c1") == [{"role": "user", "content": "Hi", "seq": 0}]
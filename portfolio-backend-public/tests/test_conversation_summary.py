@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+from conversation_summary import ConversationSummaries
+from tests.conftest import FakeRedis
+
+
+class InlineQueue:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn, args))
+        return True
+
+
+def summaries(state, save=True, queue=None):
+    return ConversationSummaries(
+        keep_recent=4,
+        batch=4,
+        ttl=60,
+        queue=queue or InlineQueue(),
+        complete=MagicMock(return_value="new summary"),
+        load_state=MagicMock(return_value=state),
+        load_messages=MagicMock(
+            return_value=[{"role": "user", "content": "old", "seq": 0}]
+        ),
+        save=MagicMock(return_value=save),
+        client_factory=FakeRedis,
+    )
+
+
+def test_refresh_folds_old_messages_into_the_summary():
+    store = summaries({"summary": "earlier", "summary_through": 2, "message_count": 12})
+
+    store.refresh("c1")
+
+    store.load_messages.assert_called_once_with("c1", 2, 8)
+    prompt = store.complete.call_args.args[0]
+    assert "earlier" in prompt[1]["content"]
+    assert "user: old" in prompt[1]["content"]
+    store.save.assert_called_once_with("c1", "new summary", 8, 2)
+    assert store.get("c1") == {"text": "new summary", "through": 8}
+
+
+def test_refresh_waits_for_a_full_batch():
+    store = summaries({"summary": "earlier", "summary_through": 6, "message_count": 12})
+
+    store.refresh("c1")
+
+    store.complete.assert_not_called()
+    store.save.assert_not_called()
+
+
+def test_lost_save_race_does_not_cache():
+    store = summaries(
+        {"summary": None, "summary_through": 0, "message_count": 8}, save=False
+    )
+
+    store.refresh("c1")
+
+    assert store.client.get(store.key("c1")) is None
+
+
+def test_maybe_refresh_queues_each_conversation_once():
+    queue = InlineQueue()
+    store = summaries(
+        {"summary": None, "summary_through": 0, "message_count": 8}, queue=queue
+    )
+
+    store.maybe_refresh("c1", 6)
+    store.maybe_refresh("c1", 8)
+    store.maybe_refresh("c1", 10)
+
+    assert queue.submitted == [(store.refresh, ("c1",))]
+    fn, args = queue.submitted[0]
+    fn(*args)
+    store.maybe_refresh("c1", 10)
+    assert len(queue.submitted) == 1
+    store.maybe_refresh("c1", 12)
+    assert len(queue.submitted) == 2
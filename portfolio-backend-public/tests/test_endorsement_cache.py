@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock, patch
+from endorsement_cache import EndorsementCache
+import mongo
+from tests.conftest import FakeRedis
+
+
+def test_set_then_get_hits():
+    cache = EndorsementCache(60, client_factory=FakeRedis)
+
+    cached, key = cache.get("skill-1")
+    assert cached is None
+    cache.set(key, [{"id": "a", "skillId": "skill-1"}])
+
+    assert cache.get("skill-1")[0] == [{"id": "a", "skillId": "skill-1"}]
+    assert cache.get()[0] is None
+
+
+def test_invalidate_drops_skill_and_all_lists_only():
+    cache = EndorsementCache(60, client_factory=FakeRedis)
+    for skill_id in (None, "skill-1", "skill-2"):
+        cache.set(cache.get(skill_id)[1], [{"skillId": skill_id}])
+
+    cache.invalidate("skill-1")
+
+    assert cache.get()[0] is None
+    assert cache.get("skill-1")[0] is None
+    assert cache.get("skill-2")[0] == [{"skillId": "skill-2"}]
+
+
+def test_list_loaded_before_a_write_is_not_served_after_it():
+    cache = EndorsementCache(60, client_factory=FakeRedis)
+    _, stale_key = cache.get("skill-1")
+
+    cache.invalidate("skill-1")
+    cache.set(stale_key, [{"id": "deleted"}])
+
+    assert cache.get("skill-1")[0] is None
+
+
+def test_version_keys_expire_after_the_lists():
+    cache = EndorsementCache(60, client_factory=FakeRedis)
+
+    cache.invalidate("skill-1")
+    cache.set(cache.get("skill-2")[1], [])
+
+    ttls = cache.client.ttls
+    assert ttls[cache.version_key()] == ttls[cache.version_key("skill-1")] == 120
+    assert cache.list_key("skill-2", 0) in ttls
+
+
+def test_redis_errors_count_as_misses():
+    client = MagicMock()
+    client.pipeline.return_value.execute.side_effect = ConnectionError("redis down")
+    cache = EndorsementCache(60, client_factory=lambda: client)
+
+    assert cache.get("skill-1") == (None, None)
+    cache.invalidate("skill-1")
+
+
+def test_get_endorsements_by_skill_is_served_from_cache():
+    cache = EndorsementCache(60, client_factory=FakeRedis)
+    endorsements = MagicMock()
+    endorsements.find.return_value = [
+        {"_id": "id-1", "skillId": "skill-1", "timestamp": "2025-01-01T00:00:00Z"}
+    ]
+    with patch("mongo.endorsement_cache", cache), patch(
+        "mongo.endorsements_collection", endorsements
+    ):
+        first = mongo.get_endorsements_by_skill("skill-1")
+        second = mongo.get_endorsements_by_skill("skill-1")
+
+    assert (
+        first
+        == second
+        == [{"id": "id-1", "skillId": "skill-1", "timestamp": "2025-01-01T00:00:00Z"}]
+    )
+    endorsements.find.assert_called_once()
@@ -0,0 +1,49 @@
+import asyncio
+from flask import Flask, request
+from chat_stream import iterate_async
+from event_loop import EventLoopRunner
+
+
+def make_app(runner):
+    app = Flask(__name__)
+    app.async_to_sync = runner.async_to_sync
+
+    @app.route("/loop")
+    async def loop_id():
+        await asyncio.sleep(0)
+        return {"loop": id(asyncio.get_running_loop()), "name": request.args["name"]}
+
+    return app
+
+
+def test_async_views_share_the_persistent_loop():
+    runner = EventLoopRunner()
+    runner.start()
+    try:
+        client = make_app(runner).test_client()
+        first = client.get("/loop?name=a").get_json()
+        second = client.get("/loop?name=b").get_json()
+    finally:
+        runner.stop()
+
+    assert first["loop"] == second["loop"] == id(runner.loop)
+    assert (first["name"], second["name"]) == ("a", "b")
+
+
+def test_async_views_fall_back_to_a_loop_per_request():
+    client = make_app(EventLoopRunner()).test_client()
+
+    assert client.get("/loop?name=a").get_json()["name"] == "a"
+
+
+def test_iterate_async_runs_on_the_runner_loop():
+    async def loops():
+        for _ in range(2):
+            yield id(asyncio.get_running_loop())
+
+    runner = EventLoopRunner()
+    runner.start()
+    try:
+        assert list(iterate_async(loops(), runner)) == [id(runner.loop)] * 2
+    finally:
+        runner.stop()
@@ -0,0 +1,120 @@
+import asyncio
+import time
+import httpx
+import pytest
+from hedging import HedgedCalls
+from tests.fake_openai_server import FakeOpenAIServer
+
+
+def warmed_up(latency, samples=20):
+    calls = HedgedCalls(quantile=0.95, min_samples=samples)
+    for _ in range(samples):
+        calls.observe(latency)
+    return calls
+
+
+def test_no_hedging_until_enough_samples():
+    calls = HedgedCalls(quantile=0.95, min_samples=3)
+    calls.observe(0.1)
+    calls.observe(0.2)
+    assert calls.delay() is None
+
+    calls.observe(0.3)
+    assert calls.delay() == 0.3
+    assert HedgedCalls(quantile=0).delay() is None
+
+
+def test_slow_call_is_hedged_and_cancelled():
+    calls = warmed_up(0.01)
+    cancelled = []
+    delays = [1.0, 0.0]
+
+    async def call():
+        try:
+            await asyncio.sleep(delays.pop(0))
+            return "answer"
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    started = time.perf_counter()
+    assert asyncio.run(calls.run(call)) == "answer"
+
+    assert time.perf_counter() - started < 0.5
+    assert cancelled == [True]
+
+
+def test_fast_call_is_not_hedged():
+    calls = warmed_up(1.0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        return "answer"
+
+    assert asyncio.run(calls.run(call)) == "answer"
+    assert len(attempts) == 1
+
+
+def test_hedged_request_fails_only_if_both_calls_fail():
+    calls = warmed_up(0.01)
+    outcomes = [(0.05, ValueError("first")), (0.0, None)]
+
+    async def call():
+        delay, error = outcomes.pop(0)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return "answer"
+
+    assert asyncio.run(calls.run(call)) == "answer"
+
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise ValueError("down")
+
+    with pytest.raises(ValueError):
+        asyncio.run(calls.run(failing))
+
+
+def test_hedging_against_a_fake_openai_server():
+    calls = warmed_up(0.02)
+
+    async def main(url):
+        async with httpx.AsyncClient(base_url=url) as client:
+
+            async def call():
+                response = await client.post(
+                    "/chat/completions",
+                    json={
+                        "model": "fake",
+                        "messages": [{"role": "user", "content": "Hi"}],
+                    },
+                )
+                return response.json()["choices"][0]["message"]["content"]
+
+            return await calls.run(call)
+
+    with FakeOpenAIServer(delays=[2.0, 0.0]) as server:
+        started = time.perf_counter()
+        content = asyncio.run(main(server.url))
+        elapsed = time.perf_counter() - started
+
+    assert content == '{"message": "Hello", "topics": []}'
+    assert server.requests == 2
+    assert elapsed < 1.0
+
+
+def test_cancelled_first_call_is_recorded_when_the_hedge_wins():
+    calls = warmed_up(0.01)
+    delays = [1.0, 0.05]
+
+    async def call():
+        await asyncio.sleep(delays.pop(0))
+        return "answer"
+
+    assert asyncio.run(calls.run(call)) == "answer"
+
+    assert len(calls._latencies) == 22
+    hedge, first = list(calls._latencies)[-2:]
+    assert 0.04 < hedge < first < 0.5
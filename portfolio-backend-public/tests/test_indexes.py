@@ -0,0 +1,80 @@
+from unittest.mock import MagicMock
+from pymongo.errors import OperationFailure
+from indexes import index, ensure_indexes, index_report
+import mongo
+
+
+def test_index_names_match_pymongo_defaults():
+    spec = index("otp_codes", [("email", 1), ("expiry", -1)], unique=True)
+    assert spec.options == {"name": "email_1_expiry_-1", "unique": True}
+    assert index("conversations", "updated_at").keys == [("updated_at", 1)]
+
+
+def test_ensure_indexes_skips_failures():
+    db = {"llm_usage": MagicMock(), "api_calls": MagicMock()}
+    db["llm_usage"].create_index.side_effect = OperationFailure("duplicate key")
+    specs = [index("llm_usage", "model_name", unique=True), index("api_calls", "x")]
+
+    assert ensure_indexes(db, specs) == ["llm_usage.model_name_1"]
+    db["api_calls"].create_index.assert_called_once_with([("x", 1)], name="x_1")
+
+
+def test_ensure_indexes_turns_existing_index_into_ttl_index():
+    db = MagicMock()
+    db["otp_codes"].create_index.side_effect = OperationFailure(
+        "Index already exists with different options", code=85
+    )
+
+    assert (
+        ensure_indexes(db, [index("otp_codes", "expiry", expireAfterSeconds=0)]) == []
+    )
+    db.command.assert_called_once_with(
+        "collMod",
+        "otp_codes",
+        index={"keyPattern": {"expiry": 1}, "expireAfterSeconds": 0},
+    )
+
+
+def test_ensure_indexes_makes_existing_index_unique():
+    db = MagicMock()
+    db["conversations"].create_index.side_effect = OperationFailure(
+        "Index already exists with different options", code=85
+    )
+
+    assert (
+        ensure_indexes(db, [index("conversations", "conversation_id", unique=True)])
+        == []
+    )
+    assert [c.kwargs["index"] for c in db.command.call_args_list] == [
+        {"keyPattern": {"conversation_id": 1}, "prepareUnique": True},
+        {"keyPattern": {"conversation_id": 1}, "unique": True},
+    ]
+
+
+def test_index_report_lists_missing_undeclared_and_unused():
+    collection = MagicMock()
+    collection.list_indexes.return_value = [
+        {"name": "_id_", "key": {"_id": 1}},
+        {"name": "skillId_1_deleted_1", "key": {"skillId": 1.0, "deleted": 1.0}},
+        {"name": "email_1", "key": {"email": 1}},
+    ]
+    collection.aggregate.return_value = [
+        {"name": "_id_", "accesses": {"ops": 0, "since": None}},
+        {"name": "skillId_1_deleted_1", "accesses": {"ops": 0, "since": None}},
+        {"name": "email_1", "accesses": {"ops": 12, "since": None}},
+    ]
+    db = {"endorsements": collection}
+    specs = [
+        index("endorsements", [("skillId", 1), ("deleted", 1)]),
+        index("endorsements", "timestamp"),
+    ]
+
+    report = index_report(db, specs)["endorsements"]
+    assert report["missing"] == ["timestamp_1"]
+    assert report["undeclared"] == ["email_1"]
+    assert report["unused"] == ["skillId_1_deleted_1"]
+
+
+def test_declared_indexes_are_unique_per_collection():
+    names = [(spec.collection, spec.options["name"]) for spec in mongo.INDEXES]
+    assert len(names) == len(set(names))
@@ -0,0 +1,136 @@
+import socket
+import threading
+import time
+import pytest
+from aiosmtpd.controller import Controller
+from mailer import Mailer, SMTPPool
+
+
+class RecordingHandler:
+    def __init__(self, transient_failures=0):
+        self.transient_failures = transient_failures
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.transient_failures:
+            self.transient_failures -= 1
+            return "451 Try again later"
+        self.sessions.add(id(session))
+        self.messages.append(envelope.rcpt_tos)
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    """Local SMTP stand-in: call it with a handler to get the port."""
+    controllers = []
+
+    def start(handler):
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        controllers.append(controller)
+        return controller.port
+
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def make_mailer(port, statuses, **kwargs):
+    pool = SMTPPool("127.0.0.1", port, lambda: (None, None), starttls=False)
+    return Mailer(
+        pool,
+        on_status=lambda delivery_id, status: statuses.append(status["status"]),
+        **kwargs,
+    )
+
+
+def test_queued_emails_share_a_pooled_connection(smtp_server):
+    handler = RecordingHandler()
+    statuses = []
+    mailer = make_mailer(smtp_server(handler), statuses, workers=1)
+    mailer.start()
+    try:
+        ids = [
+            mailer.send("from@example.com", f"to{n}@example.com", "Subject: hi\n\nhi")
+            for n in range(3)
+        ]
+        assert wait_for(lambda: len(handler.messages) == 3)
+    finally:
+        mailer.stop()
+
+    assert all(ids)
+    assert len(handler.sessions) == 1
+    assert wait_for(lambda: statuses.count("sent") == 3)
+
+
+def test_transient_failures_are_retried_with_backoff(smtp_server):
+    handler = RecordingHandler(transient_failures=2)
+    statuses = []
+    mailer = make_mailer(smtp_server(handler), statuses, workers=1, backoff=0.01)
+    mailer.start()
+    try:
+        mailer.send("from@example.com", "to@example.com", "Subject: hi\n\nhi")
+        assert wait_for(lambda: "sent" in statuses)
+    finally:
+        mailer.stop()
+
+    assert statuses == ["queued", "retrying", "retrying", "sent"]
+
+
+def test_inline_delivery_reports_failure_without_retrying(smtp_server):
+    handler = RecordingHandler(transient_failures=1)
+    statuses = []
+    mailer = make_mailer(smtp_server(handler), statuses)
+
+    assert mailer.send("from@example.com", "to@example.com", "hi") is None
+    assert statuses == ["failed"]
+
+
+def test_statuses_are_recorded_by_the_workers(smtp_server):
+    port = smtp_server(RecordingHandler())
+    threads = []
+    pool = SMTPPool("127.0.0.1", port, lambda: (None, None), starttls=False)
+    mailer = Mailer(
+        pool,
+        on_status=lambda delivery_id, status: threads.append(
+            threading.current_thread()
+        ),
+        workers=1,
+    )
+    mailer.start()
+    try:
+        mailer.send("from@example.com", "to@example.com", "Subject: hi\n\nhi")
+        assert wait_for(lambda: len(threads) == 2)
+    finally:
+        mailer.stop()
+
+    assert threading.current_thread() not in threads
+
+
+def test_stop_cancels_pending_retries(smtp_server):
+    handler = RecordingHandler(transient_failures=1)
+    statuses = []
+    mailer = make_mailer(smtp_server(handler), statuses, workers=1, backoff=60)
+    mailer.start()
+    mailer.send("from@example.com", "to@example.com", "Subject: hi\n\nhi")
+    assert wait_for(lambda: "retrying" in statuses)
+
+    mailer.stop()
+
+    assert statuses == ["queued", "retrying", "failed"]
+    assert handler.messages == []
@@ -0,0 +1,390 @@
+from unittest.mock import patch, MagicMock
+import pytest
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+import mongo
+
+
+def test_log_llm_usage_writes_one_bucket_upsert():
+    usage, buckets = MagicMock(), MagicMock()
+    with patch("mongo.llm_usage_collection", usage), patch(
+        "mongo.llm_usage_buckets_collection", buckets
+    ), patch("mongo.metrics_rollups_collection"):
+        mongo.log_llm_usage(
+            "test-model",
+            "Hello",
+            {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12},
+        )
+
+    usage.update_one.assert_not_called()
+    usage.bulk_write.assert_not_called()
+    [bucket_op] = buckets.bulk_write.call_args.args[0]
+    update = bucket_op._doc
+    hour = update["$setOnInsert"]["hour"]
+    batch_id = update["$push"]["batches"]["$each"][0]
+    assert bucket_op._filter == {
+        "_id": mongo.llm_usage_bucket_id("test-model", hour),
+        "batches": {"$ne": batch_id},
+    }
+    assert hour.minute == 0 and hour.second == 0
+    assert update["$inc"] == {
+        "prompt_tokens": 5,
+        "completion_tokens": 7,
+        "total_tokens": 12,
+        "requests": 1,
+    }
+    assert update["$push"]["samples"]["$slice"] == -mongo.LLM_USAGE_SAMPLE_SIZE
+    assert "model_name" not in update["$push"]["samples"]["$each"][0]
+    assert "batch_id" not in update["$push"]["samples"]["$each"][0]
+    assert bucket_op._upsert is True
+
+
+def test_write_llm_usage_coalesces_events_per_model():
+    usage, buckets, rollup_docs = MagicMock(), MagicMock(), MagicMock()
+    when = datetime(2025, 1, 1, 10, 30)
+    entries = [
+        {
+            "model_name": model,
+            "message": "hi",
+            "prompt_tokens": 1,
+            "completion_tokens": 2,
+            "total_tokens": 3,
+            "timestamp": when,
+        }
+        for model in ("a", "a", "b")
+    ]
+    with patch("mongo.llm_usage_collection", usage), patch(
+        "mongo.llm_usage_buckets_collection", buckets
+    ), patch("mongo.metrics_rollups_collection", rollup_docs):
+        mongo.write_llm_usage(entries)
+
+    bucket_ops = {
+        op._filter["_id"]: op._doc for op in buckets.bulk_write.call_args.args[0]
+    }
+    a_bucket = bucket_ops[mongo.llm_usage_bucket_id("a", datetime(2025, 1, 1, 10))]
+    assert a_bucket["$inc"]["requests"] == 2
+    assert len(a_bucket["$push"]["samples"]["$each"]) == 2
+    [rollup_op] = rollup_docs.bulk_write.call_args.args[0]
+    assert rollup_op._filter["_id"] == mongo.rollups.TOTAL_ID
+    counters = rollup_op._doc["$inc"]
+    assert counters["counters.llm.total_tokens"] == 9
+    assert counters["counters.llm_models.a.total_tokens"] == 6
+    assert counters["counters.llm_models.b.total_tokens"] == 3
+
+
+def test_replayed_llm_usage_batch_keeps_its_batch_id():
+    buckets, rollup_docs = MagicMock(), MagicMock()
+    entry = {
+        "model_name": "a",
+        "message": "hi",
+        "prompt_tokens": 1,
+        "completion_tokens": 2,
+        "total_tokens": 3,
+        "timestamp": datetime(2025, 1, 1, 10, 30),
+    }
+    # The first attempt applied everything but the rollup update failed
+    rollup_docs.bulk_write.side_effect = [ConnectionError("timeout"), None]
+    with patch("mongo.llm_usage_buckets_collection", buckets), patch(
+        "mongo.metrics_rollups_collection", rollup_docs
+    ):
+        with pytest.raises(ConnectionError):
+            mongo.write_llm_usage([entry])
+        buckets.bulk_write.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 11000}]}
+        )
+        mongo.write_llm_usage([entry])
+
+    first, replay = [c.args[0][0]._filter for c in buckets.bulk_write.call_args_list]
+    assert (
+        first
+        == replay
+        == {
+            "_id": mongo.llm_usage_bucket_id("a", datetime(2025, 1, 1, 10)),
+            "batches": {"$ne": entry["batch_id"]},
+        }
+    )
+    assert rollup_docs.bulk_write.call_args.args[0][0]._filter == {
+        "_id": mongo.rollups.TOTAL_ID,
+        "llm_batches": {"$ne": entry["batch_id"]},
+    }
+
+
+def test_migrate_llm_usage_splits_logs_by_hour():
+    logs = [
+        {
+            "prompt_tokens": 1,
+            "completion_tokens": 1,
+            "total_tokens": 2,
+            "timestamp": datetime(2025, 1, 1, 10, 5),
+        },
+        {
+            "prompt_tokens": 2,
+            "completion_tokens": 2,
+            "total_tokens": 4,
+            "timestamp": datetime(2025, 1, 1, 10, 55),
+        },
+        {
+            "prompt_tokens": 3,
+            "completion_tokens": 3,
+            "total_tokens": 6,
+            "timestamp": datetime(2025, 1, 1, 11, 0),
+        },
+    ]
+    usage = MagicMock()
+    usage.find.return_value = [{"_id": "doc", "model_name": "m", "logs": logs}]
+    buckets = MagicMock()
+    with patch("mongo.llm_usage_collection", usage), patch(
+        "mongo.llm_usage_buckets_collection", buckets
+    ):
+        assert mongo.migrate_llm_usage_to_buckets() == 3
+
+    operations = buckets.bulk_write.call_args.args[0]
+    incs = {op._filter["_id"]: op._doc["$inc"] for op in operations}
+    assert incs[mongo.llm_usage_bucket_id("m", datetime(2025, 1, 1, 10))] == {
+        "prompt_tokens": 3,
+        "completion_tokens": 3,
+        "total_tokens": 6,
+        "requests": 2,
+    }
+    assert (
+        incs[mongo.llm_usage_bucket_id("m", datetime(2025, 1, 1, 11))]["requests"] == 1
+    )
+    usage.update_one.assert_called_once_with({"_id": "doc"}, {"$unset": {"logs": ""}})
+    assert all(op._filter["migrated_from"] == {"$ne": "doc"} for op in operations)
+
+
+def test_migrate_llm_usage_rerun_skips_migrated_buckets():
+    logs = [{"total_tokens": 2, "timestamp": datetime(2025, 1, 1, 10, 5)}]
+    usage = MagicMock()
+    usage.find.return_value = [{"_id": "doc", "model_name": "m", "logs": logs}]
+    buckets = MagicMock()
+    buckets.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]}
+    )
+    with patch("mongo.llm_usage_collection", usage), patch(
+        "mongo.llm_usage_buckets_collection", buckets
+    ):
+        assert mongo.migrate_llm_usage_to_buckets() == 1
+
+    usage.update_one.assert_called_once_with({"_id": "doc"}, {"$unset": {"logs": ""}})
+
+
+def test_log_conversation_is_a_single_upsert():
+    conversations = MagicMock()
+    conversations.find_one_and_update.return_value = {"topics": ["AWS", "Docker"]}
+    with patch("mongo.conversations_collection", conversations), patch(
+        "mongo.record_rollup"
+    ) as record_rollup:
+        mongo.log_conversation(
+            {
+                "conversation_id": "c1",
+                "messages": [{"content": "Hi", "role": "user"}],
+                "new_message": "And Kubernetes?",
+                "response": {"content": "Yes", "role": "assistant"},
+                "topics": ["AWS", "Kubernetes"],
+            }
+        )
+
+    conversations.find_one.assert_not_called()
+    conversations.insert_one.assert_not_called()
+    query, pipeline = conversations.find_one_and_update.call_args.args
+    assert query == {"conversation_id": "c1"}
+    assert pipeline[0]["$set"]["messages"]["$concatArrays"][1]["$literal"] == [
+        {"content": "And Kubernetes?", "role": "user"},
+        {"content": "Yes", "role": "assistant"},
+    ]
+    assert conversations.find_one_and_update.call_args.kwargs["upsert"] is True
+    assert record_rollup.call_args.args[0] == {
+        "conversations.messages": 2,
+        "topics.AWS": 0,
+        "topics.Kubernetes": 1,
+        "topics.Docker": -1,
+    }
+
+
+def test_split_turns_starts_a_turn_at_each_user_message():
+    messages = [
+        {"role": "assistant", "content": "Welcome"},
+        {"role": "user", "content": "q1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "q2"},
+    ]
+
+    assert [(seq, len(turn)) for seq, turn in mongo.split_turns(messages)] == [
+        (0, 1),
+        (1, 2),
+        (3, 1),
+    ]
+
+
+def test_verify_otp_deletes_the_code_it_matches():
+    otps = MagicMock()
+    otps.find_one_and_delete.return_value = {"_id": "otp-id"}
+    with patch("mongo.otp_collection", otps), patch(
+        "mongo.record_rollup"
+    ) as record_rollup:
+        assert mongo.verify_otp("User@Example.com", "endorse", "123456", "skill-1")
+
+    query = otps.find_one_and_delete.call_args.args[0]
+    assert query["email"] == "user@example.com"
+    assert query["otp"] == "123456"
+    otps.update_one.assert_not_called()
+    assert record_rollup.call_args.args[0] == {
+        mongo.rollups.counter_key("otp", "consumed"): 1
+    }
+
+
+def test_store_otp_replaces_earlier_codes():
+    otps = MagicMock()
+    otps.delete_many.return_value.deleted_count = 2
+    with patch("mongo.otp_collection", otps), patch(
+        "mongo.record_rollup"
+    ) as record_rollup:
+        mongo.store_otp("user@example.com", "delete", "654321", "endorsement-1")
+
+    otps.delete_many.assert_called_once_with(
+        {"email": "user@example.com", "action": "delete", "target_id": "endorsement-1"}
+    )
+    assert "deleted" not in otps.insert_one.call_args.args[0]
+    counters = record_rollup.call_args.args[0]
+    assert counters[mongo.rollups.counter_key("otp", "superseded")] == 2
+
+
+def test_endorsements_page_uses_keyset_and_public_fields():
+    newest = datetime(2025, 1, 2)
+    documents = [
+        {"_id": mongo.ObjectId(), "skillId": "s", "timestamp": newest},
+        {"_id": mongo.ObjectId(), "skillId": "s", "timestamp": newest},
+        {"_id": mongo.ObjectId(), "skillId": "s", "timestamp": datetime(2025, 1, 1)},
+    ]
+    second_id = documents[1]["_id"]
+    endorsements = MagicMock()
+    endorsements.find.return_value.sort.return_value.limit.return_value = documents
+    with patch("mongo.endorsements_collection", endorsements):
+        page = mongo.get_endorsements_page("s", limit=2)
+
+    query, projection = endorsements.find.call_args.args
+    assert query == {"deleted": {"$ne": True}, "skillId": "s"}
+    assert "email" not in projection
+    assert [e["timestamp"] for e in page["endorsements"]] == [
+        "2025-01-02T00:00:00Z"
+    ] * 2
+    assert mongo.decode_cursor(page["nextCursor"]) == (newest, second_id)
+
+    endorsements.find.return_value.sort.return_value.limit.return_value = []
+    with patch("mongo.endorsements_collection", endorsements):
+        mongo.get_endorsements_page("s", limit=2, cursor=page["nextCursor"])
+    assert endorsements.find.call_args.args[0]["$or"] == [
+        {"timestamp": {"$lt": newest}},
+        {"timestamp": newest, "_id": {"$lt": second_id}},
+    ]
+
+
+def test_count_endorsements_by_skill_reads_rollup_totals():
+    rollup_docs = MagicMock()
+    rollup_docs.find_one.return_value = {
+        "_id": "total",
+        "counters": {"endorsements": {"skill": {"k8s": 4, "aws": 0}}},
+    }
+    with patch("mongo.metrics_rollups_collection", rollup_docs):
+        assert mongo.count_endorsements_by_skill() == {"k8s": 4}
+
+
+def test_backfill_endorsement_rollups_counts_existing_endorsements():
+    rollup_docs, endorsements = MagicMock(), MagicMock()
+    rollup_docs.find_one.return_value = None
+    endorsements.find.return_value = [
+        {"skillId": "k8s", "email": "a@x.com"},
+        {"skillId": "k8s", "email": "b@x.com"},
+        {"skillId": "aws", "email": "a@x.com", "deleted": True},
+    ]
+    with patch("mongo.metrics_rollups_collection", rollup_docs), patch(
+        "mongo.endorsements_collection", endorsements
+    ):
+        assert mongo.backfill_endorsement_rollups() == 5
+
+    query, update = rollup_docs.update_one.call_args.args
+    assert query == {"_id": "total", "counters.endorsements": {"$exists": False}}
+    assert update["$inc"] == {
+        "counters.endorsements.active": 2,
+        "counters.endorsements.skill.k8s": 2,
+        "counters.endorsements.endorser.a@x%2Ecom": 1,
+        "counters.endorsements.endorser.b@x%2Ecom": 1,
+        "counters.endorsements.deleted": 1,
+    }
+    assert rollup_docs.update_one.call_args.kwargs["upsert"] is True
+
+
+def test_backfill_endorsement_rollups_skips_existing_counters():
+    rollup_docs, endorsements = MagicMock(), MagicMock()
+    rollup_docs.find_one.return_value = {"_id": "total"}
+    with patch("mongo.metrics_rollups_collection", rollup_docs), patch(
+        "mongo.endorsements_collection", endorsements
+    ):
+        assert mongo.backfill_endorsement_rollups() == 0
+
+    endorsements.find.assert_not_called()
+    rollup_docs.update_one.assert_not_called()
+
+
+def test_get_recent_messages_from_turn_documents():
+    turns = MagicMock()
+    turns.find.return_value.sort.return_value = [
+        {"seq": 3, "messages": [{"role": "user", "content": "3"}]},
+        {
+            "seq": 1,
+            "messages": [
+                {"role": "user", "content": "1"},
+                {"role": "user", "content": "2"},
+            ],
+        },
+        {"seq": 0, "messages": [{"role": "user", "content": "0"}]},
+    ]
+    with patch("mongo.CONVERSATION_STORAGE", "turns"), patch(
+        "mongo.conversation_turns_collection", turns
+    ):
+        messages = mongo.get_recent_messages("c1", 2)
+
+    assert [(m["content"], m["seq"]) for m in messages] == [("2", 2), ("3", 3)]
+    turns.find.return_value.sort.assert_called_once_with("seq", -1)
+
+
+def test_get_recent_messages_numbers_embedded_slice():
+    conversations = MagicMock()
+    conversations.find_one.return_value = {
+        "messages": [{"role": "user", "content": "a"}],
+        "total": 7,
+    }
+    with patch("mongo.conversations_collection", conversations):
+        assert mongo.get_recent_messages("c1", 5) == [
+            {"role": "user", "content": "a", "seq": 6}
+        ]
+
+    projection = conversations.find_one.call_args.args[1]
+    assert projection["messages"]["$slice"][1] == -5
+
+
+def test_get_messages_range_from_turn_documents():
+    turns = MagicMock()
+    turns.find.return_value.sort.return_value = [
+        {"seq": 0, "messages": [{"role": "user", "content": str(n)} for n in range(3)]},
+        {"seq": 3, "messages": [{"role": "user", "content": "3"}]},
+    ]
+    with patch("mongo.CONVERSATION_STORAGE", "turns"), patch(
+        "mongo.conversation_turns_collection", turns
+    ):
+        messages = mongo.get_messages_range("c1", 1, 4)
+
+    assert [m["seq"] for m in messages] == [1, 2, 3]
+    assert turns.find.call_args.args[0]["seq"] == {"$lt": 4}
+
+
+def test_store_summary_only_replaces_the_summary_it_read():
+    conversations = MagicMock()
+    conversations.update_one.return_value.modified_count = 0
+    with patch("mongo.conversations_collection", conversations):
+        assert not mongo.store_summary("c1", "text", 20, 10)
+
+    query, update = conversations.update_one.call_args.args
+    assert query == {"conversation_id": "c1", "summary_through": 10}
+    assert update["$set"]["summary_through"] == 20
@@ -0,0 +1,103 @@
+import pytest
+from rate_limiter import RateLimiter, RateLimitExceeded
+from tests.conftest import FakeRedis
+
+
+def limiter(redis, rpm=100, tpm=0, now=0):
+    return RateLimiter(
+        "m", rpm, tpm, block=0.1, client_factory=lambda: redis, clock=lambda: now
+    )
+
+
+def test_reserves_capacity_in_blocks():
+    redis = FakeRedis()
+    pod = limiter(redis)
+
+    for _ in range(25):
+        pod.acquire(0)
+
+    assert redis.round_trips == 3
+    assert redis.values[pod.key("requests", 0)] == 30
+
+
+def test_limit_holds_across_pods():
+    redis = FakeRedis()
+    pods = [limiter(redis, rpm=25), limiter(redis, rpm=25)]
+
+    granted = 0
+    for _ in range(20):
+        for pod in pods:
+            try:
+                pod.acquire(0)
+                granted += 1
+            except RateLimitExceeded:
+                pass
+
+    assert granted == 25
+    assert redis.values[pods[0].key("requests", 0)] == 25
+
+
+def test_tokens_are_settled_to_actual_usage():
+    redis = FakeRedis()
+    pod = limiter(redis, rpm=0, tpm=1000)
+
+    pod.acquire(50)
+    pod.settle(50, 400)
+    pod.acquire(50)
+
+    # The first call used 400 tokens, the second is estimated at 50
+    assert redis.values[pod.key("tokens", 0)] == 400 + 50
+    with pytest.raises(RateLimitExceeded):
+        pod.acquire(600)
+
+
+def test_new_minute_starts_a_new_window():
+    redis = FakeRedis()
+    now = [0]
+    pod = RateLimiter("m", 1, 0, client_factory=lambda: redis, clock=lambda: now[0])
+
+    pod.acquire(0)
+    with pytest.raises(RateLimitExceeded):
+        pod.acquire(0)
+    now[0] = 60
+    pod.acquire(0)
+
+
+def test_lock_is_not_held_during_the_redis_round_trip():
+    held = []
+
+    class CheckingRedis(FakeRedis):
+        def incrby(self, key, amount):
+            held.append(pod._lock.locked())
+            return super().incrby(key, amount)
+
+    pod = limiter(CheckingRedis())
+    pod.acquire(0)
+
+    assert held == [False]
+
+
+def test_reserves_again_when_the_minute_ends_during_the_round_trip():
+    now = [59]
+
+    class RollingRedis(FakeRedis):
+        def incrby(self, key, amount):
+            now[0] = 60
+            return super().incrby(key, amount)
+
+    redis = RollingRedis()
+    pod = RateLimiter("m", 1, 0, client_factory=lambda: redis, clock=lambda: now[0])
+
+    pod.acquire(0)
+
+    assert redis.values[pod.key("requests", 1)] == 1
+
+
+def test_redis_failure_lets_requests_through():
+    def broken():
+        raise ConnectionError("redis down")
+
+    pod = RateLimiter("m", 1, 0, client_factory=broken)
+
+    pod.acquire(0)
+    pod.acquire(0)
@@ -0,0 +1,33 @@
+from unittest.mock import MagicMock
+from models import ChatMessage
+from response_cache import ResponseCache
+
+
+def test_key_normalizes_text_and_tracks_prompt_version():
+    cache = ResponseCache(60)
+    history = [ChatMessage(content="Hi", role="user")]
+
+    key = cache.key("v1", history, "What about  Kubernetes?")
+
+    assert key == cache.key("v1", history, "what about kubernetes? ")
+    assert key != cache.key("v2", history, "What about Kubernetes?")
+    assert key != cache.key("v1", [], "What about Kubernetes?")
+
+
+def test_get_and_set_round_trip_with_ttl():
+    client = MagicMock()
+    cache = ResponseCache(60, client_factory=lambda: client)
+
+    cache.set("k", {"content": "Hello", "topics": ["DevOps"]})
+    client.get.return_value = client.set.call_args.args[1]
+
+    assert client.set.call_args.kwargs == {"ex": 60}
+    assert cache.get("k") == {"content": "Hello", "topics": ["DevOps"]}
+
+
+def test_redis_errors_count_as_misses():
+    client = MagicMock()
+    client.get.side_effect = ConnectionError("redis down")
+    cache = ResponseCache(60, client_factory=lambda: client)
+
+    assert cache.get("k") is None
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+import rollups
+
+
+def test_counter_key_escapes_labels():
+    key = rollups.counter_key("endorsements", "endorser", "jane.doe@example.com")
+    assert key == "endorsements.endorser.jane%2Edoe@example%2Ecom"
+
+    counters = {key: 2, rollups.counter_key("endorsements", "active"): 5}
+    assert rollups.labels(counters, "endorsements", "endorser") == {
+        "jane.doe@example.com": 2
+    }
+
+
+def test_build_updates_targets_every_granularity():
+    now = datetime(2025, 1, 1, 13, 45, 30)
+    updates = rollups.build_updates({"api_calls.total": 1}, now=now)
+
+    ids = [query["_id"] for query, _ in updates]
+    assert ids == [
+        "total",
+        "minute:2025-01-01T13:45:00",
+        "hour:2025-01-01T13:00:00",
+        "day:2025-01-01T00:00:00",
+    ]
+    assert updates[1][1]["$inc"] == {"counters.api_calls.total": 1}
+
+
+def test_build_updates_skips_expired_buckets():
+    now = datetime(2025, 1, 10, 12, 0)
+    updates = rollups.build_updates(
+        {"endorsements.active": -1}, when=now - timedelta(days=5), now=now
+    )
+
+    granularities = [update["$setOnInsert"]["granularity"] for _, update in updates]
+    assert granularities == ["total", "day"]
+
+
+def test_build_updates_ignores_zero_counters():
+    assert rollups.build_updates({"topics.python": 0}) == []
+
+
+def test_summarize_splits_windows():
+    now = datetime(2025, 1, 10, 12, 30)
+    docs = [
+        {"_id": "total", "counters": {"exports": {"total": 9}}},
+        {
+            "_id": "minute:2025-01-10T12:10:00",
+            "granularity": "minute",
+            "bucket": datetime(2025, 1, 10, 12, 10),
+            "counters": {"exports": {"total": 1}},
+        },
+        {
+            "_id": "hour:2025-01-10T03:00:00",
+            "granularity": "hour",
+            "bucket": datetime(2025, 1, 10, 3),
+            "counters": {"exports": {"total": 2}},
+        },
+        {
+            "_id": "day:2025-01-01T00:00:00",
+            "granularity": "day",
+            "bucket": datetime(2025, 1, 1),
+            "counters": {"exports": {"total": 4}},
+        },
+    ]
+
+    summary = rollups.summarize(docs, now)
+
+    assert rollups.value(summary["total"], "exports", "total") == 9
+    assert rollups.value(summary["last_hour"], "exports", "total") == 1
+    assert rollups.value(summary["last_day"], "exports", "total") == 2
+    assert rollups.value(summary["last_week"], "exports", "total") == 0
+    assert rollups.value(summary["last_month"], "exports", "total") == 4
+
+
+def test_top_orders_and_drops_non_positive():
+    counts = {"a": 1, "b": 5, "c": 0, "d": -1, "e": 3}
+    assert list(rollups.top(counts)) == ["b", "e", "a"]
+    assert list(rollups.top(counts, limit=2)) == ["b", "e"]
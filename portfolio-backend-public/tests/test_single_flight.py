@@ -0,0 +1,98 @@
+import asyncio
+import json
+from single_flight import SingleFlight
+from tests.conftest import FakeRedis
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight(5, client_factory=FakeRedis)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["Hello", ["topic"]]
+
+    async def main():
+        return await asyncio.gather(*[flight.run("k", call) for _ in range(3)])
+
+    results = asyncio.run(main())
+
+    assert results == [["Hello", ["topic"]]] * 3
+    assert len(calls) == 1
+    assert json.loads(flight.client.get(flight.result_key("k"))) == ["Hello", ["topic"]]
+
+
+def test_waits_for_the_result_of_another_pod():
+    flight = SingleFlight(5, poll_interval=0.01, client_factory=FakeRedis)
+    flight.client.set(flight.lock_key("k"), "1")
+
+    async def other_pod_finishes():
+        await asyncio.sleep(0.03)
+        flight.client.set(flight.result_key("k"), json.dumps(["Shared", []]))
+
+    async def call():
+        raise AssertionError("should not call the LLM")
+
+    async def main():
+        result, _ = await asyncio.gather(flight.run("k", call), other_pod_finishes())
+        return result
+
+    assert asyncio.run(main()) == ["Shared", []]
+
+
+def test_calls_itself_when_the_other_pod_gives_up():
+    flight = SingleFlight(5, poll_interval=0.01, client_factory=FakeRedis)
+    flight.client.set(flight.lock_key("k"), "1")
+
+    async def other_pod_fails():
+        await asyncio.sleep(0.03)
+        flight.client.delete(flight.lock_key("k"))
+
+    async def call():
+        return "own"
+
+    async def main():
+        result, _ = await asyncio.gather(flight.run("k", call), other_pod_fails())
+        return result
+
+    assert asyncio.run(main()) == "own"
+
+
+def test_failure_is_shared_and_releases_the_lock():
+    flight = SingleFlight(5, client_factory=FakeRedis)
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("LLM unavailable")
+
+    async def main():
+        return await asyncio.gather(
+            flight.run("k", call), flight.run("k", call), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.client.get(flight.lock_key("k")) is None
+    assert flight.client.get(flight.result_key("k")) is None
+
+
+def test_redis_calls_run_off_the_event_loop():
+    loops = []
+
+    class RecordingRedis(FakeRedis):
+        def set(self, key, value, nx=False, ex=None):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return super().set(key, value, nx=nx, ex=ex)
+
+    flight = SingleFlight(5, client_factory=RecordingRedis)
+
+    async def call():
+        return "result"
+
+    assert asyncio.run(flight.run("k", call)) == "result"
+    assert loops == [None, None]
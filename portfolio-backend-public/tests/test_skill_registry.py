@@ -0,0 +1,35 @@
+import json
+import os
+from content_cache import ContentCache
+from skill_registry import SkillRegistry
+
+
+def write_skills(path, skills, mtime):
+    data = {"skillCategories": [{"title": "Languages", "skills": skills}]}
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_index_is_rebuilt_only_when_file_changes(tmp_path):
+    write_skills(
+        tmp_path / "skills.json",
+        [{"id": "python", "name": "Python", "level": 90}],
+        1_000_000,
+    )
+    registry = SkillRegistry(ContentCache(str(tmp_path), compress=False))
+
+    skills = registry.skills()
+    assert skills["python"] == {
+        "id": "python",
+        "name": "Python",
+        "level": 90,
+        "category": "Languages",
+    }
+    assert registry.skills() is skills
+
+    write_skills(
+        tmp_path / "skills.json",
+        [{"id": "python", "name": "Python 3", "level": 95}],
+        1_000_100,
+    )
+    assert registry.skills()["python"]["name"] == "Python 3"
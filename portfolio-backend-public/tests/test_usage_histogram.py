@@ -0,0 +1,103 @@
+import random
+from datetime import datetime, timedelta
+import usage_histogram
+
+
+def loop_usage(buckets, now):
+    """Reference: one pass per window plus one pass per hour of the trend."""
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    spans = {
+        "last_hour": timedelta(hours=1),
+        "last_day": timedelta(days=1),
+        "last_week": timedelta(weeks=1),
+        "last_month": timedelta(days=30),
+    }
+    windows = {}
+    for window, span in spans.items():
+        since = (now - span).replace(minute=0, second=0, microsecond=0)
+        usage = {"prompt": 0, "completion": 0, "total": 0, "requests": 0}
+        for bucket in buckets:
+            if bucket["hour"] >= since:
+                usage["prompt"] += bucket["prompt_tokens"]
+                usage["completion"] += bucket["completion_tokens"]
+                usage["total"] += bucket["total_tokens"]
+                usage["requests"] += bucket["requests"]
+        windows[window] = usage
+
+    trends = []
+    for i in range(24):
+        hour_start = current_hour - timedelta(hours=i)
+        usage = {"prompt": 0, "completion": 0, "total": 0, "requests": 0}
+        for bucket in buckets:
+            if bucket["hour"] == hour_start:
+                usage["prompt"] += bucket["prompt_tokens"]
+                usage["completion"] += bucket["completion_tokens"]
+                usage["total"] += bucket["total_tokens"]
+                usage["requests"] += bucket["requests"]
+        trends.append({"hour": hour_start.isoformat() + "Z", "usage": usage})
+    trends.reverse()
+    return windows, trends
+
+
+def random_buckets(now, count, seed=7):
+    rng = random.Random(seed)
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    return [
+        {
+            "model_name": rng.choice(["model-a", "model-b"]),
+            "hour": current_hour - timedelta(hours=rng.randint(0, 40 * 24)),
+            "prompt_tokens": rng.randint(0, 500),
+            "completion_tokens": rng.randint(0, 500),
+            "total_tokens": rng.randint(0, 1000),
+            "requests": rng.randint(1, 5),
+        }
+        for _ in range(count)
+    ]
+
+
+def test_histogram_matches_loops():
+    now = datetime(2025, 3, 10, 14, 37, 12)
+    buckets = random_buckets(now, 2000)
+
+    histogram = usage_histogram.build_histograms(buckets, now)[None]
+
+    windows, trends = loop_usage(buckets, now)
+    assert usage_histogram.window_totals(histogram) == windows
+    assert usage_histogram.hourly_trends(histogram, now) == trends
+
+
+def test_histograms_per_key_merge_to_total():
+    now = datetime(2025, 3, 10, 0, 0)
+    buckets = random_buckets(now, 500, seed=3)
+
+    per_model = usage_histogram.build_histograms(
+        buckets, now, key=lambda bucket: bucket["model_name"]
+    )
+    model_a = [bucket for bucket in buckets if bucket["model_name"] == "model-a"]
+
+    assert set(per_model) == {"model-a", "model-b"}
+    assert (
+        usage_histogram.window_totals(per_model["model-a"])
+        == loop_usage(model_a, now)[0]
+    )
+    assert usage_histogram.merge(per_model.values()) == (
+        usage_histogram.build_histograms(buckets, now)[None]
+    )
+
+
+def test_raw_entries_count_one_request_each():
+    now = datetime(2025, 3, 10, 12, 30)
+    entries = [
+        {"timestamp": now - timedelta(minutes=10), "total_tokens": 5},
+        {"timestamp": now - timedelta(minutes=50), "total_tokens": 7},
+        {"timestamp": now - timedelta(days=45), "total_tokens": 100},
+    ]
+
+    histogram = usage_histogram.build_histograms(entries, now, time_field="timestamp")[
+        None
+    ]
+    windows = usage_histogram.window_totals(histogram)
+
+    assert histogram[0][3] == 1 and histogram[1][3] == 1
+    assert windows["last_month"]["total"] == 12
+    assert windows["last_month"]["requests"] == 2
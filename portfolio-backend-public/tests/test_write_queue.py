@@ -0,0 +1,42 @@
+import threading
+from unittest.mock import MagicMock
+from pymongo.errors import AutoReconnect
+from write_queue import WriteQueue, background_writes_failed_total
+
+
+def failures(name):
+    return background_writes_failed_total.labels(queue=name)._value.get()
+
+
+def test_retryable_errors_are_retried_in_the_background():
+    write = MagicMock(side_effect=[AutoReconnect("primary stepped down"), None])
+    write.__name__ = "write"
+    writes = WriteQueue("retry", workers=1, backoff=0, retryable=(AutoReconnect,))
+    writes.start()
+    writes.submit(write, {"conversation_id": "c1"})
+    writes.stop()
+
+    assert write.call_count == 2
+    assert failures("retry") == 0
+
+
+def test_other_errors_fail_once_and_are_counted():
+    write = MagicMock(side_effect=ValueError("bad document"))
+    writes = WriteQueue("fail", retryable=(AutoReconnect,))
+
+    assert writes.submit(write) is True
+    assert write.call_count == 1
+    assert failures("fail") == 1
+
+
+def test_full_queue_drops_writes():
+    release = threading.Event()
+    writes = WriteQueue("full", workers=1, max_queue=1)
+    writes.start()
+    writes.submit(release.wait)  # occupies the worker
+    writes.submit(MagicMock())  # fills the queue
+    dropped = [writes.submit(MagicMock()) for _ in range(5)]
+    release.set()
+    writes.stop()
+
+    assert dropped.count(False) >= 4
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from itertools import accumulate
+
+# Single-pass hourly histogram for LLM usage. Every entry is placed once in
+# an hour slot counted back from the current clock hour (slot 0 is the
+# current hour), and the rolling windows are read from prefix sums over the
+# slots instead of re-walking the entries for each window.
+
+HOUR = timedelta(hours=1)
+FIELDS = ("prompt", "completion", "total", "requests")
+
+# A window covers every hour slot that overlaps it, e.g. "last_hour" at
+# 13:20 covers the 12:00 and 13:00 slots.
+WINDOW_SLOTS = {
+    "last_hour": 2,
+    "last_day": 24 + 1,
+    "last_week": 7 * 24 + 1,
+    "last_month": 30 * 24 + 1,
+}
+HISTORY_SLOTS = max(WINDOW_SLOTS.values())
+
+
+def current_hour(now):
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def build_histograms(entries, now, key=None, time_field="hour", slots=HISTORY_SLOTS):
+    """Bucket every entry into hour slots, grouped by key(entry).
+
+    Entries are usage buckets or raw log entries: dicts with a datetime under
+    time_field and prompt_tokens/completion_tokens/total_tokens counts, plus
+    an optional "requests" count (raw entries count as one request). Entries
+    older than the histogram are ignored; entries stamped in the future (clock
+    skew between pods) land in the current hour.
+
+    Returns {key: [[prompt, completion, total, requests], ...]} with one
+    inner list per slot.
+    """
+    # Hours since 0001-01-01 give the slot index with integer arithmetic only
+    start = now.toordinal() * 24 + now.hour
+    histograms = {}
+    for entry in entries:
+        when = entry.get(time_field)
+        if when is None:
+            continue
+        index = start - (when.toordinal() * 24 + when.hour)
+        if index < 0:
+            index = 0
+        elif index >= slots:
+            continue
+        group = key(entry) if key else None
+        histogram = histograms.get(group)
+        if histogram is None:
+            histogram = histograms[group] = empty_histogram(slots)
+        slot = histogram[index]
+        slot[0] += entry.get("prompt_tokens", 0)
+        slot[1] += entry.get("completion_tokens", 0)
+        slot[2] += entry.get("total_tokens", 0)
+        slot[3] += entry.get("requests", 1)
+    return histograms
+
+
+def empty_histogram(slots=HISTORY_SLOTS):
+    return [[0, 0, 0, 0] for _ in range(slots)]
+
+
+def merge(histograms, slots=HISTORY_SLOTS):
+    """Add several histograms slot by slot."""
+    merged = empty_histogram(slots)
+    for histogram in histograms:
+        for total, slot in zip(merged, histogram):
+            for field in range(len(FIELDS)):
+                total[field] += slot[field]
+    return merged
+
+
+def window_totals(histogram):
+    """Return {window: {"prompt", "completion", "total", "requests"}} via prefix sums."""
+    prefix = list(
+        accumulate(histogram, lambda acc, slot: [a + b for a, b in zip(acc, slot)])
+    )
+    return {
+        window: dict(zip(FIELDS, prefix[min(count, len(prefix)) - 1]))
+        for window, count in WINDOW_SLOTS.items()
+    }
+
+
+def hourly_trends(histogram, now, hours=24):
+    """Usage per clock hour for the last `hours` hours, oldest first."""
+    start = current_hour(now)
+    return [
+        {
+            "hour": (start - HOUR * index).isoformat() + "Z",
+            "usage": dict(zip(FIELDS, histogram[index])),
+        }
+        for index in reversed(range(hours))
+    ]
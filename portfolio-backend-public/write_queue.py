@@ -0,0 +1,122 @@
+import atexit
+import queue
+import threading
+import time
+from prometheus_client import Counter, Gauge
+
+background_writes_failed_total = Counter(
+    "background_writes_failed_total",
+    "Background writes that failed after all attempts",
+    ["queue"],
+)
+background_writes_retried_total = Counter(
+    "background_writes_retried_total", "Background write retries", ["queue"]
+)
+background_writes_dropped_total = Counter(
+    "background_writes_dropped_total",
+    "Background writes rejected because the queue was full",
+    ["queue"],
+)
+background_writes_pending = Gauge(
+    "background_writes_pending", "Background writes waiting in the queue", ["queue"]
+)
+
+
+class WriteQueue:
+    """Runs write calls on worker threads so request handlers don't wait on them.
+
+    submit() queues func(*args, **kwargs) on a bounded queue. With
+    max_attempts > 1, calls that raise one of the `retryable` exceptions are
+    retried with exponential backoff; only use that for idempotent writes.
+    With max_attempts=1 (the chat and summary queues) every call is made
+    once. A call that fails for good is counted in
+    background_writes_failed_total. Until start() is called, calls run inline
+    (with a single attempt).
+    """
+
+    def __init__(
+        self,
+        name,
+        workers=2,
+        max_queue=1000,
+        max_attempts=3,
+        backoff=0.5,
+        retryable=(Exception,),
+    ):
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.retryable = retryable
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a call; returns False if the queue was full and it was dropped."""
+        if not self.running:
+            self._call(func, args, kwargs, attempts=1)
+            return True
+        try:
+            self._queue.put_nowait((func, args, kwargs))
+        except queue.Full:
+            print(f"[WriteQueue:{self.name}] Queue full, dropping {call_name(func)}")
+            background_writes_dropped_total.labels(queue=self.name).inc()
+            return False
+        background_writes_pending.labels(queue=self.name).inc()
+        return True
+
+    def start(self):
+        if self.running:
+            return
+        self._threads = [
+            threading.Thread(
+                target=self._run, name=f"{self.name}-writes-{index}", daemon=True
+            )
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        atexit.register(self.stop)
+        print(f"[WriteQueue:{self.name}] Started {self.workers} workers")
+
+    def stop(self, timeout=10):
+        """Finish the queued writes, then stop the workers."""
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._threads = []
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            background_writes_pending.labels(queue=self.name).dec()
+            func, args, kwargs = item
+            self._call(func, args, kwargs, attempts=self.max_attempts)
+
+    def _call(self, func, args, kwargs, attempts):
+        name = call_name(func)
+        for attempt in range(1, attempts + 1):
+            try:
+                func(*args, **kwargs)
+                return
+            except self.retryable as e:
+                print(f"[WriteQueue:{self.name}] {name} attempt {attempt} failed: {e}")
+                if attempt < attempts:
+                    background_writes_retried_total.labels(queue=self.name).inc()
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+            except Exception as e:
+                print(f"[WriteQueue:{self.name}] {name} failed: {e}")
+                break
+        background_writes_failed_total.labels(queue=self.name).inc()
+
+
+def call_name(func):
+    return getattr(func, "__name__", repr(func))